@@ -31,6 +31,7 @@ This modules holds several improvements for the connector module from OCA.
 
 This includes:
 - Mass setting of jobs to 'Done' state
+- Requeuing of outdated jobs whose worker stopped sending heartbeats
 
 """,
     'website': 'http://www.ndp-systemes.fr',
@@ -17,11 +17,19 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from datetime import datetime as dt
+import logging
 
-from openerp import models, api, fields
+from openerp import models, api
 from openerp.tools import config
 
+_logger = logging.getLogger(__name__)
+
+# Advisory lock key used to make sure only one process requeues outdated jobs at a time
+ENQUEUE_OUTDATED_JOBS_LOCK = 6514023798
+# Number of seconds after which a worker that did not send any heartbeat is considered dead. Workers update their
+# date_alive in queue_worker regularly, the connector itself purges them after 5 minutes.
+WORKER_HEARTBEAT_TIMEOUT = 5 * 60
+
 
 class QueueJob(models.Model):
     _inherit = "queue.job"
@@ -34,12 +42,31 @@ class QueueJob(models.Model):
 
     @api.model
     def enqueue_oudated_jobs(self):
-        started_jobs = self.search([('state', '=', 'started')])
-        worker_real_limit_seconds = config.parser.get_option_group('limit_time_real') or 120
-        jobs_to_enqueue = self
-        for job in started_jobs:
-            ref_date = job.eta or job.date_started
-            time_delta_seconds = (dt.now() - fields.Datetime.from_string(ref_date)).seconds
-            if time_delta_seconds > worker_real_limit_seconds:
-                jobs_to_enqueue |= job
-        jobs_to_enqueue.requeue()
+        """Requeues the started jobs which have exceeded the worker real time limit and whose worker stopped sending
+        heartbeats. Jobs still owned by a living worker are left untouched so that they are not run twice."""
+        self.env.cr.execute("""SELECT pg_try_advisory_xact_lock(%s)""", (ENQUEUE_OUTDATED_JOBS_LOCK,))
+        if not self.env.cr.fetchone()[0]:
+            _logger.info("Outdated jobs are already being requeued by another process, skipping")
+            return []
+        worker_real_limit_seconds = config.get('limit_time_real') or 120
+        self.env.cr.execute("""UPDATE queue_job qj
+SET state = 'pending',
+  date_enqueued = NULL,
+  date_started = NULL,
+  retry = 0,
+  worker_id = NULL
+WHERE qj.id IN (
+  SELECT qj2.id
+  FROM queue_job qj2
+    LEFT JOIN queue_worker qw ON qw.id = qj2.worker_id
+  WHERE qj2.state = 'started'
+        AND COALESCE(qj2.eta, qj2.date_started) < (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 second' * %s
+        AND (qw.id IS NULL OR qw.date_alive IS NULL OR
+             qw.date_alive < (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 second' * %s)
+  FOR UPDATE OF qj2)
+RETURNING qj.id""", (worker_real_limit_seconds, WORKER_HEARTBEAT_TIMEOUT))
+        requeued_job_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_cache(['state', 'date_enqueued', 'date_started', 'retry', 'worker_id'], requeued_job_ids)
+        if requeued_job_ids:
+            _logger.info("Requeued %s outdated jobs whose worker is not alive anymore", len(requeued_job_ids))
+        return requeued_job_ids
@@ -0,0 +1,92 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (C) 2015 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from datetime import datetime as dt, timedelta
+
+from openerp import fields
+from openerp.tests import common
+
+from openerp.addons.connector_improved.connector_improved import ENQUEUE_OUTDATED_JOBS_LOCK
+
+
+class TestConnectorImproved(common.TransactionCase):
+
+    def setUp(self):
+        super(TestConnectorImproved, self).setUp()
+        self.old_date = fields.Datetime.to_string(dt.now() - timedelta(days=1))
+        self.alive_worker = self.env['queue.worker'].create({
+            'uuid': 'connector_improved_alive_worker',
+            'pid': 1,
+            'date_start': self.old_date,
+            'date_alive': fields.Datetime.now(),
+        })
+        self.dead_worker = self.env['queue.worker'].create({
+            'uuid': 'connector_improved_dead_worker',
+            'pid': 2,
+            'date_start': self.old_date,
+            'date_alive': self.old_date,
+        })
+
+    def create_started_job(self, name, worker):
+        return self.env['queue.job'].create({
+            'uuid': name,
+            'name': name,
+            'user_id': self.env.uid,
+            'state': 'started',
+            'date_created': self.old_date,
+            'date_started': self.old_date,
+            'worker_id': worker and worker.id or False,
+        })
+
+    def test_10_enqueue_outdated_jobs(self):
+        """Only outdated jobs whose worker does not send heartbeats anymore should be requeued."""
+        job_alive = self.create_started_job('connector_improved_job_alive', self.alive_worker)
+        job_dead = self.create_started_job('connector_improved_job_dead', self.dead_worker)
+        job_orphan = self.create_started_job('connector_improved_job_orphan', False)
+        job_recent = self.create_started_job('connector_improved_job_recent', self.dead_worker)
+        job_recent.date_started = fields.Datetime.now()
+
+        requeued_ids = self.env['queue.job'].enqueue_oudated_jobs()
+
+        self.assertIn(job_dead.id, requeued_ids)
+        self.assertIn(job_orphan.id, requeued_ids)
+        self.assertNotIn(job_alive.id, requeued_ids)
+        self.assertNotIn(job_recent.id, requeued_ids)
+        self.assertEqual(job_alive.state, 'started')
+        self.assertEqual(job_alive.worker_id, self.alive_worker)
+        self.assertEqual(job_recent.state, 'started')
+        for job in job_dead | job_orphan:
+            self.assertEqual(job.state, 'pending')
+            self.assertFalse(job.worker_id)
+            self.assertFalse(job.date_started)
+
+    def test_20_enqueue_outdated_jobs_concurrent(self):
+        """A process must not requeue jobs while another process holds the requeue lock."""
+        job_dead = self.create_started_job('connector_improved_job_dead', self.dead_worker)
+        other_cr = self.registry.cursor()
+        try:
+            other_cr.execute("""SELECT pg_try_advisory_xact_lock(%s)""", (ENQUEUE_OUTDATED_JOBS_LOCK,))
+            self.assertTrue(other_cr.fetchone()[0])
+            self.assertEqual(self.env['queue.job'].enqueue_oudated_jobs(), [])
+            self.assertEqual(job_dead.state, 'started')
+        finally:
+            other_cr.rollback()
+            other_cr.close()
+        self.assertIn(job_dead.id, self.env['queue.job'].enqueue_oudated_jobs())
+        self.assertEqual(job_dead.state, 'pending')
@@ -30,3 +30,16 @@ class FixStockInventoryLine(models.Model):
             return super(FixStockInventoryLine, self.sudo())._resolve_inventory_line(inventory_line)
         else:
             return super(FixStockInventoryLine, self)._resolve_inventory_line(inventory_line)
+
+
+class FixStockInventory(models.Model):
+    _inherit = 'stock.inventory'
+
+    @api.multi
+    def action_check(self):
+        # Same rule as above, for the lines which are resolved in bulk without calling _resolve_inventory_line
+        group_stock_manager = self.env.ref('stock.group_stock_manager')
+        if group_stock_manager in self.env.user.groups_id:
+            return super(FixStockInventory, self.sudo()).action_check()
+        else:
+            return super(FixStockInventory, self).action_check()
@@ -138,7 +138,6 @@ class HolidaysImport(orm.TransientModel):
         employee_obj = self.pool['hr.employee']
         al_ts_obj = self.pool['hr.analytic.timesheet']
         attendance_obj = self.pool['hr.attendance']
-        anl_account_obj = self.pool['account.analytic.account']
         timesheet_id = context['active_id']
         timesheet = timesheet_obj.browse(cr, uid, timesheet_id, context=context)
         employee_id = employee_obj.search(
@@ -160,16 +159,14 @@ class HolidaysImport(orm.TransientModel):
             raise orm.except_orm(_('Information'), _('No holidays to import.'))
         local_tz = timezone(context.get('tz'))
         errors = []
+        # Expand all the holiday days first
+        holiday_days = []
         for holiday in wizard.holidays_ids:
             if not holiday.holiday_status_id.analytic_account_id.id:
                 raise orm.except_orm(
                     _('Error !'),
                     _("Holiday Leave Type %s has no associated analytic "
                       "account !") % holiday.holiday_status_id.name)
-            analytic_account_id = \
-                holiday.holiday_status_id.analytic_account_id.id
-            anl_account = anl_account_obj.browse(cr, uid, analytic_account_id,
-                                                 context)
             if holiday.date_from < timesheet.date_from:
                 dt_ts_from = get_utc_start_of_day(timesheet.date_from, local_tz)
                 holiday.date_from = dt_ts_from.strftime(
@@ -184,78 +181,104 @@ class HolidaysImport(orm.TransientModel):
                 dt_current = (datetime.strptime(holiday.date_from,
                                                 DEFAULT_SERVER_DATETIME_FORMAT)
                               + timedelta(days=day))
-                # datetime as date at midnight
-                str_dt_current = dt_current.strftime(
-                    DEFAULT_SERVER_DATETIME_FORMAT)
-                dt_utc_current = get_utc_datetime(
-                    dt_current.replace(hour=0, minute=0, second=0), local_tz)
-                str_dt_utc_current = dt_utc_current.strftime(
-                    DEFAULT_SERVER_DATETIME_FORMAT)
                 # Test if is week day in local tz
                 day_of_the_week = dt_current.isoweekday()
                 # skip the non work days
                 if day_of_the_week in (6, 7):
                     continue
-                # Create timesheet lines
-                existing_ts_ids = al_ts_obj.search(
-                    cr, uid, [('date', '=', str_dt_current),
-                              ('name', '=', holiday.name),
-                              ('user_id', '=', uid)])
-                if not existing_ts_ids:
-                    unit_id = al_ts_obj._getEmployeeUnit(cr, uid, context)
-                    product_id = al_ts_obj._getEmployeeProduct(cr, uid, context)
-                    journal_id = al_ts_obj._getAnalyticJournal(cr, uid, context)
-                    holiday_day = {
-                        'name': holiday.name or _('Holidays'),
-                        'date': str_dt_current,
-                        'unit_amount': hours_per_day,
-                        'product_uom_id': unit_id,
-                        'product_id': product_id,
-                        'user_id': uid,
-                        'account_id': anl_account.id,
-                        'to_invoice': anl_account.to_invoice.id,
-                        'sheet_id': timesheet.id,
-                        'journal_id': journal_id,
-                    }
-                    on_change_values = al_ts_obj.on_change_unit_amount(
-                        cr, uid, False, product_id, hours_per_day,
-                        employee.company_id.id, unit=unit_id,
-                        journal_id=journal_id, context=context)
-                    if on_change_values:
-                        holiday_day.update(on_change_values['value'])
-                        al_ts_obj.create(cr, uid, holiday_day, context)
-                else:
-                    errors.append('%s: There already is an analytic line.' %
-                                  str_dt_current)
-                # Create attendances
-                existing_attendances = attendance_obj.search(
-                    cr, uid, [('name', '=', str_dt_utc_current),
-                              ('employee_id', '=', employee_id)])
-                if not existing_attendances:
-                    # get hours and minutes (tuple) from a float time
-                    hours = divmod(hours_per_day * 60, 60)
-                    date_end = dt_utc_current + \
-                        timedelta(hours=int(hours[0]), minutes=int(hours[1]))
-                    str_date_end = date_end.strftime(
-                        DEFAULT_SERVER_DATETIME_FORMAT)
-                    start = {
-                        'name': str_dt_utc_current,
-                        'action': 'sign_in',
-                        'employee_id': employee_id,
-                        'sheet_id': timesheet.id,
-                    }
-                    end = {
-                        'name': str_date_end,
-                        'action': 'sign_out',
-                        'employee_id': employee_id,
-                        'sheet_id': timesheet.id,
-                    }
-                    attendance_obj.create(cr, uid, start, context)
-                    attendance_obj.create(cr, uid, end, context)
-                else:
-                    errors.append('%s: There already is an attendance.' %
-                                  str_dt_current)
+                # datetime as date at midnight
+                dt_utc_current = get_utc_datetime(
+                    dt_current.replace(hour=0, minute=0, second=0), local_tz)
+                holiday_days.append((holiday, dt_current, dt_utc_current))
+        if not holiday_days:
+            return {'type': 'ir.actions.act_window_close'}
+        # Fetch the existing timesheet lines and attendances of the whole
+        # period at once
+        dates = [dt_current.strftime(DEFAULT_SERVER_DATE_FORMAT)
+                 for holiday, dt_current, dt_utc_current in holiday_days]
+        existing_ts_ids = al_ts_obj.search(
+            cr, uid, [('date', '>=', min(dates)),
+                      ('date', '<=', max(dates)),
+                      ('user_id', '=', uid)])
+        existing_ts = set(
+            (line['date'][:10], line['name']) for line in al_ts_obj.read(
+                cr, uid, existing_ts_ids, ['date', 'name'], context=context))
+        utc_dates = [dt_utc_current.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+                     for holiday, dt_current, dt_utc_current in holiday_days]
+        existing_attendance_ids = attendance_obj.search(
+            cr, uid, [('name', '>=', min(utc_dates)),
+                      ('name', '<=', max(utc_dates)),
+                      ('employee_id', '=', employee_id)])
+        existing_attendances = set(
+            attendance['name'] for attendance in attendance_obj.read(
+                cr, uid, existing_attendance_ids, ['name'], context=context))
+        # These values are the same for every day
+        unit_id = al_ts_obj._getEmployeeUnit(cr, uid, context)
+        product_id = al_ts_obj._getEmployeeProduct(cr, uid, context)
+        journal_id = al_ts_obj._getAnalyticJournal(cr, uid, context)
+        on_change_values = al_ts_obj.on_change_unit_amount(
+            cr, uid, False, product_id, hours_per_day,
+            employee.company_id.id, unit=unit_id,
+            journal_id=journal_id, context=context)
+        # get hours and minutes (tuple) from a float time
+        hours = divmod(hours_per_day * 60, 60)
+        timesheet_lines = []
+        attendances = []
+        for holiday, dt_current, dt_utc_current in holiday_days:
+            str_dt_current = dt_current.strftime(
+                DEFAULT_SERVER_DATETIME_FORMAT)
+            str_dt_utc_current = dt_utc_current.strftime(
+                DEFAULT_SERVER_DATETIME_FORMAT)
+            # Timesheet lines
+            key = (str_dt_current[:10], holiday.name)
+            if key not in existing_ts:
+                existing_ts.add(key)
+                anl_account = holiday.holiday_status_id.analytic_account_id
+                holiday_day = {
+                    'name': holiday.name or _('Holidays'),
+                    'date': str_dt_current,
+                    'unit_amount': hours_per_day,
+                    'product_uom_id': unit_id,
+                    'product_id': product_id,
+                    'user_id': uid,
+                    'account_id': anl_account.id,
+                    'to_invoice': anl_account.to_invoice.id,
+                    'sheet_id': timesheet.id,
+                    'journal_id': journal_id,
+                }
+                if on_change_values:
+                    holiday_day.update(on_change_values['value'])
+                    timesheet_lines.append(holiday_day)
+            else:
+                errors.append('%s: There already is an analytic line.' %
+                              str_dt_current)
+            # Attendances
+            if str_dt_utc_current not in existing_attendances:
+                existing_attendances.add(str_dt_utc_current)
+                date_end = dt_utc_current + \
+                    timedelta(hours=int(hours[0]), minutes=int(hours[1]))
+                str_date_end = date_end.strftime(
+                    DEFAULT_SERVER_DATETIME_FORMAT)
+                attendances.append({
+                    'name': str_dt_utc_current,
+                    'action': 'sign_in',
+                    'employee_id': employee_id,
+                    'sheet_id': timesheet.id,
+                })
+                attendances.append({
+                    'name': str_date_end,
+                    'action': 'sign_out',
+                    'employee_id': employee_id,
+                    'sheet_id': timesheet.id,
+                })
+            else:
+                errors.append('%s: There already is an attendance.' %
+                              str_dt_current)
         if errors:
             errors_str = "\n".join(errors)
             raise orm.except_orm(_('Errors'), errors_str)
+        for holiday_day in timesheet_lines:
+            al_ts_obj.create(cr, uid, holiday_day, context)
+        for attendance in attendances:
+            attendance_obj.create(cr, uid, attendance, context)
         return {'type': 'ir.actions.act_window_close'}
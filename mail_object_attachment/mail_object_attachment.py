@@ -19,6 +19,8 @@
 
 from openerp import fields, models, api
 
+EMAIL_BATCH_SIZE = 500
+
 
 class EmailTemplate(models.Model):
     _inherit = "email.template"
@@ -38,14 +40,39 @@ class EmailTemplate(models.Model):
         for res_id, template in res_ids_to_templates.iteritems():
             templates_to_res_ids.setdefault(template, []).append(res_id)
 
-        for template, template_res_ids in templates_to_res_ids.iteritems():
-            if template.send_object_attachments:
-                for res_id in template_res_ids:
-                    obj_attachments = self.env['ir.attachment'].search([('res_model', '=', res[res_id].get('model')),
-                                                                        ('res_id', '=', res_id)])
-                    mail_attachments = res[res_id].get('attachment_ids', [])
-                    mail_attachments.extend([(4, a.id) for a in obj_attachments])
-                    res[res_id].update({
-                        'attachment_ids': mail_attachments
-                    })
+        res_ids_to_attach = [res_id for template, template_res_ids in templates_to_res_ids.iteritems()
+                             if template.send_object_attachments for res_id in template_res_ids]
+        attachment_ids = self._get_object_attachment_ids(res_ids_to_attach, res)
+        for res_id in res_ids_to_attach:
+            mail_attachments = res[res_id].get('attachment_ids', [])
+            mail_attachments.extend([(4, attachment_id) for attachment_id in attachment_ids.get(res_id, [])])
+            res[res_id].update({
+                'attachment_ids': mail_attachments
+            })
         return res
+
+    @api.model
+    def _get_object_attachment_ids(self, res_ids, res):
+        """Fetches the attachments of the objects of the given rendered emails with one query per model.
+
+        Only the ids of the attachments are read, their data is loaded only when the mails are sent. Returns a dict
+        {res_id: [attachment_ids]}."""
+        res_ids_by_model = {}
+        for res_id in res_ids:
+            res_ids_by_model.setdefault(res[res_id].get('model'), []).append(res_id)
+        attachment_ids = {}
+        for model, model_res_ids in res_ids_by_model.iteritems():
+            attachments = self.env['ir.attachment'].search_read([('res_model', '=', model),
+                                                                 ('res_id', 'in', model_res_ids)], ['res_id'])
+            for attachment in attachments:
+                attachment_ids.setdefault(attachment['res_id'], []).append(attachment['id'])
+        return attachment_ids
+
+    @api.model
+    def generate_email_batch_iter(self, template_id, res_ids, fields=None, batch_size=EMAIL_BATCH_SIZE):
+        """Generates the emails of the given records by groups of batch_size records.
+
+        Yields dicts {res_id: values} as generate_email_batch returns, so that memory stays bounded when generating
+        the emails of a large number of records."""
+        for index in range(0, len(res_ids), batch_size):
+            yield self.generate_email_batch(template_id, res_ids[index:index + batch_size], fields=fields)
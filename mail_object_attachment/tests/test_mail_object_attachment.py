@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (C) 2017 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from openerp.tests import common
+
+
+class TestMailObjectAttachment(common.TransactionCase):
+
+    def setUp(self):
+        super(TestMailObjectAttachment, self).setUp()
+        self.template = self.env['email.template'].create({
+            'name': "Test template (mail object attachment)",
+            'model_id': self.ref('base.model_res_partner'),
+            'subject': "Test ${object.name}",
+            'body_html': "<p>Hello ${object.name}</p>",
+            'send_object_attachments': True,
+        })
+        self.partners = self.env['res.partner']
+        self.attachments = {}
+        for index in range(5):
+            partner = self.env['res.partner'].create({'name': "Test partner %s (mail object attachment)" % index})
+            self.partners |= partner
+            self.attachments[partner.id] = self.env['ir.attachment']
+            for attachment_index in range(index % 3):
+                self.attachments[partner.id] |= self.env['ir.attachment'].create({
+                    'name': "attachment_%s_%s.txt" % (index, attachment_index),
+                    'datas': "dGVzdA==",
+                    'res_model': 'res.partner',
+                    'res_id': partner.id,
+                })
+
+    def test_10_object_attachments(self):
+        """The attachments of each object are added to its email."""
+        emails = self.env['email.template'].generate_email_batch(self.template.id, self.partners.ids)
+        for partner in self.partners:
+            self.assertEqual(sorted([command[1] for command in emails[partner.id]['attachment_ids']]),
+                             sorted(self.attachments[partner.id].ids))
+
+    def test_20_generate_email_batch_iter(self):
+        """Generating the emails by groups gives the same emails as generating them all at once."""
+        emails = self.env['email.template'].generate_email_batch(self.template.id, self.partners.ids)
+        batches = list(self.env['email.template'].generate_email_batch_iter(self.template.id, self.partners.ids,
+                                                                              batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        emails_iter = {}
+        for batch in batches:
+            emails_iter.update(batch)
+        self.assertEqual(emails_iter, emails)
@@ -32,9 +32,14 @@ inside BoMs.
 
 For a given product, this view shows all BoMs in which this product appear as a component. If the product of the
 parent BoM is itself a component of another BoM, it is also displayed as a tree view.
+
+A reverse BoM index (table mrp_bom_use_case_index) allows multi-level where-used explosions with
+get_use_cases_recursive on mrp.bom. The BoM modifications are recorded and applied to the index by a cron job, the
+BoMs with pending modifications being read directly from the BoM tables.
 """,
     'website': 'http://www.ndp-systemes.fr',
     'data': [
+        'data/cron.xml',
         'mrp_bom_use_cases_view.xml'
     ],
     'demo': [],
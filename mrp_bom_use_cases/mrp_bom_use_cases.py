@@ -17,7 +17,182 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from openerp import fields, models, api
+import logging
+
+from psycopg2 import IntegrityError
+from psycopg2.extensions import TransactionRollbackError
+
+from openerp import fields, models, api, SUPERUSER_ID
+from openerp.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+# Validity filter of BoMs at a given date, used in the queries of this module. The BoM table must be aliased "mb".
+BOM_VALIDITY_FILTER = """mb.active AND
+      (mb.date_start IS NULL OR mb.date_start <= %(date)s) AND
+      (mb.date_stop IS NULL OR mb.date_stop >= %(date)s)"""
+
+# Rows of the reverse BoM index (component => parent product) computed from the BoMs, filtered by the given WHERE clause
+USE_CASE_INDEX_ROWS = """SELECT
+    mb.id           AS bom_id,
+    mbl.id          AS bom_line_id,
+    mbl.product_id  AS product_id,
+    pp.id           AS parent_product_id,
+    mb.active       AS active,
+    mb.date_start   AS date_start,
+    mb.date_stop    AS date_stop
+FROM mrp_bom mb
+    INNER JOIN mrp_bom_line mbl ON mbl.bom_id = mb.id
+    INNER JOIN product_product pp ON pp.id = mb.product_id OR
+                                     mb.product_id IS NULL AND pp.product_tmpl_id = mb.product_tmpl_id AND pp.active
+%s"""
+
+
+class MrpBom(models.Model):
+    _inherit = "mrp.bom"
+
+    def _auto_init(self, cr, context=None):
+        res = super(MrpBom, self)._auto_init(cr, context)
+        # The BoM changes are only recorded in mrp_bom_use_case_index_dirty, the index is refreshed by a cron job.
+        cr.execute("""CREATE TABLE IF NOT EXISTS mrp_bom_use_case_index_dirty (
+    bom_id INTEGER NOT NULL)""")
+        cr.execute("""SELECT 1 FROM pg_indexes WHERE indexname = %s""", ('mrp_bom_use_case_index_dirty_bom_id_idx',))
+        if not cr.fetchone():
+            cr.execute("""CREATE INDEX mrp_bom_use_case_index_dirty_bom_id_idx
+ON mrp_bom_use_case_index_dirty (bom_id)""")
+        cr.execute("""SELECT 1 FROM pg_tables WHERE tablename = 'mrp_bom_use_case_index'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE TABLE mrp_bom_use_case_index (
+    bom_id            INTEGER NOT NULL,
+    bom_line_id       INTEGER NOT NULL,
+    product_id        INTEGER NOT NULL,
+    parent_product_id INTEGER NOT NULL,
+    active            BOOLEAN,
+    date_start        DATE,
+    date_stop         DATE)""")
+            cr.execute("""CREATE INDEX mrp_bom_use_case_index_product_id_idx
+ON mrp_bom_use_case_index (product_id)""")
+            cr.execute("""CREATE INDEX mrp_bom_use_case_index_bom_id_idx ON mrp_bom_use_case_index (bom_id)""")
+            self.refresh_use_case_index(cr, SUPERUSER_ID)
+        return res
+
+    @api.model
+    def refresh_use_case_index(self, bom_ids=None):
+        """Refreshes the reverse BoM index (component => parent product) of the given BoMs, or of all BoMs if
+        bom_ids is None."""
+        delete_filter = ""
+        bom_filter = ""
+        params = ()
+        if bom_ids is not None:
+            if not bom_ids:
+                return
+            delete_filter = "WHERE bom_id IN %s"
+            bom_filter = "WHERE mb.id IN %s"
+            params = (tuple(bom_ids),)
+        self.env.cr.execute("""DELETE FROM mrp_bom_use_case_index %s""" % delete_filter, params)
+        self.env.cr.execute("""INSERT INTO mrp_bom_use_case_index
+(bom_id, bom_line_id, product_id, parent_product_id, active, date_start, date_stop)
+%s""" % (USE_CASE_INDEX_ROWS % bom_filter), params)
+
+    @api.multi
+    def mark_use_case_index_dirty(self):
+        """Records that the reverse BoM index of these BoMs must be refreshed."""
+        if not self.ids:
+            return
+        self.env.cr.execute("""INSERT INTO mrp_bom_use_case_index_dirty (bom_id)
+    SELECT unnest(%s::INTEGER[])""", (self.ids,))
+
+    @api.model
+    def apply_use_case_index_changes(self):
+        """Refreshes the reverse BoM index of the BoMs recorded in mrp_bom_use_case_index_dirty.
+
+        If another transaction is already applying changes, or if the rows to write were changed by a transaction
+        committed in the meantime, nothing is done and the changes are left to the next call.
+
+        :return: True if the changes were applied
+        """
+        self.env.cr.execute("""SELECT pg_try_advisory_xact_lock(hashtext('mrp_bom_use_case_index_dirty'))""")
+        if not self.env.cr.fetchone()[0]:
+            return False
+        try:
+            with mute_logger('openerp.sql_db'), self.env.cr.savepoint():
+                self.env.cr.execute("""DELETE FROM mrp_bom_use_case_index_dirty RETURNING bom_id""")
+                self.refresh_use_case_index(list(set([row[0] for row in self.env.cr.fetchall()])))
+        except (IntegrityError, TransactionRollbackError):
+            _logger.info(u"BoM use case index changes were not applied because of a concurrent update")
+            return False
+        return True
+
+    @api.model
+    def get_use_cases_recursive(self, product_ids, date=None):
+        """Multi-level where-used explosion based on the reverse BoM index.
+
+        The BoMs whose changes have not been applied to the index yet are read from the BoM tables directly.
+
+        Returns a list of (product_id, parent_product_id, bom_line_id, level) tuples giving, for each given product,
+        all the products in which it is used, directly or through intermediate products."""
+        if not product_ids:
+            return []
+        date = date or fields.Date.today()
+        self.env.cr.execute("""WITH RECURSIVE use_case_index AS (
+    SELECT
+        bom_id,
+        bom_line_id,
+        product_id,
+        parent_product_id,
+        active,
+        date_start,
+        date_stop
+    FROM mrp_bom_use_case_index mbuci
+    WHERE NOT exists(SELECT 1 FROM mrp_bom_use_case_index_dirty dirty WHERE dirty.bom_id = mbuci.bom_id)
+    UNION ALL
+    %s),
+
+        use_cases (product_id, parent_product_id, bom_line_id, level, path) AS (
+    SELECT
+        mb.product_id,
+        mb.parent_product_id,
+        mb.bom_line_id,
+        1,
+        ARRAY [mb.product_id, mb.parent_product_id]
+    FROM use_case_index mb
+    WHERE mb.product_id IN %%(product_ids)s AND %s
+    UNION ALL
+    SELECT
+        use_cases.product_id,
+        mb.parent_product_id,
+        mb.bom_line_id,
+        use_cases.level + 1,
+        use_cases.path || mb.parent_product_id
+    FROM use_cases
+        INNER JOIN use_case_index mb ON mb.product_id = use_cases.parent_product_id
+    WHERE %s AND NOT mb.parent_product_id = ANY (use_cases.path))
+
+SELECT product_id, parent_product_id, bom_line_id, level
+FROM use_cases
+ORDER BY product_id, level, parent_product_id""" % (
+            USE_CASE_INDEX_ROWS % "WHERE mb.id IN (SELECT bom_id FROM mrp_bom_use_case_index_dirty)",
+            BOM_VALIDITY_FILTER, BOM_VALIDITY_FILTER), {'product_ids': tuple(product_ids), 'date': date})
+        return self.env.cr.fetchall()
+
+    @api.model
+    def create(self, vals):
+        result = super(MrpBom, self).create(vals)
+        result.mark_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def write(self, vals):
+        result = super(MrpBom, self).write(vals)
+        if any(field in vals for field in ['product_id', 'product_tmpl_id', 'bom_line_ids', 'active', 'date_start',
+                                           'date_stop']):
+            self.mark_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.mark_use_case_index_dirty()
+        return super(MrpBom, self).unlink()
 
 
 class MrpBomLine(models.Model):
@@ -31,24 +206,51 @@ class MrpBomLine(models.Model):
     @api.multi
     @api.depends('bom_id.product_id', 'bom_id.product_tmpl_id', 'bom_id')
     def _compute_parents(self):
-        """Computes the fields necessary to get use cases."""
-        for rec in self:
-            parent_product = rec.bom_id.product_id
-            parent_product_tmpl = rec.bom_id.product_tmpl_id
-            rec.product_parent_id = parent_product
-
-            if parent_product:
-                products = parent_product
-            else:
-                products = self.env['product.product'].search([('product_tmpl_id', '=', parent_product_tmpl.id)])
+        """Computes the fields necessary to get use cases.
+
+        The parent lines of all the lines are fetched with a single query, the parent lines of a line being the lines
+        of valid BoMs whose component is the product (or one of the variants of the template) of the BoM of the line."""
+        father_line_ids = {rec.id: [] for rec in self}
+        if self.ids:
             date_report = self.env.context.get('date_report_use_cases') or fields.Date.today()
-            parent_lines = self.search(
-                [('product_id', 'in', products.ids),
-                 '|', ('bom_id.date_start', '<=', date_report), ('bom_id.date_start', '=', False),
-                 '|', ('bom_id.date_stop', '>=', date_report), ('bom_id.date_start', '=', False)]
-            )
+            self.env.cr.execute("""SELECT
+    child.id,
+    parent_line.id
+FROM mrp_bom_line child
+    INNER JOIN mrp_bom child_bom ON child_bom.id = child.bom_id
+    INNER JOIN product_product pp ON pp.id = child_bom.product_id OR
+                                     child_bom.product_id IS NULL AND pp.product_tmpl_id = child_bom.product_tmpl_id AND
+                                     pp.active
+    INNER JOIN mrp_bom_line parent_line ON parent_line.product_id = pp.id
+    INNER JOIN mrp_bom mb ON mb.id = parent_line.bom_id
+WHERE child.id IN %%(ids)s AND %s
+ORDER BY parent_line.sequence, parent_line.id""" % BOM_VALIDITY_FILTER,
+                                {'ids': tuple(self.ids), 'date': date_report})
+            for child_id, parent_line_id in self.env.cr.fetchall():
+                father_line_ids[child_id].append(parent_line_id)
+        for rec in self:
+            rec.product_parent_id = rec.bom_id.product_id
+            rec.father_line_ids = [(6, 0, father_line_ids.get(rec.id, []))]
 
-            rec.father_line_ids = [(6, 0, [p.id for p in parent_lines])]
+    @api.model
+    def create(self, vals):
+        result = super(MrpBomLine, self).create(vals)
+        result.mapped('bom_id').mark_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def write(self, vals):
+        if 'product_id' in vals or 'bom_id' in vals:
+            self.mapped('bom_id').mark_use_case_index_dirty()
+        result = super(MrpBomLine, self).write(vals)
+        if 'product_id' in vals or 'bom_id' in vals:
+            self.mapped('bom_id').mark_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.mapped('bom_id').mark_use_case_index_dirty()
+        return super(MrpBomLine, self).unlink()
 
 
 class ProductProduct(models.Model):
@@ -58,9 +260,44 @@ class ProductProduct(models.Model):
 
     @api.multi
     def _compute_use_case_count(self):
+        counts = {}
+        if self.ids:
+            self.env.cr.execute("""SELECT
+    mbl.product_id,
+    count(*)
+FROM mrp_bom_line mbl
+    INNER JOIN mrp_bom mb ON mb.id = mbl.bom_id
+WHERE mbl.product_id IN %%(ids)s AND %s
+GROUP BY mbl.product_id""" % BOM_VALIDITY_FILTER, {'ids': tuple(self.ids), 'date': fields.Date.today()})
+            counts = dict(self.env.cr.fetchall())
         for rec in self:
-            rec.use_case_count = len(self.env['mrp.bom.line'].search(
-                [('product_id', '=', rec.id),
-                 '|', ('bom_id.date_start', '<=', fields.Date.today()), ('bom_id.date_start', '=', False),
-                 '|', ('bom_id.date_stop', '>=', fields.Date.today()), ('bom_id.date_start', '=', False)])
-            )
+            rec.use_case_count = counts.get(rec.id, 0)
+
+    @api.multi
+    def mark_boms_use_case_index_dirty(self):
+        """Records that the reverse BoM index of the BoMs of these variants, of the BoMs of their templates and of the
+        BoMs using them as components must be refreshed."""
+        boms = self.env['mrp.bom'].with_context(active_test=False).search(
+            ['|', '|', ('product_id', 'in', self.ids), ('bom_line_ids.product_id', 'in', self.ids),
+             '&', ('product_id', '=', False), ('product_tmpl_id', 'in', self.mapped('product_tmpl_id').ids)])
+        boms.mark_use_case_index_dirty()
+
+    @api.model
+    def create(self, vals):
+        result = super(ProductProduct, self).create(vals)
+        result.mark_boms_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def write(self, vals):
+        if 'product_tmpl_id' in vals:
+            self.mark_boms_use_case_index_dirty()
+        result = super(ProductProduct, self).write(vals)
+        if 'active' in vals or 'product_tmpl_id' in vals:
+            self.mark_boms_use_case_index_dirty()
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.mark_boms_use_case_index_dirty()
+        return super(ProductProduct, self).unlink()
@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (C) 2017 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from openerp.tests import common
+
+
+class TestMrpBomUseCases(common.TransactionCase):
+
+    def setUp(self):
+        super(TestMrpBomUseCases, self).setUp()
+        self.component = self.create_product("Component (use cases)")
+        self.intermediate = self.create_product("Intermediate product (use cases)")
+        self.variant_1 = self.create_product("Variant product (use cases)")
+        self.template = self.variant_1.product_tmpl_id
+        self.variant_2 = self.env['product.product'].create({'product_tmpl_id': self.template.id})
+        self.final = self.create_product("Final product (use cases)")
+        self.bom_intermediate = self.create_bom(self.intermediate.product_tmpl_id, self.intermediate, self.component)
+        self.bom_template = self.create_bom(self.template, self.env['product.product'], self.intermediate)
+        self.bom_final = self.create_bom(self.final.product_tmpl_id, self.final, self.variant_2)
+        self.line_component = self.bom_intermediate.bom_line_ids
+        self.line_intermediate = self.bom_template.bom_line_ids
+        self.line_variant_2 = self.bom_final.bom_line_ids
+
+    def create_product(self, name):
+        return self.env['product.product'].create({'name': name, 'type': 'product'})
+
+    def create_bom(self, template, product, component):
+        return self.env['mrp.bom'].create({
+            'product_tmpl_id': template.id,
+            'product_id': product.id,
+            'product_qty': 1,
+            'bom_line_ids': [(0, 0, {'product_id': component.id, 'product_qty': 1})],
+        })
+
+    def get_use_cases_hop_by_hop(self, product):
+        """Computes the use cases of the product by following the father lines of the BoM lines, level by level."""
+        self.env.invalidate_all()
+        result = set()
+        lines = self.env['mrp.bom.line'].search([('product_id', '=', product.id)]). \
+            filtered(lambda line: line.bom_id.active)
+        level = 1
+        while lines:
+            for line in lines:
+                parent_products = line.bom_id.product_id or \
+                    line.bom_id.product_tmpl_id.product_variant_ids.filtered(lambda variant: variant.active)
+                for parent_product in parent_products:
+                    result.add((product.id, parent_product.id, line.id, level))
+            lines = lines.mapped('father_line_ids')
+            level += 1
+        return result
+
+    def get_dirty_bom_ids(self):
+        self.env.cr.execute("""SELECT DISTINCT bom_id FROM mrp_bom_use_case_index_dirty""")
+        return set([row[0] for row in self.env.cr.fetchall()])
+
+    def assert_use_cases(self, expected):
+        self.env.invalidate_all()
+        use_cases = self.env['mrp.bom'].get_use_cases_recursive([self.component.id])
+        self.assertEqual(set(use_cases), expected)
+        self.assertEqual(len(use_cases), len(expected))
+        self.assertEqual(self.get_use_cases_hop_by_hop(self.component), expected)
+
+    def test_10_use_cases_recursive(self):
+        """get_use_cases_recursive matches the father lines, before and after the index is refreshed."""
+        self.assertTrue({self.bom_intermediate.id, self.bom_template.id, self.bom_final.id} <=
+                        self.get_dirty_bom_ids())
+        expected = {
+            (self.component.id, self.intermediate.id, self.line_component.id, 1),
+            (self.component.id, self.variant_1.id, self.line_intermediate.id, 2),
+            (self.component.id, self.variant_2.id, self.line_intermediate.id, 2),
+            (self.component.id, self.final.id, self.line_variant_2.id, 3),
+        }
+        self.assert_use_cases(expected)
+        self.assertTrue(self.env['mrp.bom'].apply_use_case_index_changes())
+        self.assertFalse(self.get_dirty_bom_ids())
+        self.assert_use_cases(expected)
+        self.bom_final.active = False
+        self.assertEqual(self.get_dirty_bom_ids(), {self.bom_final.id})
+        expected.remove((self.component.id, self.final.id, self.line_variant_2.id, 3))
+        self.assert_use_cases(expected)
+        self.assertTrue(self.env['mrp.bom'].apply_use_case_index_changes())
+        self.assert_use_cases(expected)
+
+    def test_20_variant_active(self):
+        """Archiving a variant removes it from the use cases of the BoMs of its template, and its own use cases."""
+        self.assertTrue(self.env['mrp.bom'].apply_use_case_index_changes())
+        self.variant_2.active = False
+        self.assertIn(self.bom_template.id, self.get_dirty_bom_ids())
+        expected = {
+            (self.component.id, self.intermediate.id, self.line_component.id, 1),
+            (self.component.id, self.variant_1.id, self.line_intermediate.id, 2),
+        }
+        self.assert_use_cases(expected)
+        self.assertTrue(self.env['mrp.bom'].apply_use_case_index_changes())
+        self.assert_use_cases(expected)
+        self.variant_2.active = True
+        expected |= {
+            (self.component.id, self.variant_2.id, self.line_intermediate.id, 2),
+            (self.component.id, self.final.id, self.line_variant_2.id, 3),
+        }
+        self.assert_use_cases(expected)
+        self.assertTrue(self.env['mrp.bom'].apply_use_case_index_changes())
+        self.assert_use_cases(expected)
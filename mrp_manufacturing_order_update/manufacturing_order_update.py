@@ -36,60 +36,95 @@ class MoUpdateMrpProduction(models.Model):
     product_lines = fields.One2many(readonly=False)
     bom_id = fields.Many2one('mrp.bom', readonly=False)
 
+    @api.multi
+    def _get_raw_moves_and_needs(self):
+        """Loads in two queries the raw material moves to consume and the scheduled products of the productions.
+
+        Returns a tuple of two dicts indexed by production id: the first one gives the list of (move_id, product_id,
+        product_qty) of the moves, ordered by decreasing quantity, the second one gives the list of (product_id,
+        product_qty) of the scheduled product lines."""
+        raw_moves = {mrp.id: [] for mrp in self}
+        needs = {mrp.id: [] for mrp in self}
+        if not self:
+            return raw_moves, needs
+        self.env.cr.execute("""SELECT id, raw_material_production_id, product_id, product_qty
+FROM stock_move
+WHERE raw_material_production_id IN %s AND state NOT IN ('done', 'cancel')
+ORDER BY product_qty DESC, id ASC""", (tuple(self.ids),))
+        for move_id, mrp_id, product_id, product_qty in self.env.cr.fetchall():
+            raw_moves[mrp_id] += [(move_id, product_id, product_qty)]
+        self.env.cr.execute("""SELECT production_id, product_id, product_qty
+FROM mrp_production_product_line
+WHERE production_id IN %s
+ORDER BY id ASC""", (tuple(self.ids),))
+        for mrp_id, product_id, product_qty in self.env.cr.fetchall():
+            needs[mrp_id] += [(product_id, product_qty)]
+        return raw_moves, needs
+
     @api.multi
     def update_moves(self):
+        """Updates the raw material moves of the productions so that they match their scheduled products.
+
+        The moves and the needs of all the productions are loaded at once and compared in memory. The moves to cancel
+        are then cancelled with a single call and the new moves are confirmed together."""
+        raw_moves, needs = self._get_raw_moves_and_needs()
+        product_ids = set()
+        for mrp in self:
+            product_ids |= set([move[1] for move in raw_moves[mrp.id]])
+            product_ids |= set([need[0] for need in needs[mrp.id]])
+        products = {product.id: product for product in self.env['product.product'].browse(list(product_ids))}
+        moves_to_cancel_ids = []
+        moves_to_create = []
+        posts = {}
         for mrp in self:
             post = ''
-            changes_to_do = []
-            list_products_to_change = []
-            needed_new_moves = []
-            useless_moves = mrp.move_lines.filtered(lambda m: m.product_id not in
-                                                              [x.product_id for x in mrp.product_lines])
-            for product in list(set([x.product_id for x in useless_moves])):
-                post += _("Product %s: not needed anymore<br>") % (product.display_name)
-            useless_moves.with_context({'cancel_procurement': True}).action_cancel()
-            for item in mrp.move_lines:
-                if not item.product_id in list_products_to_change:
-                    total_old_need = sum([x.product_qty for x in mrp.move_lines if x.product_id == item.product_id])
-                    total_new_need = sum([x.product_qty for x in mrp.product_lines if x.product_id == item.product_id])
-                    prec = item.product_id.uom_id.rounding
-                    if float_compare(total_new_need, total_old_need, precision_rounding=prec) != 0 and \
-                                    float_compare(total_new_need, 0, precision_rounding=prec) != 0:
-                        changes_to_do += [(item.product_id, total_new_need - total_old_need, total_new_need,
-                                           total_old_need)]
-                        list_products_to_change += [item.product_id]
-            for product, qty, total_new_need, total_old_need in changes_to_do:
-                if float_compare(qty, 0, precision_rounding=prec) > 0:
-                    move = mrp._make_consume_line_from_data(mrp, product, product.uom_id.id, qty, False, 0)
-                    self.env['stock.move'].browse(move).action_confirm()
+            mrp_needs = needs[mrp.id]
+            needed_product_ids = set([need[0] for need in mrp_needs])
+            useless_moves = [move for move in raw_moves[mrp.id] if move[1] not in needed_product_ids]
+            for product_id in sorted(set([move[1] for move in useless_moves])):
+                post += _("Product %s: not needed anymore<br>") % (products[product_id].display_name)
+            moves_to_cancel_ids += [move[0] for move in useless_moves]
+            mrp_moves = [move for move in raw_moves[mrp.id] if move[1] in needed_product_ids]
+            moved_product_ids = []
+            for move in mrp_moves:
+                if move[1] not in moved_product_ids:
+                    moved_product_ids += [move[1]]
+            for product_id in moved_product_ids:
+                product = products[product_id]
+                prec = product.uom_id.rounding
+                product_moves = [move for move in mrp_moves if move[1] == product_id]
+                total_old_need = sum([move[2] for move in product_moves])
+                total_new_need = sum([qty for need_product_id, qty in mrp_needs if need_product_id == product_id])
+                if float_compare(total_new_need, total_old_need, precision_rounding=prec) == 0 or \
+                        float_compare(total_new_need, 0, precision_rounding=prec) == 0:
+                    continue
+                if float_compare(total_new_need, total_old_need, precision_rounding=prec) > 0:
+                    moves_to_create += [(mrp, product, total_new_need - total_old_need)]
                 else:
-                    moves = self.env['stock.move'].search([('raw_material_production_id', '=', mrp.id),
-                                                           ('state', 'not in', ['done', 'cancel']),
-                                                           ('product_id', '=', product.id)],
-                                                          order='product_qty desc')
-                    qty_ordered = sum([x.product_qty for x in moves])
-                    while float_compare(qty_ordered, total_new_need, precision_rounding=product.uom_id.rounding) > 0:
-                        moves[0].with_context({'cancel_procurement': True}).action_cancel()
-                        qty_ordered -= moves[0].product_qty
-                        moves -= moves[0]
-                    if float_compare(qty_ordered, total_new_need, precision_rounding=product.uom_id.rounding) < 0:
-                        move = self._make_consume_line_from_data(mrp, product, product.uom_id.id,
-                                                                 total_new_need - qty_ordered, False, 0)
-                        self.env['stock.move'].browse(move).action_confirm()
+                    qty_ordered = total_old_need
+                    while float_compare(qty_ordered, total_new_need, precision_rounding=prec) > 0:
+                        move_id, move_product_id, move_qty = product_moves.pop(0)
+                        moves_to_cancel_ids += [move_id]
+                        qty_ordered -= move_qty
+                    if float_compare(qty_ordered, total_new_need, precision_rounding=prec) < 0:
+                        moves_to_create += [(mrp, product, total_new_need - qty_ordered)]
                 post += _("Product %s: quantity changed from %s to %s<br>") % \
-                        (product.display_name, total_old_need, total_new_need)
-
-            for item in mrp.product_lines:
-                if item.product_id not in [y.product_id for y in mrp.move_lines if y.state != 'cancel']:
-                    needed_new_moves += [item]
+                    (product.display_name, total_old_need, total_new_need)
+            for product_id, qty in mrp_needs:
+                if product_id not in moved_product_ids:
+                    moves_to_create += [(mrp, products[product_id], qty)]
                     post += _("Raw material move created of quantity %s for product %s<br>") % \
-                            (item.product_qty, item.product_id.display_name)
-
-            for item in needed_new_moves:
-                product = item.product_id
-                move = mrp._make_consume_line_from_data(mrp, product, product.uom_id.id, item.product_qty, False, 0)
-                self.env['stock.move'].browse(move).action_confirm()
-            mrp.message_post(post)
+                        (qty, products[product_id].display_name)
+            posts[mrp.id] = post
+        if moves_to_cancel_ids:
+            self.env['stock.move'].browse(moves_to_cancel_ids).with_context(cancel_procurement=True).action_cancel()
+        new_move_ids = []
+        for mrp, product, qty in moves_to_create:
+            new_move_ids += [mrp._make_consume_line_from_data(mrp, product, product.uom_id.id, qty, False, 0)]
+        if new_move_ids:
+            self.env['stock.move'].browse(new_move_ids).action_confirm()
+        for mrp in self:
+            mrp.message_post(posts[mrp.id])
 
     @api.multi
     def write(self, vals):
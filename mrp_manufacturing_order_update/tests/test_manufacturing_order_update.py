@@ -287,3 +287,25 @@ class TestOrderUpdate(common.TransactionCase):
         self.assertIn([self.product1, 20, 'cancel'], moves_data2)
         self.assertIn([self.product2, 25, 'cancel'], moves_data2)
         self.assertIn([self.product3, 30, 'cancel'], moves_data2)
+
+    def test_40_update_several_orders(self):
+        """Updating several orders at once should give the same moves as updating them one by one."""
+        self.line1.product_qty = 12
+        self.line2.product_qty = 3
+        self.line3.unlink()
+        self.env['mrp.bom.line'].create({'product_id': self.product3.id, 'product_qty': 8,
+                                         'product_uom': self.unit.id, 'bom_id': self.bom1.id})
+        self.mrp_production1.button_update()
+        # mrp_production1 is already up to date, it should not be modified
+        (self.mrp_production2 | self.mrp_production1).button_update()
+
+        def get_moves_data(mrp_production):
+            return sorted([(move.product_id.id, move.product_uom_qty, move.state) for
+                           move in mrp_production.move_lines | mrp_production.move_lines2])
+
+        self.assertEqual(get_moves_data(self.mrp_production1), get_moves_data(self.mrp_production2))
+        self.assertIn((self.product1.id, 7, 'confirmed'), get_moves_data(self.mrp_production1))
+        self.assertIn((self.product2.id, 18, 'confirmed'), get_moves_data(self.mrp_production1))
+        self.assertIn((self.product2.id, 25, 'cancel'), get_moves_data(self.mrp_production1))
+        self.assertIn((self.product3.id, 23, 'confirmed'), get_moves_data(self.mrp_production1))
+        self.assertIn((self.product3.id, 30, 'cancel'), get_moves_data(self.mrp_production1))
@@ -19,6 +19,9 @@
 
 from openerp import models, fields, api
 
+# Maximum number of hops followed when resolving the final order of a manufacturing order, to protect against cycles
+FINAL_ORDER_MAX_DEPTH = 1000
+
 
 class ManufacturingOrderPlanningImproved(models.Model):
     _inherit = 'mrp.production'
@@ -34,6 +37,9 @@ class ManufacturingOrderPlanningImproved(models.Model):
     final_order_id = fields.Many2one('mrp.production', string="Top parent order",
                                      help="Final parent order in the chain of raw materials and produced products",
                                      compute='_compute_final_order_id')
+    final_order_cache_id = fields.Many2one('mrp.production', string="Top parent order (cache)", readonly=True,
+                                           copy=False, help="Cached value of the top parent order, reset each time "
+                                                            "a chain of moves is modified")
 
     @api.model
     def update_procurement_id(self):
@@ -45,30 +51,118 @@ class ManufacturingOrderPlanningImproved(models.Model):
         LEFT JOIN procurement_order po ON po.production_id = mrp.id
     GROUP BY mrp.id)
 
-SELECT
-    mrp.id,
-    procs.procurement_id AS new_procurement_id
-FROM mrp_production mrp
-    LEFT JOIN mrp_procurements procs ON procs.mrp_id = mrp.id
-WHERE COALESCE(mrp.procurement_id, 0) != COALESCE(procs.procurement_id, 0)""")
-        result = self.env.cr.fetchall()
-        for line in result:
-            order = self.browse(line[0])
-            order.write({'procurement_id': line[1] or False})
+UPDATE mrp_production mrp
+SET procurement_id = procs.procurement_id
+FROM mrp_procurements procs
+WHERE procs.mrp_id = mrp.id AND
+      COALESCE(mrp.procurement_id, 0) != COALESCE(procs.procurement_id, 0)
+RETURNING mrp.id""")
+        self.invalidate_cache(['procurement_id'], [row[0] for row in self.env.cr.fetchall()])
+
+    @api.multi
+    def _get_final_order_ids(self):
+        """Resolves the final order of the given manufacturing orders with a single recursive query.
+
+        The chain of each order is followed from the first produced move through move_dest_id. As in
+        move_created_ids, the produced moves which are done or cancelled are ignored. When the last move of
+        the chain is a raw material of another order, the chain continues from the produced move of this order.
+        Returns a dict {order_id: final_order_id}."""
+        if not self:
+            return {}
+        self.env.cr.execute("""WITH RECURSIVE chain AS (
+    SELECT
+        mrp.id     AS origin_id,
+        mrp.id     AS production_id,
+        first_move.id AS move_id,
+        0          AS depth
+    FROM mrp_production mrp
+        LEFT JOIN LATERAL (SELECT sm.id
+                           FROM stock_move sm
+                           WHERE sm.production_id = mrp.id AND sm.state NOT IN ('done', 'cancel')
+                           ORDER BY sm.date_expected DESC, sm.id ASC
+                           LIMIT 1) first_move ON TRUE
+    WHERE mrp.id IN %s
+    UNION ALL
+    SELECT
+        chain.origin_id,
+        CASE WHEN dest.move_dest_id IS NULL AND dest.raw_material_production_id IS NOT NULL
+            THEN dest.raw_material_production_id
+        ELSE chain.production_id END,
+        CASE WHEN dest.move_dest_id IS NULL AND dest.raw_material_production_id IS NOT NULL
+            THEN first_move.id
+        ELSE dest.id END,
+        chain.depth + 1
+    FROM chain
+        INNER JOIN stock_move sm ON sm.id = chain.move_id
+        INNER JOIN stock_move dest ON dest.id = sm.move_dest_id
+        LEFT JOIN LATERAL (SELECT sm2.id
+                           FROM stock_move sm2
+                           WHERE sm2.production_id = dest.raw_material_production_id AND
+                                 sm2.state NOT IN ('done', 'cancel')
+                           ORDER BY sm2.date_expected DESC, sm2.id ASC
+                           LIMIT 1) first_move ON TRUE
+    WHERE chain.depth < %s)
+
+SELECT DISTINCT ON (origin_id)
+    origin_id,
+    production_id
+FROM chain
+ORDER BY origin_id, depth DESC""", (tuple(self.ids), FINAL_ORDER_MAX_DEPTH))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_orders_chained_to_moves(self, moves):
+        """Returns the orders whose chain of moves, as followed by _get_final_order_ids, may contain the given
+        moves."""
+        if not moves:
+            return self
+        # UNION discards the moves already found, which stops the recursion on cycles
+        self.env.cr.execute("""WITH RECURSIVE upstream AS (
+    SELECT sm.id AS move_id
+    FROM stock_move sm
+    WHERE sm.id IN %s
+    UNION
+    SELECT prev.id
+    FROM upstream
+        INNER JOIN stock_move cur ON cur.id = upstream.move_id
+        INNER JOIN stock_move prev ON prev.move_dest_id = cur.id OR
+                                      (cur.production_id IS NOT NULL AND prev.move_dest_id IS NULL AND
+                                       prev.raw_material_production_id = cur.production_id))
+
+SELECT DISTINCT sm.production_id
+FROM upstream
+    INNER JOIN stock_move sm ON sm.id = upstream.move_id
+WHERE sm.production_id IS NOT NULL""", (tuple(moves.ids),))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.multi
+    def invalidate_final_order_cache(self):
+        """Resets the cached final orders of the given orders."""
+        if not self:
+            return
+        self.env.cr.execute("""UPDATE mrp_production SET final_order_cache_id = NULL
+WHERE id IN %s AND final_order_cache_id IS NOT NULL
+RETURNING id""", (tuple(self.ids),))
+        self.invalidate_cache(['final_order_cache_id'], [row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def fill_final_order_cache(self):
+        """Resolves and caches the final order of the running orders which have none cached."""
+        orders = self.search([('final_order_cache_id', '=', False), ('state', 'not in', ['done', 'cancel'])])
+        final_order_ids = orders._get_final_order_ids()
+        if final_order_ids:
+            values = ", ".join([self.env.cr.mogrify("(%s, %s)", item) for item in final_order_ids.items()])
+            self.env.cr.execute("""UPDATE mrp_production mrp
+SET final_order_cache_id = v.final_order_id
+FROM (VALUES %s) AS v (id, final_order_id)
+WHERE mrp.id = v.id""" % values)
+            orders.invalidate_cache(['final_order_cache_id'], orders.ids)
 
     @api.multi
     def _compute_final_order_id(self):
+        final_order_ids = self.filtered(lambda order: not order.final_order_cache_id)._get_final_order_ids()
         for rec in self:
-            production = rec
-            move = rec.move_created_ids and rec.move_created_ids[0] or False
-            if move:
-                while move.move_dest_id:
-                    move = move.move_dest_id
-                    if not move.move_dest_id and move.raw_material_production_id:
-                        production = move.raw_material_production_id
-                        move = move.raw_material_production_id.move_created_ids and \
-                               move.raw_material_production_id.move_created_ids[0] or False
-            rec.final_order_id = production
+            rec.final_order_id = rec.final_order_cache_id or self.browse(final_order_ids.get(rec.id))
 
     @api.model
     def _make_production_produce_line(self, production):
@@ -115,6 +209,40 @@ WHERE COALESCE(mrp.procurement_id, 0) != COALESCE(procs.procurement_id, 0)""")
             rec.move_lines.write(values)
 
 
+class StockMovePlanningImproved(models.Model):
+    _inherit = 'stock.move'
+
+    @api.model
+    def create(self, vals):
+        move = super(StockMovePlanningImproved, self).create(vals)
+        if vals.get('production_id') or vals.get('raw_material_production_id') or vals.get('move_dest_id'):
+            self.env['mrp.production']._get_orders_chained_to_moves(move).invalidate_final_order_cache()
+        return move
+
+    @api.multi
+    def write(self, vals):
+        chain_fields = ['move_dest_id', 'production_id', 'raw_material_production_id']
+        orders = self.env['mrp.production']
+        moves = self.env['stock.move']
+        if any([field in vals for field in chain_fields]):
+            moves = self
+        elif 'date_expected' in vals or 'state' in vals:
+            # Only the produced moves of the orders have an impact on the chains
+            moves = self.filtered(lambda move: move.production_id)
+        if moves:
+            orders = self.env['mrp.production']._get_orders_chained_to_moves(moves)
+        result = super(StockMovePlanningImproved, self).write(vals)
+        if moves:
+            orders |= self.env['mrp.production']._get_orders_chained_to_moves(moves)
+            orders.invalidate_final_order_cache()
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.env['mrp.production']._get_orders_chained_to_moves(self).invalidate_final_order_cache()
+        return super(StockMovePlanningImproved, self).unlink()
+
+
 class ProcurementOrderPlanningImproved(models.Model):
     _inherit = 'procurement.order'
 
@@ -191,3 +191,80 @@ class TestMrpPlanningImproved(common.TransactionCase):
         self.assertEqual(m2.date[:10], '2015-09-10')
         self.assertEqual(move_created.date, initial_date_output)
         self.assertEqual(move_created.date_expected[:10], '2015-09-10')
+
+    def test_30_mrp_planning_improved(self):
+
+        """
+        Testing the resolution of the top parent order
+        """
+
+        procurement_order_1 = self.create_procurement_order_1()
+        procurement_order_1.run()
+        order = procurement_order_1.production_id
+        self.assertTrue(order)
+        self.assertEqual(order.final_order_id, order)
+        self.assertFalse(order.final_order_cache_id)
+
+        # Let's chain the produced move to a raw material move of another order
+        other_procurement = self.create_procurement_order_1()
+        other_procurement.run()
+        other_order = other_procurement.production_id
+        self.assertTrue(other_order.move_lines)
+        self.env['mrp.production'].fill_final_order_cache()
+        self.assertEqual(order.final_order_cache_id, order)
+        self.assertEqual(other_order.final_order_cache_id, other_order)
+        order.move_created_ids.write({'move_dest_id': other_order.move_lines[0].id})
+        # Only the orders whose chain contains the modified moves are invalidated
+        self.assertFalse(order.final_order_cache_id)
+        self.assertEqual(other_order.final_order_cache_id, other_order)
+        order.invalidate_cache()
+        self.assertEqual(order.final_order_id, other_order)
+        self.assertEqual((order | other_order)._get_final_order_ids(), {order.id: other_order.id,
+                                                                        other_order.id: other_order.id})
+
+    def get_final_order_hop_by_hop(self, order):
+        """Resolution of the top parent order as it was done before _get_final_order_ids."""
+        production = order
+        move = order.move_created_ids and order.move_created_ids[0] or False
+        if move:
+            while move.move_dest_id:
+                move = move.move_dest_id
+                if not move.move_dest_id and move.raw_material_production_id:
+                    production = move.raw_material_production_id
+                    move = move.raw_material_production_id.move_created_ids and \
+                        move.raw_material_production_id.move_created_ids[0] or False
+        return production
+
+    def test_40_final_order_parity(self):
+
+        """
+        Testing that the top parent orders are the same as with the hop by hop resolution, with cancelled produced moves
+        """
+
+        orders = self.env['mrp.production']
+        for _index in range(3):
+            procurement = self.create_procurement_order_1()
+            procurement.run()
+            orders |= procurement.production_id
+        order_1, order_2, order_3 = orders
+        order_1.move_created_ids.write({'move_dest_id': order_2.move_lines[0].id})
+        order_2.move_created_ids.write({'move_dest_id': order_3.move_lines[0].id})
+
+        # A cancelled produced move, which would be the first produced move of the order if it was not filtered out
+        produced_move = order_2.move_created_ids[0]
+        cancelled_move = produced_move.copy({
+            'production_id': order_2.id,
+            'move_dest_id': False,
+            'date_expected': '2099-01-01 00:00:00',
+        })
+        cancelled_move.action_cancel()
+        self.assertEqual(cancelled_move.state, 'cancel')
+        self.assertNotIn(cancelled_move, order_2.move_created_ids)
+
+        orders.invalidate_cache()
+        expected = {order.id: self.get_final_order_hop_by_hop(order).id for order in orders}
+        self.assertEqual(expected[order_1.id], order_3.id)
+        self.assertEqual(orders._get_final_order_ids(), expected)
+        self.env['mrp.production'].fill_final_order_cache()
+        orders.invalidate_cache()
+        self.assertEqual({order.id: order.final_order_id.id for order in orders}, expected)
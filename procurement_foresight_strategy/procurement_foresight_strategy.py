@@ -36,10 +36,15 @@ class StockWarehouse(models.Model):
         "a procurement to bring the forecasted quantity to the Quantity specified as Max Quantity.")
     product_max_qty = fields.Float(compute='_compute_product_max_qty', inverse="_set_max_quantity")
 
-    @api.one
+    @api.multi
     @api.depends('product_max_qty_operator', 'fill_strategy', 'fill_duration')
     def _compute_product_max_qty(self):
-        self.product_max_qty = self.get_max_qty(datetime.now())
+        """The reference date is given by the 'orderpoint_max_qty_date' key of the context, if any, so that the
+        maximum quantities computed during a scheduler run share the same memo entries."""
+        date = self.env.context.get('orderpoint_max_qty_date')
+        max_qties = self.get_max_qty_multi(date and fields.Datetime.from_string(date) or datetime.now())
+        for rec in self:
+            rec.product_max_qty = max_qties[rec.id]
 
     @api.one
     def _set_max_quantity(self):
@@ -52,15 +57,66 @@ class StockWarehouse(models.Model):
         :param date: datetime at which we want to calculate the maximum quantity
         """
         self.ensure_one()
-        if self.fill_strategy == 'max':
-            return self.product_max_qty_operator
-        else:
-            if not date:
-                return 0
-            search_end_date = self.location_id.schedule_working_days(self.fill_duration + 1, date)
-            moves = self.env['stock.move'].search([('product_id', '=', self.product_id.id),
-                                                   ('location_id', '=', self.location_id.id),
-                                                   ('state', 'in', ['confirmed', 'waiting']),
-                                                   ('date', '<=', fields.Datetime.to_string(search_end_date)),
-                                                   ('date', '>', fields.Datetime.to_string(date))])
-            return sum([m.product_qty for m in moves])
+        return self.get_max_qty_multi(date)[self.id]
+
+    @api.multi
+    def get_max_qty_multi(self, date):
+        """Returns the maximum quantities of these orderpoints for the given date as a dict {orderpoint_id: qty}.
+
+        The forecast demand of all the orderpoints with a 'duration' strategy is computed with a single query. Results
+        are memorized in the dict given by the 'orderpoint_max_qty_memo' key of the context if any.
+        :param date: datetime at which we want to calculate the maximum quantities
+        """
+        memo = self.env.context.get('orderpoint_max_qty_memo')
+        if memo is None:
+            memo = {}
+        date_str = date and fields.Datetime.to_string(date) or False
+        result = {}
+        values = []
+        end_dates = {}
+        for rec in self:
+            if (rec.id, date_str) in memo:
+                result[rec.id] = memo[rec.id, date_str]
+            elif rec.fill_strategy == 'max':
+                result[rec.id] = rec.product_max_qty_operator
+            elif not date or not rec.product_id or not rec.location_id:
+                result[rec.id] = 0
+            else:
+                key = (rec.location_id.id, rec.fill_duration)
+                if key not in end_dates:
+                    end_dates[key] = fields.Datetime.to_string(
+                        rec.location_id.schedule_working_days(rec.fill_duration + 1, date))
+                if isinstance(rec.id, (int, long)):
+                    values.append(self.env.cr.mogrify("(%s :: INTEGER, %s :: INTEGER, %s :: INTEGER, %s :: TIMESTAMP)",
+                                                      (rec.id, rec.product_id.id, rec.location_id.id, end_dates[key])))
+                else:
+                    # Records being edited in a form have no id yet, their demand is computed with the ORM
+                    moves = self.env['stock.move'].search([('product_id', '=', rec.product_id.id),
+                                                           ('location_id', '=', rec.location_id.id),
+                                                           ('state', 'in', ['confirmed', 'waiting']),
+                                                           ('date', '<=', end_dates[key]),
+                                                           ('date', '>', date_str)])
+                    result[rec.id] = sum([move.product_qty for move in moves])
+        if values:
+            self.env.cr.execute("""SELECT
+    op.id,
+    COALESCE(sum(sm.product_qty), 0)
+FROM (VALUES %s) AS op (id, product_id, location_id, date_end)
+    LEFT JOIN stock_move sm ON sm.product_id = op.product_id AND sm.location_id = op.location_id AND
+                               sm.state IN ('confirmed', 'waiting') AND
+                               sm.date <= op.date_end AND sm.date > %%s
+GROUP BY op.id""" % ", ".join(values), (date_str,))
+            for orderpoint_id, qty in self.env.cr.fetchall():
+                result[orderpoint_id] = qty
+                memo[orderpoint_id, date_str] = qty
+        return result
+
+
+class ProcurementOrderForesight(models.Model):
+    _inherit = 'procurement.order'
+
+    @api.model
+    def _procure_orderpoint_confirm(self, use_new_cursor=False, company_id=False):
+        return super(ProcurementOrderForesight, self.with_context(orderpoint_max_qty_memo={},
+                                                                  orderpoint_max_qty_date=fields.Datetime.now())). \
+            _procure_orderpoint_confirm(use_new_cursor=use_new_cursor, company_id=company_id)
@@ -47,3 +47,66 @@ class TestProcurementForesightStrategy(common.TransactionCase):
         })
         max_qty = orderpoint.get_max_qty(datetime.strptime("2015-02-20 12:34:56", DEFAULT_SERVER_DATETIME_FORMAT))
         self.assertEqual(max_qty, 12)
+
+    def test_20_procurement_foresight_batch(self):
+        """Test that batch maximum quantities match the single ones."""
+        date = datetime.strptime("2015-02-20 12:34:56", DEFAULT_SERVER_DATETIME_FORMAT)
+        orderpoints = self.env['stock.warehouse.orderpoint']
+        for fill_strategy, fill_duration in [('duration', 5), ('duration', 1), ('max', 0)]:
+            orderpoints |= self.env['stock.warehouse.orderpoint'].create({
+                'name': "Test OrderPoint",
+                'product_id': self.product_test.id,
+                'location_id': self.location_stock.id,
+                'product_min_qty': 2,
+                'product_max_qty': 7,
+                'fill_strategy': fill_strategy,
+                'fill_duration': fill_duration,
+            })
+        memo = {}
+        max_qties = orderpoints.with_context(orderpoint_max_qty_memo=memo).get_max_qty_multi(date)
+        self.assertEqual(max_qties[orderpoints[0].id], 12)
+        self.assertEqual(max_qties[orderpoints[2].id], 7)
+        for orderpoint in orderpoints:
+            self.assertEqual(max_qties[orderpoint.id], orderpoint.get_max_qty(date))
+        self.assertEqual(len(memo), 2)
+
+    def test_30_procurement_foresight_reference_date(self):
+        """Test that the maximum quantities computed with a reference date in the context share the memo entries."""
+        orderpoint = self.env['stock.warehouse.orderpoint'].create({
+            'name': "Test OrderPoint",
+            'product_id': self.product_test.id,
+            'location_id': self.location_stock.id,
+            'product_min_qty': 2,
+            'product_max_qty': 0,
+            'fill_strategy': "duration",
+            'fill_duration': 5,
+        })
+        memo = {}
+        orderpoint = orderpoint.with_context(orderpoint_max_qty_memo=memo,
+                                             orderpoint_max_qty_date="2015-02-20 12:34:56")
+        self.assertEqual(orderpoint.product_max_qty, 12)
+        self.env.invalidate_all()
+        self.assertEqual(orderpoint.product_max_qty, 12)
+        self.assertEqual(memo, {(orderpoint.id, "2015-02-20 12:34:56"): 12})
+
+    def test_40_procurement_foresight_new_records(self):
+        """Test the maximum quantities of orderpoints being edited in a form, which have no id yet."""
+        orderpoint_model = self.env['stock.warehouse.orderpoint'].with_context(
+            orderpoint_max_qty_date="2015-02-20 12:34:56")
+        orderpoint = orderpoint_model.new({
+            'name': "Test OrderPoint",
+            'product_id': self.product_test.id,
+            'location_id': self.location_stock.id,
+            'product_min_qty': 2,
+            'fill_strategy': "duration",
+            'fill_duration': 5,
+        })
+        self.assertEqual(orderpoint.product_max_qty, 12)
+        orderpoint_without_product = orderpoint_model.new({
+            'name': "Test OrderPoint",
+            'location_id': self.location_stock.id,
+            'product_min_qty': 2,
+            'fill_strategy': "duration",
+            'fill_duration': 5,
+        })
+        self.assertEqual(orderpoint_without_product.product_max_qty, 0)
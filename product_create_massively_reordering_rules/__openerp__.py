@@ -23,11 +23,14 @@
     'author': 'NDP Systèmes',
     'maintainer': 'NDP Systèmes',
     'category': '',
-    'depends': ['stock'],
+    'depends': ['stock', 'connector'],
     'description': """
 Product Create Massively Reordering Rule
 ========================================
 This modules allows to create massively reordering rules from products list.
+
+Existing reordering rules of the selected products are replaced by chunks of 1000 products, each chunk in its own
+connector job when the selection is bigger. A dry run mode reports the rules which would be deleted and created.
 """,
     'website': 'http://www.ndp-systemes.fr',
     'data': [
@@ -17,7 +17,66 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+
 from openerp import models, fields, api, _
+from openerp.addons.connector.queue.job import job
+from openerp.addons.connector.session import ConnectorSession
+
+_logger = logging.getLogger(__name__)
+
+ORDERPOINT_CHUNK_SIZE = 1000
+
+
+@job(default_channel='root')
+def job_generate_orderpoints(session, model_name, template_values, product_ids, context=None):
+    orderpoint_obj = session.env[model_name].with_context(context)
+    deleted_nb, created_nb = orderpoint_obj.replace_orderpoints(template_values, product_ids)
+    return "%s reordering rules deleted, %s created" % (deleted_nb, created_nb)
+
+
+class MassReorderingRulesOrderpoint(models.Model):
+    _inherit = 'stock.warehouse.orderpoint'
+
+    @api.model
+    def get_template_values(self, template):
+        """Returns the values of the template reordering rule to copy to the generated rules, as copy() would."""
+        values = template.copy_data({'name': template.name})[0]
+        values.pop('product_id', None)
+        return values
+
+    @api.model
+    def get_replacement_diff(self, product_ids):
+        """Returns a text report of the reordering rules that would be deleted and created for product_ids."""
+        self.env.cr.execute("""SELECT
+    product_id,
+    count(*)
+FROM stock_warehouse_orderpoint
+WHERE product_id IN %s
+GROUP BY product_id""", (tuple(product_ids),))
+        existing = dict(self.env.cr.fetchall())
+        products = self.env['product.product'].browse(existing.keys())
+        lines = [_("%s reordering rules will be deleted on %s products.") % (sum(existing.values()), len(existing)),
+                 _("%s reordering rules will be created.") % len(product_ids)]
+        lines += [u"- %s: %s" % (product.display_name, existing[product.id]) for product in products]
+        return u"\n".join(lines)
+
+    @api.model
+    def replace_orderpoints(self, template_values, product_ids):
+        """Deletes the reordering rules of product_ids and creates a rule with template_values for each of them.
+
+        :return: a tuple (number of deleted rules, number of created rules)
+        """
+        if not product_ids:
+            return 0, 0
+        orderpoints = self.search([('product_id', 'in', product_ids)])
+        deleted_nb = len(orderpoints)
+        orderpoints.unlink()
+        for product_id in product_ids:
+            values = dict(template_values)
+            values['product_id'] = product_id
+            self.create(values)
+        return deleted_nb, len(product_ids)
 
 
 class MassReorderingRulesWizard(models.TransientModel):
@@ -25,13 +84,44 @@ class MassReorderingRulesWizard(models.TransientModel):
 
     orderpoint_id = fields.Many2one('stock.warehouse.orderpoint', string=u"Copy Reordering Rule", required=True)
     product_ids = fields.Many2many('product.product', string=u"For Products", required=True)
+    dry_run = fields.Boolean(string=u"Dry run", help=u"Only report the reordering rules which would be deleted and "
+                                                     u"created, without changing anything.")
+    report = fields.Text(string=u"Report", readonly=True)
 
     @api.multi
     def generate_rules(self):
+        """Replaces the reordering rules of the selected products by copies of the template rule.
+
+        The products are processed by chunks of ORDERPOINT_CHUNK_SIZE, each chunk in its own job if there are
+        several of them."""
         self.ensure_one()
-        for product in self.product_ids:
-            self.env['stock.warehouse.orderpoint'].search([('product_id', '=', product.id)]).unlink()
-            self.orderpoint_id.copy({'name': self.orderpoint_id.name,'product_id': product.id})
+        orderpoint_obj = self.env['stock.warehouse.orderpoint']
+        product_ids = self.product_ids.ids
+        if self.dry_run:
+            self.report = orderpoint_obj.get_replacement_diff(product_ids)
+            return {
+                'name': _("Generate Massively Ordering Rules"),
+                'type': 'ir.actions.act_window',
+                'view_type': 'form',
+                'view_mode': 'form',
+                'res_model': self._name,
+                'res_id': self.id,
+                'target': 'new',
+                'context': self.env.context,
+            }
+        template_values = orderpoint_obj.get_template_values(self.orderpoint_id)
+        chunks = [product_ids[index:index + ORDERPOINT_CHUNK_SIZE]
+                  for index in range(0, len(product_ids), ORDERPOINT_CHUNK_SIZE)]
+        if len(chunks) <= 1:
+            orderpoint_obj.replace_orderpoints(template_values, product_ids)
+            return
+        for index, chunk in enumerate(chunks):
+            job_generate_orderpoints.delay(ConnectorSession.from_env(self.env), 'stock.warehouse.orderpoint',
+                                           template_values, chunk, context=self.env.context,
+                                           description=u"Generating reordering rules from %s (%s/%s)" %
+                                                       (self.orderpoint_id.name, index + 1, len(chunks)))
+        _logger.info("Reordering rules generation for %s products split into %s jobs", len(product_ids),
+                     len(chunks))
 
 
 class MassReorderingRulesProductProduct(models.Model):
@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+#
+#    Copyright (C) 2016 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from openerp.tests import common
+
+
+class TestProductCreateMassivelyReorderingRules(common.TransactionCase):
+
+    def setUp(self):
+        super(TestProductCreateMassivelyReorderingRules, self).setUp()
+        self.orderpoint_obj = self.env['stock.warehouse.orderpoint']
+        self.product_template = self.browse_ref('product.product_product_6')
+        self.product_1 = self.browse_ref('product.product_product_7')
+        self.product_2 = self.browse_ref('product.product_product_9')
+        self.template = self.orderpoint_obj.create({
+            'name': "Template OrderPoint",
+            'product_id': self.product_template.id,
+            'location_id': self.ref('stock.stock_location_stock'),
+            'product_min_qty': 5,
+            'product_max_qty': 20,
+            'qty_multiple': 2,
+        })
+        self.existing_orderpoint = self.orderpoint_obj.create({
+            'name': "Existing OrderPoint",
+            'product_id': self.product_1.id,
+            'location_id': self.ref('stock.stock_location_stock'),
+            'product_min_qty': 1,
+            'product_max_qty': 3,
+        })
+        self.wizard = self.env['mass.reordering.rules.wizard'].create({
+            'orderpoint_id': self.template.id,
+            'product_ids': [(6, 0, [self.product_1.id, self.product_2.id])],
+        })
+
+    def get_values(self, orderpoint):
+        """Returns the values of the stored fields of the given reordering rule, except the technical ones."""
+        fields_to_compare = [name for name, field in self.orderpoint_obj._fields.iteritems() if field.store and
+                             name not in ['id', 'create_uid', 'create_date', 'write_uid', 'write_date']]
+        return orderpoint.read(fields_to_compare, load='_classic_write')[0]
+
+    def test_10_dry_run(self):
+        """Test that the dry run reports the changes without applying them."""
+        self.wizard.dry_run = True
+        self.wizard.generate_rules()
+        self.assertIn(self.product_1.display_name, self.wizard.report)
+        self.assertNotIn(self.product_2.display_name, self.wizard.report)
+        self.assertTrue(self.existing_orderpoint.exists())
+        self.assertFalse(self.orderpoint_obj.search([('product_id', '=', self.product_2.id)]))
+
+    def test_20_generate_rules(self):
+        """Test that the generated reordering rules are the same as copies of the template."""
+        self.wizard.generate_rules()
+        self.assertFalse(self.existing_orderpoint.exists())
+        for product in [self.product_1, self.product_2]:
+            generated = self.orderpoint_obj.search([('product_id', '=', product.id)])
+            self.assertEqual(len(generated), 1)
+            copied = self.template.copy({'name': self.template.name, 'product_id': product.id})
+            generated_values = self.get_values(generated)
+            copied_values = self.get_values(copied)
+            for values in [generated_values, copied_values]:
+                values.pop('id')
+            self.assertEqual(generated_values, copied_values)
+            self.assertEqual(generated.product_min_qty, 5)
+            self.assertEqual(generated.product_max_qty, 20)
+            self.assertEqual(generated.qty_multiple, 2)
@@ -17,6 +17,8 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from collections import OrderedDict
+
 from openerp import fields, models, api, _
 from openerp.tools import float_compare, float_round
 
@@ -43,122 +45,138 @@ class product_putaway_dispatch_transfer_details(models.TransientModel):
         for rec in self:
             rec.hide_dispatch_button = (rec.picking_destination_location_id.putaway_strategy_id.method != 'dispatch')
 
+    @api.multi
+    def _get_packop_contents(self):
+        """Returns a dict {packop: quants} giving the content of each package operation of the transfers. The quants of
+        all the packages are fetched with a single search."""
+        packops = self.mapped('packop_ids')
+        contents = {op: self.env['stock.quant'] for op in packops}
+        packages = packops.mapped('package_id')
+        if packages:
+            quants = self.env['stock.quant'].search([('package_id', 'child_of', packages.ids)])
+            for op in packops:
+                parent_left = op.package_id.parent_left
+                parent_right = op.package_id.parent_right
+                contents[op] = quants.filtered(lambda q: parent_left <= q.package_id.parent_left < parent_right)
+        return contents
+
+    @api.multi
+    def _get_dispatch_needs(self, products):
+        """Returns a dict {product: [(location, qty)]} giving the quantities needed by the confirmed moves leaving the
+        children of the destination location, in the order of the moves priority. The moves of all the products are
+        fetched with a single search."""
+        self.ensure_one()
+        needs = {product: [] for product in products}
+        if products:
+            need_moves = self.env['stock.move'].search(
+                [('location_id', 'child_of', self.picking_destination_location_id.id),
+                 ('product_id', 'in', [product.id for product in products]), ('state', '=', 'confirmed')],
+                order="priority DESC, date")
+            for move in need_moves:
+                needs[move.product_id].append((move.location_id, move.product_qty))
+        return needs
+
+    @api.model
+    def _sorted_dispatch_locations(self, location_qty):
+        """Returns the locations of location_qty by decreasing remaining need. Ties are kept in priority order."""
+        return sorted(location_qty.keys(), key=lambda location: location_qty[location], reverse=True)
+
     @api.multi
     def action_dispatch(self):
         for transfer in self:
-            qty_to_dispatch = {}
+            qty_to_dispatch = OrderedDict()
+            packops_by_product = {}
+            contents = transfer._get_packop_contents()
             # Get the quantity to dispatch for each product
             for op in transfer.packop_ids:
                 # First in packs
-                quants = self.env['stock.quant'].browse(op.package_id.get_content())
+                quants = contents[op]
+                if not quants:
+                    continue
                 if not all([(q.product_id == quants[0].product_id) for q in quants]):
                     # If the pack is not composed of a single product, we prepare unpacking to handle the quants as
                     # bulk products
                     op.prepare_unpack()
                     continue
-                for quant in quants:
-                    if quant.product_id in qty_to_dispatch:
-                        qty_to_dispatch[quant.product_id] += quant.qty
-                    else:
-                        qty_to_dispatch[quant.product_id] = quant.qty
+                product = quants[0].product_id
+                pack_qty = sum([q.qty for q in quants])
+                qty_to_dispatch[product] = qty_to_dispatch.get(product, 0) + pack_qty
+                packops_by_product.setdefault(product, []).append((op, pack_qty))
             for op in transfer.item_ids:
                 # Then in bulk products
-                if op.product_id in qty_to_dispatch:
-                    qty_to_dispatch[op.product_id] += op.quantity
-                else:
-                    qty_to_dispatch[op.product_id] = op.quantity
+                qty_to_dispatch[op.product_id] = qty_to_dispatch.get(op.product_id, 0) + op.quantity
 
+            needs = transfer._get_dispatch_needs(qty_to_dispatch.keys())
             # Iterate on each product
             for product, qty_todo in qty_to_dispatch.iteritems():
-                need_moves = self.env['stock.move'].search(
-                    [('location_id', 'child_of', transfer.picking_destination_location_id.id),
-                     ('product_id', '=', product.id), ('state', '=', 'confirmed')],
-                    order="priority DESC, date")
-                qty_todo = min(sum([m.product_qty for m in need_moves]), qty_todo)
-                location_qty = {}
+                rounding = product.uom_id.rounding
+                qty_todo = min(sum([need_qty for location, need_qty in needs[product]]), qty_todo)
+                location_qty = OrderedDict()
                 qty_left = qty_todo
                 # Get the quantity to dispatch for each location and set it in location_qty dict
-                for move in need_moves:
-                    if float_compare(qty_left, 0, precision_rounding=move.product_uom.rounding) <= 0:
+                for location, need_qty in needs[product]:
+                    if float_compare(qty_left, 0, precision_rounding=rounding) <= 0:
                         break
-                    qty_to_add = min(move.product_qty, qty_left)
-                    if move.location_id in location_qty:
-                        location_qty[move.location_id] += qty_to_add
-                    else:
-                        location_qty[move.location_id] = qty_to_add
+                    qty_to_add = min(need_qty, qty_left)
+                    location_qty[location] = location_qty.get(location, 0) + qty_to_add
                     qty_left -= qty_to_add
 
-                # First try to dispatch entire packs
+                # First try to dispatch entire packs, largest packs first
                 # We only have packs with a single product since we prepared unpacking for the others
-                remaining_packops = transfer.packop_ids.filtered(lambda x:
-                                                                 self.env['stock.quant'].browse(
-                                                                     x.package_id.get_content())[
-                                                                     0].product_id == product)
-                remaining_packops = remaining_packops.sorted(key=lambda x: sum([q.qty for q in
-                                                                                self.env['stock.quant'].browse(
-                                                                                    x.package_id.get_content())]),
-                                                             reverse=True)
-                for op in remaining_packops:
-                    # We try to find a location where we need at least the whole qty of the pack
-                    for location, qty in location_qty.iteritems():
-                        if float_compare(qty, 0, precision_rounding=product.uom_id.rounding) <= 0:
-                            continue
-                        pack_qty = sum([q.qty for q in self.env['stock.quant'].browse(op.package_id.get_content())])
-                        if float_compare(pack_qty, qty, precision_rounding=product.uom_id.rounding) <= 0:
-                            # We found a location, so we dispatch the pack to location and go for the next pack
+                remaining_packops = self.env['stock.transfer_details_items']
+                product_packops = sorted(packops_by_product.get(product, []), key=lambda item: item[1], reverse=True)
+                for op, pack_qty in product_packops:
+                    # We send the pack to the location with the largest need able to receive it entirely
+                    for location in self._sorted_dispatch_locations(location_qty):
+                        if float_compare(pack_qty, location_qty[location], precision_rounding=rounding) <= 0:
                             op.destinationloc_id = location
                             location_qty[location] -= pack_qty
-                            remaining_packops = remaining_packops - op
                             break
+                    else:
+                        remaining_packops |= op
 
                 # We prepare unpacking for the remaining packs to handle them as bulk products
                 remaining_packops.prepare_unpack()
-                # Then we fetch the bulk product operation lines
-                op_items = transfer.item_ids.search(
+                # Then we fetch the bulk product operation lines, including the ones of the unpacked packs
+                op_items = self.env['stock.transfer_details_items'].search(
                     [('product_id', '=', product.id), ('transfer_id', '=', transfer.id)])
                 # Iterate on each bulk product operations to dispatch them
                 for op in op_items:
-                    # We get the quantity to dispatch and set the quantity of the operation to 0
                     op_qty_todo = op.quantity
-                    op.quantity = 0
-                    # We initialize a recordset holding all the lines split from op
-                    split_ops = op
-
-                    for location, qty_loc in location_qty.iteritems():
-                        if float_compare(op_qty_todo, 0, precision_rounding=product.uom_id.rounding) <= 0:
+                    op_qty = 0
+                    new_items = []
+                    for location in self._sorted_dispatch_locations(location_qty):
+                        if float_compare(op_qty_todo, 0, precision_rounding=rounding) <= 0:
                             break
-                        if float_compare(qty_loc, 0, precision_rounding=product.uom_id.rounding) <= 0:
+                        if float_compare(location_qty[location], 0, precision_rounding=rounding) <= 0:
                             continue
-                        qty = min(op_qty_todo, qty_loc)
-                        # Check if we have already a line with the wanted destination location
-                        for target_op in split_ops:
-                            if target_op.destinationloc_id == location:
-                                # If we do, we add the quantity to dispatch to this line
-                                target_op.quantity += qty
-                                break
+                        qty = min(op_qty_todo, location_qty[location])
+                        if op.destinationloc_id == location:
+                            op_qty += qty
                         else:
-                            # We did not find any line with the wanted location/pack,
-                            # so we split the first line to create one
-                            new_op = op.copy({
-                                'quantity': float_round(qty, precision_rounding=product.uom_id.rounding),
+                            new_items.append({
+                                'quantity': float_round(qty, precision_rounding=rounding),
                                 'packop_id': False,
                                 'destinationloc_id': location.id,
                                 'result_package_id': False,
                             })
-                            split_ops = split_ops | new_op
                         location_qty[location] -= qty
                         op_qty_todo -= qty
                     # We send back to the source location undispatched moves
-                    if float_compare(op_qty_todo, 0, precision_rounding=product.uom_id.rounding) > 0:
-                        op.copy({
+                    if float_compare(op_qty_todo, 0, precision_rounding=rounding) > 0:
+                        new_items.append({
                             'destinationloc_id': op.sourceloc_id.id,
-                            'quantity': float_round(op_qty_todo, precision_rounding=product.uom_id.rounding),
+                            'quantity': float_round(op_qty_todo, precision_rounding=rounding),
                             'packop_id': False,
                             'result_package_id': False,
                         })
-                    # We delete op if it has not been allocated some quantity in between
-                    if float_compare(op.quantity, 0, precision_rounding=product.uom_id.rounding) <= 0:
+                    for new_item in new_items:
+                        op.copy(new_item)
+                    # We delete op if it has not been allocated some quantity
+                    if float_compare(op_qty, 0, precision_rounding=rounding) <= 0:
                         op.unlink()
+                    elif float_compare(op_qty, op.quantity, precision_rounding=rounding) != 0:
+                        op.quantity = op_qty
         return self.wizard_view()
 
 
@@ -102,3 +102,27 @@ class TestProductPutawayWhereNeeded(common.TransactionCase):
         self.assertEqual(qty_1, 8)
         qty_2 = sum([q.qty for q in quants_stock_2])
         self.assertEqual(qty_2, 12)
+
+    def test_30_dispatch_determinism(self):
+        """Test that packs are dispatched to the location with the largest need."""
+        pack = self.env['stock.quant.package'].create({'location_id': self.location_shelf.id})
+        self.picking2.action_confirm()
+        self.picking2.action_assign()
+        self.picking2.do_prepare_partial()
+        packop_0 = self.picking2.pack_operation_ids[0]
+        packop_0.copy({'product_qty': 17})
+        packop_0.product_qty = 3
+        packop_0.result_package_id = pack
+        self.picking2.do_transfer()
+        self.picking1.action_confirm()
+        self.picking1.action_assign()
+        self.picking1.do_prepare_partial()
+        wizard_id = self.picking1.do_enter_transfer_details()['res_id']
+        wizard = self.env['stock.transfer_details'].browse(wizard_id)
+        wizard.action_dispatch()
+        pack_op = wizard.packop_ids.filtered(lambda op: op.package_id == pack)
+        self.assertEqual(pack_op.destinationloc_id, self.location_bin_2)
+        qty_by_location = {}
+        for item in wizard.item_ids:
+            qty_by_location[item.destinationloc_id] = qty_by_location.get(item.destinationloc_id, 0) + item.quantity
+        self.assertEqual(qty_by_location, {self.location_bin_1: 8, self.location_bin_2: 9})
@@ -33,7 +33,9 @@ new putaway strategy which sets the bin to the last bin where the product has be
 This strategy need only to be defined once and can be applied to several locations.
 """,
     'website': 'http://www.ndp-systemes.fr',
-    'data': [],
+    'data': [
+        'data/cron.xml',
+    ],
     'demo': [
         'product_putaway_last_demo.xml'
     ],
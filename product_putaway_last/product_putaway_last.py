@@ -17,7 +17,31 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+
+from psycopg2 import IntegrityError
+from psycopg2.extensions import TransactionRollbackError
+
 from openerp import fields, models, api, _
+from openerp.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+# Inserts into stock_putaway_last_location the last location of the products of the quants, for each ancestor location
+# of the quants location. The parameter is an additional filter on the quants.
+INSERT_LAST_LOCATIONS_QUERY = """INSERT INTO stock_putaway_last_location (product_id, root_location_id, location_id,
+                                          in_date, quant_id)
+    SELECT DISTINCT ON (sq.product_id, root.id)
+        sq.product_id,
+        root.id                              AS root_location_id,
+        sq.location_id,
+        COALESCE(sq.in_date, sq.create_date) AS in_date,
+        sq.id                                AS quant_id
+    FROM stock_quant sq
+        INNER JOIN stock_location sl ON sl.id = sq.location_id AND sl.usage = 'internal'
+        INNER JOIN stock_location root ON root.parent_left <= sl.parent_left AND sl.parent_left < root.parent_right
+    %s
+    ORDER BY sq.product_id, root.id, COALESCE(sq.in_date, sq.create_date) DESC, sq.id DESC"""
 
 
 class product_putaway_stock_location(models.Model):
@@ -31,6 +55,103 @@ class product_putaway_stock_location(models.Model):
                      self.with_context(putaway_location=location)).get_putaway_strategy(location, product)
 
 
+class product_putaway_last_stock_quant(models.Model):
+    _inherit = 'stock.quant'
+
+    def _auto_init(self, cr, context=None):
+        res = super(product_putaway_last_stock_quant, self)._auto_init(cr, context)
+        # The quant changes are only recorded in stock_putaway_last_location_dirty, which has no unique key, so that the
+        # quant writes never wait for or conflict on the shared last location rows.
+        cr.execute("""CREATE TABLE IF NOT EXISTS stock_putaway_last_location_dirty (
+    product_id INTEGER NOT NULL)""")
+        cr.execute("""SELECT 1 FROM pg_indexes WHERE indexname = %s""",
+                   ('stock_putaway_last_location_dirty_product_id_index',))
+        if not cr.fetchone():
+            cr.execute("""CREATE INDEX stock_putaway_last_location_dirty_product_id_index
+ON stock_putaway_last_location_dirty (product_id)""")
+        cr.execute("""SELECT 1 FROM pg_tables WHERE tablename = 'stock_putaway_last_location'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE TABLE stock_putaway_last_location (
+    product_id       INTEGER NOT NULL,
+    root_location_id INTEGER NOT NULL,
+    location_id      INTEGER NOT NULL,
+    in_date          TIMESTAMP,
+    quant_id         INTEGER,
+    PRIMARY KEY (product_id, root_location_id))""")
+            cr.execute(INSERT_LAST_LOCATIONS_QUERY % "")
+        return res
+
+    @api.multi
+    def mark_last_locations_dirty(self):
+        """Records that the last locations of the products of these quants must be computed again."""
+        if not self.ids:
+            return
+        self.env.cr.execute("""INSERT INTO stock_putaway_last_location_dirty (product_id)
+    SELECT DISTINCT product_id
+    FROM stock_quant
+    WHERE id IN %s""", (tuple(self.ids),))
+
+    @api.model
+    def apply_last_locations_changes(self, product_id=None):
+        """Computes again the last locations of the products recorded in stock_putaway_last_location_dirty.
+
+        If another transaction is already applying changes, or if the rows to write were changed by a transaction
+        committed in the meantime, nothing is done and the changes are left to the next call.
+
+        :param product_id: if given, only the changes of this product are applied
+        :return: True if the changes were applied
+        """
+        if product_id:
+            self.env.cr.execute("""SELECT pg_try_advisory_xact_lock(hashtext('stock_putaway_last_location_dirty'),
+                                 %s)""", (product_id,))
+        else:
+            self.env.cr.execute("""SELECT pg_try_advisory_xact_lock(hashtext('stock_putaway_last_location_dirty'))""")
+        if not self.env.cr.fetchone()[0]:
+            return False
+        try:
+            with mute_logger('openerp.sql_db'), self.env.cr.savepoint():
+                if product_id:
+                    self.env.cr.execute("""DELETE FROM stock_putaway_last_location_dirty WHERE product_id = %s
+RETURNING product_id""", (product_id,))
+                else:
+                    self.env.cr.execute("""DELETE FROM stock_putaway_last_location_dirty RETURNING product_id""")
+                product_ids = tuple(set([row[0] for row in self.env.cr.fetchall()]))
+                if product_ids:
+                    self.env.cr.execute("""DELETE FROM stock_putaway_last_location WHERE product_id IN %s""",
+                                        (product_ids,))
+                    self.env.cr.execute(INSERT_LAST_LOCATIONS_QUERY % "WHERE sq.product_id IN %s", (product_ids,))
+        except (IntegrityError, TransactionRollbackError):
+            _logger.info(u"Last locations changes were not applied because of a concurrent update")
+            return False
+        return True
+
+    @api.model
+    def backfill_last_locations(self):
+        """Recomputes the last locations of all the products from the existing quants."""
+        self.env.cr.execute("""TRUNCATE stock_putaway_last_location, stock_putaway_last_location_dirty""")
+        self.env.cr.execute(INSERT_LAST_LOCATIONS_QUERY % "")
+
+    @api.model
+    def create(self, vals):
+        result = super(product_putaway_last_stock_quant, self).create(vals)
+        result.mark_last_locations_dirty()
+        return result
+
+    @api.multi
+    def write(self, vals):
+        if 'product_id' in vals:
+            self.mark_last_locations_dirty()
+        result = super(product_putaway_last_stock_quant, self).write(vals)
+        if any([field in vals for field in ['product_id', 'location_id', 'in_date']]):
+            self.mark_last_locations_dirty()
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.mark_last_locations_dirty()
+        return super(product_putaway_last_stock_quant, self).unlink()
+
+
 class product_putway_last_strategy(models.Model):
     _inherit = 'product.putaway'
 
@@ -46,6 +167,16 @@ class product_putway_last_strategy(models.Model):
     def putaway_apply(self, putaway_strat, product):
         location = self.env.context.get("putaway_location")
         if putaway_strat.method == 'last' and location is not None:
+            # The pending changes of this product are applied first, the last locations table is only used if they
+            # could be applied
+            self.env.cr.execute("""SELECT 1 FROM stock_putaway_last_location_dirty WHERE product_id = %s LIMIT 1""",
+                                (product.id,))
+            if not self.env.cr.fetchone() or self.env['stock.quant'].apply_last_locations_changes(product.id):
+                self.env.cr.execute("""SELECT location_id FROM stock_putaway_last_location
+WHERE product_id = %s AND root_location_id = %s""", (product.id, location.id))
+                row = self.env.cr.fetchone()
+                if row:
+                    return row[0]
             quants = self.env["stock.quant"].search([('product_id', '=', product.id),
                                                      ('location_id', 'child_of', location.id)],
                                                     order='in_date DESC, id desc', limit=1)
@@ -70,4 +70,39 @@ class TestProductPutawayLast(common.TransactionCase):
                                                        ('location_id','=',self.location_bin_1.id)])
         self.assertGreaterEqual(len(quants_stock3), 2)
 
+    def test_20_last_location_table(self):
+        """Tests that the last location table follows the quants and matches a full backfill."""
+        self.picking1.action_confirm()
+        self.picking1.action_assign()
+        self.picking1.do_prepare_partial()
+        self.picking1.do_transfer()
+        self.assertEqual(self.picking1.state, 'done')
+        quants_stock = self.env["stock.quant"].search([('product_id', '=', self.product_a1232.id),
+                                                       ('location_id', '=', self.location_stock.id)])
+        self.assertGreaterEqual(len(quants_stock), 1)
+        putaway_strat = self.env['product.putaway'].create({'name': "Last bin (test)", 'method': 'last'})
+        putaway_obj = self.env['product.putaway'].with_context(putaway_location=self.location_stock)
+
+        def get_last_location():
+            self.env.cr.execute("""SELECT location_id FROM stock_putaway_last_location
+WHERE product_id = %s AND root_location_id = %s""", (self.product_a1232.id, self.location_stock.id))
+            return [row[0] for row in self.env.cr.fetchall()]
+
+        self.assertTrue(self.env["stock.quant"].apply_last_locations_changes())
+        self.assertEqual(get_last_location(), [self.location_stock.id])
+        self.assertEqual(putaway_obj.putaway_apply(putaway_strat, self.product_a1232), self.location_stock.id)
+
+        # The pending changes of the product are applied by putaway_apply before reading the table
+        quants_stock.write({'location_id': self.location_bin_2.id})
+        self.assertEqual(get_last_location(), [self.location_stock.id])
+        self.assertEqual(putaway_obj.putaway_apply(putaway_strat, self.product_a1232), self.location_bin_2.id)
+        self.assertEqual(get_last_location(), [self.location_bin_2.id])
+        self.env.cr.execute("""SELECT 1 FROM stock_putaway_last_location_dirty WHERE product_id = %s""",
+                            (self.product_a1232.id,))
+        self.assertFalse(self.env.cr.fetchall())
+        self.assertTrue(self.env["stock.quant"].apply_last_locations_changes())
+        self.assertEqual(get_last_location(), [self.location_bin_2.id])
+        self.assertEqual(putaway_obj.putaway_apply(putaway_strat, self.product_a1232), self.location_bin_2.id)
 
+        self.env["stock.quant"].backfill_last_locations()
+        self.assertEqual(get_last_location(), [self.location_bin_2.id])
@@ -24,25 +24,46 @@ from openerp.tools.float_utils import float_compare
 class StockQuantRemovalFromPacks(models.Model):
     _inherit = 'stock.quant'
 
+    def _auto_init(self, cr, context=None):
+        res = super(StockQuantRemovalFromPacks, self)._auto_init(cr, context)
+        cr.execute("""SELECT 1 FROM pg_indexes WHERE indexname = 'stock_quant_location_product_package_index'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE INDEX stock_quant_location_product_package_index
+ON stock_quant (location_id, product_id, package_id)
+WHERE package_id IS NOT NULL""")
+        return res
+
+    @api.model
+    def _get_rss_candidate_packs(self, product, location):
+        """Returns the packs of the location containing the product, with their quantity of this product and the ids of
+        the corresponding quants, as a list of (package_id, qty, quant_ids) computed by a single grouped query."""
+        self.env.cr.execute("""SELECT
+    package_id,
+    sum(qty)                                AS qty,
+    array_agg(id ORDER BY in_date, id)      AS quant_ids
+FROM stock_quant
+WHERE location_id = %s AND product_id = %s AND package_id IS NOT NULL
+GROUP BY package_id
+HAVING sum(qty) > 0
+ORDER BY package_id""", (location.id, product.id))
+        return self.env.cr.fetchall()
+
     @api.multi
     def apply_rss(self, product, location, quantity, domain):
-        packs = self.env['stock.quant.package'].search([('location_id', '=', location.id)]). \
-            filtered(lambda p: sum([x.qty for x in p.quant_ids if x.product_id == product]) > 0)
+        packs = self._get_rss_candidate_packs(product, location)
         list_removals = []
         qty_reserved = 0
         if packs:
             qty_to_remove_for_each_pack = float(quantity) / len(packs)
-            for pack in packs:
-                qty_available_in_pack = sum([x.qty for x in pack.quant_ids if x.product_id == product])
+            for package_id, qty_available_in_pack, quant_ids in packs:
                 if qty_available_in_pack >= qty_to_remove_for_each_pack:
-                   list_removals += self.apply_removal_strategy(location, product, qty_to_remove_for_each_pack,
-                                               domain + [('package_id', '=', pack.id)], 'fifo')
-                   qty_reserved += qty_to_remove_for_each_pack
+                    list_removals += self.apply_removal_strategy(location, product, qty_to_remove_for_each_pack,
+                                                                 domain + [('package_id', '=', package_id)], 'fifo')
+                    qty_reserved += qty_to_remove_for_each_pack
                 else:
-                    for quant in pack.quant_ids:
-                        if quant.product_id == product:
-                            qty_reserved += quant.qty
-                            list_removals += [(quant, quant.qty)]
+                    for quant in self.browse(quant_ids):
+                        qty_reserved += quant.qty
+                        list_removals += [(quant, quant.qty)]
         if float_compare(qty_reserved, quantity, precision_rounding=product.uom_id.rounding) < 0:
             list_removals += self.apply_removal_strategy(location, product, quantity - qty_reserved,
                                                          domain + [('package_id', '=', False)], 'fifo')
@@ -30,7 +30,8 @@ Validity Dates for Supplier Prices
 Makes prices dependant on time, not only on purchase quantity.
 """,
     'website': 'http://www.ndp-systemes.fr',
-    'data': ['supplier_articles.xml'],
+    'data': ['supplier_articles.xml',
+             'data/cron.xml'],
     'demo': [
         'test_supplier_articles.xml'
         ],
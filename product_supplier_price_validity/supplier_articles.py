@@ -17,17 +17,39 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
 import time
 
 from openerp.exceptions import except_orm
 from openerp import fields, models, api, _
 
+_logger = logging.getLogger(__name__)
+
+# Rebuilds the validity ranges of the price lines of the given supplierinfos. A price line is valid from its validity
+# date (or forever if it has none) until the next validity date of the lines with the same minimal quantity.
+REFRESH_VALIDITY_QUERY = """INSERT INTO pricelist_partnerinfo_validity (partnerinfo_id, suppinfo_id, validity)
+    SELECT
+        ppi.id,
+        ppi.suppinfo_id,
+        daterange(ppi.validity_date, (SELECT min(next_ppi.validity_date)
+                                      FROM pricelist_partnerinfo next_ppi
+                                      WHERE next_ppi.suppinfo_id = ppi.suppinfo_id AND
+                                            next_ppi.min_quantity = ppi.min_quantity AND
+                                            next_ppi.validity_date > COALESCE(ppi.validity_date, '-infinity' :: DATE)),
+                  '[)')
+    FROM pricelist_partnerinfo ppi
+    WHERE ppi.suppinfo_id IS NOT NULL
+    %s"""
+
 
 class product_supplierinfo_improved (models.Model):
     _inherit = "product.supplierinfo"
     validity_date_2 = fields.Date(
         "Validity date",
         help="Price list validity end date. Does not have any affect on the price calculation.")
+    next_validity_transition = fields.Date(
+        "Next price validity transition", readonly=True, index=True,
+        help="Date at which the active price lines of this supplierinfo will change.")
 
 
 class pricelist_partnerinfo_improved (models.Model):
@@ -35,13 +57,100 @@ class pricelist_partnerinfo_improved (models.Model):
     _order = 'min_quantity asc, validity_date asc'
 
     validity_date = fields.Date("Validity date", help="Validity date from that date")
-    active_line = fields.Boolean("True if this rule is used", store=True, compute="_is_active_line")
+    active_line = fields.Boolean("True if this rule is used", readonly=True)
+
+    def _auto_init(self, cr, context=None):
+        res = super(pricelist_partnerinfo_improved, self)._auto_init(cr, context)
+        cr.execute("""SELECT 1 FROM pg_tables WHERE tablename = 'pricelist_partnerinfo_validity'""")
+        if not cr.fetchone():
+            cr.execute("""CREATE TABLE pricelist_partnerinfo_validity (
+    partnerinfo_id INTEGER PRIMARY KEY REFERENCES pricelist_partnerinfo (id) ON DELETE CASCADE,
+    suppinfo_id    INTEGER NOT NULL,
+    validity       DATERANGE NOT NULL)""")
+            cr.execute("""CREATE INDEX pricelist_partnerinfo_validity_suppinfo_id_index
+ON pricelist_partnerinfo_validity (suppinfo_id)""")
+            cr.execute("""CREATE INDEX pricelist_partnerinfo_validity_validity_index
+ON pricelist_partnerinfo_validity USING GIST (validity)""")
+            cr.execute(REFRESH_VALIDITY_QUERY % "")
+        return res
+
+    @api.model
+    def refresh_validity_index(self, suppinfo_ids):
+        """Rebuilds the validity ranges of all the price lines of the given supplierinfos."""
+        suppinfo_ids = tuple(set([suppinfo_id for suppinfo_id in suppinfo_ids if suppinfo_id]))
+        if not suppinfo_ids:
+            return
+        self.env.cr.execute("""DELETE FROM pricelist_partnerinfo_validity WHERE suppinfo_id IN %s""", (suppinfo_ids,))
+        self.env.cr.execute(REFRESH_VALIDITY_QUERY % "AND ppi.suppinfo_id IN %s", (suppinfo_ids,))
+        self._update_active_flags(list(suppinfo_ids), fields.Date.today())
+
+    @api.model
+    def _update_active_flags(self, suppinfo_ids, date):
+        """Sets the active flag of the price lines of the given supplierinfos for date and stores their next
+        validity transition. Returns the ids of the price lines whose flag changed."""
+        if not suppinfo_ids:
+            return []
+        self.env.cr.execute("""UPDATE pricelist_partnerinfo ppi
+SET active_line = ppv.validity @> %s :: DATE
+FROM pricelist_partnerinfo_validity ppv
+WHERE ppv.partnerinfo_id = ppi.id AND ppv.suppinfo_id IN %s AND
+      ppi.active_line IS DISTINCT FROM (ppv.validity @> %s :: DATE)
+RETURNING ppi.id""", (date, tuple(suppinfo_ids), date))
+        changed_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.env.cr.execute("""UPDATE product_supplierinfo ps
+SET next_validity_transition = (SELECT min(boundaries.boundary)
+                                FROM (SELECT
+                                          lower(ppv.validity) AS boundary
+                                      FROM pricelist_partnerinfo_validity ppv
+                                      WHERE ppv.suppinfo_id = ps.id
+                                      UNION ALL
+                                      SELECT
+                                          upper(ppv.validity) AS boundary
+                                      FROM pricelist_partnerinfo_validity ppv
+                                      WHERE ppv.suppinfo_id = ps.id) boundaries
+                                WHERE boundaries.boundary > %s :: DATE)
+WHERE ps.id IN %s""", (date, tuple(suppinfo_ids)))
+        self.invalidate_cache(['active_line'], changed_ids)
+        self.env['product.supplierinfo'].invalidate_cache(['next_validity_transition'], list(suppinfo_ids))
+        return changed_ids
+
+    @api.model
+    def update_active_flags(self, full=False, date=None):
+        """Updates the active flags of the price lines whose validity boundaries were crossed since the last run.
+
+        :param full: if True, updates the flags of all the price lines.
+        :param date: date at which the flags are computed, defaults to today."""
+        date = date or fields.Date.today()
+        if full:
+            self.env.cr.execute("""SELECT DISTINCT suppinfo_id FROM pricelist_partnerinfo_validity""")
+        else:
+            self.env.cr.execute("""SELECT id FROM product_supplierinfo WHERE next_validity_transition <= %s""", (date,))
+        suppinfo_ids = [row[0] for row in self.env.cr.fetchall()]
+        changed_ids = self._update_active_flags(suppinfo_ids, date)
+        _logger.info("Price lines active flags updated for %s supplierinfos, %s lines changed",
+                     len(suppinfo_ids), len(changed_ids))
+        return changed_ids
+
+    @api.model
+    def create(self, vals):
+        result = super(pricelist_partnerinfo_improved, self).create(vals)
+        self.refresh_validity_index([result.suppinfo_id.id])
+        return result
+
+    @api.multi
+    def write(self, vals):
+        suppinfo_ids = self.mapped('suppinfo_id').ids
+        result = super(pricelist_partnerinfo_improved, self).write(vals)
+        if {'suppinfo_id', 'min_quantity', 'validity_date'} & set(vals):
+            self.refresh_validity_index(suppinfo_ids + self.mapped('suppinfo_id').ids)
+        return result
 
     @api.multi
-    @api.depends('suppinfo_id.pricelist_ids', 'min_quantity', 'validity_date')
-    def _is_active_line(self):
-        for rec in self:
-            rec.active_line = rec.is_active()
+    def unlink(self):
+        suppinfo_ids = self.mapped('suppinfo_id').ids
+        result = super(pricelist_partnerinfo_improved, self).unlink()
+        self.refresh_validity_index(suppinfo_ids)
+        return result
 
     @api.multi
     def is_active(self):
@@ -66,6 +175,28 @@ class pricelist_partnerinfo_improved (models.Model):
 class product_pricelist_improved(models.Model):
     _inherit = "product.pricelist"
 
+    @api.model
+    def _get_active_price(self, seller, qty, date):
+        """Returns the price of the price line of seller valid for qty at date.
+
+        The result is memorized in the dict given by the 'supplier_price_memo' key of the context if any, so that
+        batch pricing calls do not query the same price twice."""
+        memo = self.env.context.get('supplier_price_memo')
+        key = (seller.id, qty, date)
+        if memo is not None and key in memo:
+            return memo[key]
+        self.env.cr.execute("""SELECT ppi.price
+FROM pricelist_partnerinfo_validity ppv
+    INNER JOIN pricelist_partnerinfo ppi ON ppi.id = ppv.partnerinfo_id
+WHERE ppv.suppinfo_id = %s AND ppv.validity @> %s :: DATE AND ppi.min_quantity <= %s
+ORDER BY ppi.min_quantity DESC, ppi.validity_date DESC NULLS LAST, ppi.id
+LIMIT 1""", (seller.id, date, qty))
+        row = self.env.cr.fetchone()
+        price = row and row[0] or 0.0
+        if memo is not None:
+            memo[key] = price
+        return price
+
     @api.model
     def _price_rule_get_multi(self, pricelist, products_by_qty_by_partner):
         results = super(product_pricelist_improved, self)._price_rule_get_multi(pricelist, products_by_qty_by_partner)
@@ -107,17 +238,7 @@ class product_pricelist_improved(models.Model):
                             if qty_uom_id != seller_uom:
                                 qty_in_seller_uom = product_uom_obj._compute_qty(qty_uom_id, qty, to_uom_id=seller_uom)
                             price_uom_id = seller_uom
-                            good_pricelist = False
-                            for item in seller.pricelist_ids:
-                                if item.min_quantity <= qty_in_seller_uom:
-                                    if item.validity_date and item.validity_date <= date:
-                                        good_pricelist = item
-                                    if not item.validity_date:
-                                        if not good_pricelist or item.min_quantity != good_pricelist.min_quantity:
-                                            good_pricelist = item
-                                else:
-                                    break
-                            price = good_pricelist and good_pricelist.price or 0.0
+                            price = self._get_active_price(seller, qty_in_seller_uom, date)
                         break
                 if price_uom_id and qty_uom_id and rule_id:
                     price = product_uom_obj._compute_price(price_uom_id, price, qty_uom_id)
@@ -128,6 +249,10 @@ class product_pricelist_improved(models.Model):
 class procurement_order(models.Model):
     _inherit = 'procurement.order'
 
+    @api.multi
+    def make_po(self):
+        return super(procurement_order, self.with_context(supplier_price_memo={})).make_po()
+
     @api.model
     def _get_po_line_values_from_proc(self, procurement, partner, company, schedule_date):
         date = fields.Date.to_string(schedule_date)
@@ -211,4 +211,62 @@ class TestSupplierPriceValidity(common.TransactionCase):
         test_active(6, True, date_today)
         test_active(7, False, date_today)
         test_active(8, False, date_today)
-        test_active(9, True, date_today)
\ No newline at end of file
+        test_active(9, True, date_today)
+
+    def test_30_validity_index(self):
+
+        """Test that the validity index agrees with the active lines computation"""
+
+        supplierinfo1 = self.browse_ref('product_supplier_price_validity.supplierinfo1')
+
+        def check_index(date):
+            self.env.cr.execute("""SELECT partnerinfo_id FROM pricelist_partnerinfo_validity
+WHERE suppinfo_id = %s AND validity @> %s :: DATE""", (supplierinfo1.id, date))
+            indexed_ids = set([row[0] for row in self.env.cr.fetchall()])
+            for line in supplierinfo1.with_context(date=date).pricelist_ids:
+                self.assertEqual(line.id in indexed_ids, line.is_active())
+
+        for date in ['2013-06-01', '2015-05-04', '2016-01-01', '2017-05-04']:
+            check_index(date)
+
+        self.browse_ref('product_supplier_price_validity.pricelist2').validity_date = '2015-01-01'
+        self.env['pricelist.partnerinfo'].create({
+            'suppinfo_id': supplierinfo1.id,
+            'min_quantity': 10,
+            'validity_date': '2017-01-01',
+            'price': 10.5,
+        })
+        self.browse_ref('product_supplier_price_validity.pricelist5').unlink()
+        for date in ['2013-06-01', '2015-05-04', '2016-01-01', '2017-05-04']:
+            check_index(date)
+
+    def test_40_active_flags_update(self):
+
+        """Test the incremental update of the active flags when the date progresses"""
+
+        supplierinfo1 = self.browse_ref('product_supplier_price_validity.supplierinfo1')
+        partnerinfo_obj = self.env['pricelist.partnerinfo']
+
+        def check_flags(date):
+            for line in supplierinfo1.with_context(date=date).pricelist_ids:
+                self.assertEqual(line.active_line, line.is_active())
+
+        partnerinfo_obj.update_active_flags(full=True, date='2015-05-04')
+        check_flags('2015-05-04')
+        self.assertEqual(supplierinfo1.next_validity_transition, '2016-01-01')
+
+        # Nothing changes until the next transition
+        self.assertFalse(partnerinfo_obj.update_active_flags(date='2015-12-31'))
+
+        changed_ids = partnerinfo_obj.update_active_flags(date='2016-01-01')
+        self.assertTrue(changed_ids)
+        self.assertIn(self.ref('product_supplier_price_validity.pricelist1'), changed_ids)
+        self.assertIn(self.ref('product_supplier_price_validity.pricelist2'), changed_ids)
+        check_flags('2016-01-01')
+        self.assertTrue(not supplierinfo1.next_validity_transition or
+                        supplierinfo1.next_validity_transition > '2016-01-01')
+
+        # A second run on the same day does not touch any line
+        self.assertFalse(partnerinfo_obj.update_active_flags(date='2016-01-01'))
+        self.assertFalse(partnerinfo_obj.update_active_flags(date='2017-05-04'))
+        check_flags('2017-05-04')
@@ -33,27 +33,34 @@ class QuantitiesModificationsProcurementOrder(models.Model):
 
     @api.multi
     def compute_delivrered_ordered_quantities(self, line_uom_id):
+        if not self:
+            return 0, 0
+        self.env.cr.execute("""SELECT
+    product_uom,
+    sum(CASE WHEN state = 'done' THEN product_qty ELSE 0 END),
+    sum(CASE WHEN state != 'cancel' THEN product_qty ELSE 0 END)
+FROM procurement_order
+WHERE id IN %s
+GROUP BY product_uom""", (tuple(self.ids),))
+        return self.env['product.uom'].sum_quantities_by_uom(self.env.cr.fetchall(), line_uom_id)
+
+
+class QuantitiesModificationsProductUom(models.Model):
+    _inherit = 'product.uom'
+
+    @api.model
+    def sum_quantities_by_uom(self, rows, to_uom_id):
+        """Returns the sums of the done and not cancelled quantities of rows converted to to_uom_id.
+
+        :param rows: list of tuples (uom_id, done quantity, not cancelled quantity)
+        """
         delivered_qty = 0
         ordered_qty = 0
-        done_uom = []
-        for procurement in self:
-            if procurement.product_uom not in done_uom:
-                procurements_done_current_uom = self.search([('id', 'in', self.ids),
-                                                             ('product_uom', '=', procurement.product_uom.id),
-                                                             ('state', '=', 'done')])
-                procurements_not_cancel_current_uom = self.search([('id', 'in', self.ids),
-                                                                  ('product_uom', '=', procurement.product_uom.id),
-                                                                  ('state', '!=', 'cancel')])
-                delivered_qty += self.env['product.uom']. \
-                    _compute_qty(procurement.product_uom.id,
-                                 sum([proc.product_qty for proc in procurements_done_current_uom]),
-                                 to_uom_id=line_uom_id, round=True, rounding_method='UP')
-                ordered_qty += self.env['product.uom']. \
-                    _compute_qty(procurement.product_uom.id,
-                                 sum([proc.product_qty for proc in procurements_not_cancel_current_uom]),
-                                 to_uom_id=line_uom_id,
-                                 round=True, rounding_method='UP')
-                done_uom += [procurement.product_uom]
+        for uom_id, done_qty, not_cancel_qty in rows:
+            delivered_qty += self._compute_qty(uom_id, done_qty, to_uom_id=to_uom_id, round=True,
+                                               rounding_method='UP')
+            ordered_qty += self._compute_qty(uom_id, not_cancel_qty, to_uom_id=to_uom_id, round=True,
+                                             rounding_method='UP')
         return delivered_qty, ordered_qty
 
 
@@ -95,62 +102,94 @@ class QuantitiesModificationsSaleOrderLine(models.Model):
             'product_uom': new_uom,
             'product_uos_qty': new_qty * proc.product_uos_qty / proc.product_qty,
         })
-        new_proc.run()
+        return new_proc
+
+    @api.multi
+    def _get_procurements_quantities(self):
+        """Returns the procurement quantities of these lines, in a single grouped query.
+
+        :return: a dict {line_id: [(uom_id, done quantity, not cancelled quantity)]}
+        """
+        result = dict([(line_id, []) for line_id in self.ids])
+        if not self:
+            return result
+        self.env.cr.execute("""SELECT
+    sale_line_id,
+    product_uom,
+    sum(CASE WHEN state = 'done' THEN product_qty ELSE 0 END),
+    sum(CASE WHEN state != 'cancel' THEN product_qty ELSE 0 END)
+FROM procurement_order
+WHERE sale_line_id IN %s
+GROUP BY sale_line_id, product_uom""", (tuple(self.ids),))
+        for line_id, uom_id, done_qty, not_cancel_qty in self.env.cr.fetchall():
+            result[line_id].append((uom_id, done_qty, not_cancel_qty))
+        return result
 
     @api.multi
     def update_procurements_for_new_qty_or_uom(self, new_vals=None):
+        """Updates the procurements of these lines to match their new quantity or unit of measure.
+
+        The quantities of all the lines are fetched at once and the procurements to copy and to delete are decided
+        in memory before being applied all together."""
+        if not new_vals:
+            new_vals = {}
+        uom_obj = self.env['product.uom']
+        quantities = self._get_procurements_quantities()
+        copies = []
+        procs_to_unlink = self.env['procurement.order']
+        lines_to_unlink = self.env['sale.order.line']
         for rec in self:
-            if not new_vals:
-                new_vals = {}
-            proc_env = self.env['procurement.order']
             prec = rec.product_id.uom_id.rounding
             line_uom_id = new_vals.get('product_uom', rec.product_uom.id)
             product_uom_qty = new_vals.get('product_uom_qty', rec.product_uom_qty)
-            procs_to_unlink = False
-            delivered_qty, ordered_qty = rec.procurement_ids.compute_delivrered_ordered_quantities(line_uom_id)
+            line_procs_to_unlink = False
+            delivered_qty, ordered_qty = uom_obj.sum_quantities_by_uom(quantities[rec.id], line_uom_id)
             if rec.procurement_ids:
                 if float_compare(product_uom_qty, ordered_qty, precision_rounding=prec) > 0:
                     # If the ordered_qty is too low, we increase the qty of the first procurement.
-                    rec._copy_procurement(rec.procurement_ids[0], product_uom_qty - ordered_qty, line_uom_id)
+                    copies.append((rec.procurement_ids[0], product_uom_qty - ordered_qty, line_uom_id))
                 elif float_compare(product_uom_qty, ordered_qty, precision_rounding=prec) < 0:
                     if float_compare(product_uom_qty, delivered_qty, precision_rounding=prec) < 0:
                         raise exceptions.except_orm(_("Error!"), _("Impossible to set the line quantity lower "
                                                                    "than the delivered quantity."))
                     else:
                         # Let's remove undelivered procurements
-                        procs_to_unlink = proc_env.search([('id', 'in', rec.procurement_ids.ids),
-                                                           ('state', 'not in', ['cancel', 'done'])])
+                        line_procs_to_unlink = rec.procurement_ids. \
+                            filtered(lambda proc: proc.state not in ['cancel', 'done'])
                         # Let's create a new procurement if needed
                         if float_compare(product_uom_qty, delivered_qty, precision_rounding=prec) > 0:
-                            rec._copy_procurement(rec.procurement_ids[0], product_uom_qty - delivered_qty,
-                                                  line_uom_id)
-            if procs_to_unlink:
-                procs_to_unlink.cancel()
-                procs_to_unlink.unlink()
+                            copies.append((rec.procurement_ids[0], product_uom_qty - delivered_qty, line_uom_id))
+            if line_procs_to_unlink:
+                procs_to_unlink |= line_procs_to_unlink
             elif float_compare(product_uom_qty, 0, precision_rounding=prec) == 0:
                 # If the quantity of a line is zero, we delete the linked procurements and the line itself.
                 if any([proc.state == 'done' for proc in rec.procurement_ids]):
                     raise exceptions.except_orm(_("Error!"),
                                                 _("Impossible to cancel a procurement in state done."))
-                elif rec.procurement_ids:
-                    rec.procurement_ids.cancel()
-                    rec.procurement_ids.unlink()
-                rec.unlink()
+                procs_to_unlink |= rec.procurement_ids
+                lines_to_unlink |= rec
+        new_procs = self.env['procurement.order']
+        for proc, new_qty, new_uom in copies:
+            new_procs |= self._copy_procurement(proc, new_qty, new_uom)
+        if new_procs:
+            new_procs.run()
+        if procs_to_unlink:
+            procs_to_unlink.cancel()
+            procs_to_unlink.unlink()
+        if lines_to_unlink:
+            lines_to_unlink.unlink()
 
     @api.multi
     def write(self, vals):
         result = super(QuantitiesModificationsSaleOrderLine, self).write(vals)
         # Overwriting the 'write' function, in order to deal with a modification of the quantity of a sale order line.
         lines_to_update = self.env['sale.order.line']
+        lines_price_changed = self.env['sale.order.line']
         for rec in self:
             prec = rec.product_id.uom_id.rounding
             if rec.order_id.state not in ['draft', 'cancel', 'done']:
                 if vals.get('price_unit'):
-                    active_moves = self.env['stock.move']. \
-                        search([('product_id', '=', rec.product_id.id),
-                                ('procurement_id', 'in', rec.procurement_ids.ids),
-                                ('state', 'not in', ['draft', 'cancel', 'done'])])
-                    active_moves.write({'price_unit': vals['price_unit']})
+                    lines_price_changed |= rec
                 chg_uom_or_qty_to_not_null = bool(vals.get('product_uom') or vals.get('product_uom_qty') and
                                                   float_compare(vals['product_uom_qty'], 0,
                                                                 precision_rounding=prec) != 0)
@@ -158,6 +197,17 @@ class QuantitiesModificationsSaleOrderLine(models.Model):
                                                                                      precision_rounding=prec) == 0
                 if chg_uom_or_qty_to_not_null or set_qty_to_zero:
                     lines_to_update += rec
+        if lines_price_changed:
+            # Only the moves of the procurements of a line carrying the product of this line are updated
+            self.env.cr.execute("""SELECT sm.id
+FROM stock_move sm
+    INNER JOIN procurement_order po ON po.id = sm.procurement_id
+    INNER JOIN sale_order_line sol ON sol.id = po.sale_line_id
+WHERE sol.id IN %s AND
+      sm.product_id = sol.product_id AND
+      sm.state NOT IN ('draft', 'cancel', 'done')""", (tuple(lines_price_changed.ids),))
+            active_moves = self.env['stock.move'].browse([row[0] for row in self.env.cr.fetchall()])
+            active_moves.write({'price_unit': vals['price_unit']})
         if lines_to_update:
             lines_to_update.update_procurements_for_new_qty_or_uom(new_vals=vals)
         return result
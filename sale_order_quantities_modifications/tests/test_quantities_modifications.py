@@ -223,3 +223,53 @@ class TestQuantitiesModifications(common.TransactionCase):
         self.assertTrue(new_procurement)
         self.assertEqual(new_procurement.product_qty, 0.33)
         self.assertEqual(new_procurement.product_uom, self.dozen)
+
+    def test_40_quantities_modifications_batch(self):
+        """
+        Test that modifying all the lines of an order at once gives the same procurements as one line at a time.
+        """
+
+        sale_order2 = self.sale_order.copy()
+        self.assertEqual(len(sale_order2.order_line), len(self.sale_order.order_line))
+        self.sale_order.signal_workflow('order_confirm')
+        sale_order2.signal_workflow('order_confirm')
+
+        def get_procurements(order):
+            return sorted([(proc.product_id.id, proc.product_qty, proc.product_uom.id, proc.state)
+                           for proc in order.order_line.mapped('procurement_ids')])
+
+        for qty in [9, 3, 12, 0]:
+            for line in self.sale_order.order_line:
+                line.product_uom_qty = qty
+            sale_order2.order_line.write({'product_uom_qty': qty})
+            self.assertEqual(get_procurements(self.sale_order), get_procurements(sale_order2))
+            self.assertEqual(len(self.sale_order.order_line), len(sale_order2.order_line))
+
+    def test_50_price_unit_modification_batch(self):
+        """
+        Test that modifying the price of several lines at once only updates the moves carrying the product of their line
+        """
+
+        self.sale_order.signal_workflow('order_confirm')
+        lines = self.sale_order_line1 | self.sale_order_line2
+        move_line1 = self.env['stock.move'].search([('product_id', '=', self.product1.id),
+                                                    ('procurement_id', 'in', self.sale_order_line1.procurement_ids.ids),
+                                                    ('state', 'not in', ['draft', 'cancel', 'done'])])
+        self.assertEqual(len(move_line1), 1)
+        # A move of a component of the product of line 2, which is the product of line 1
+        procurement_line2 = self.sale_order_line2.procurement_ids[0]
+        component_move = self.env['stock.move'].create({
+            'name': "Component move (Quantities Modifications)",
+            'product_id': self.product1.id,
+            'product_uom': self.unit.id,
+            'product_uom_qty': 1,
+            'price_unit': 7.0,
+            'location_id': move_line1.location_id.id,
+            'location_dest_id': move_line1.location_dest_id.id,
+            'procurement_id': procurement_line2.id,
+        })
+        component_move.action_confirm()
+
+        lines.write({'price_unit': 2.5})
+        self.assertEqual(move_line1.price_unit, 2.5)
+        self.assertEqual(component_move.price_unit, 7.0)
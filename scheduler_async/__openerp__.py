@@ -29,6 +29,9 @@ Asynchronous Scheduler
 ======================
 This module reimplements the procurement scheduler using the 'OCA/connector' framework to be able to monitor the
 scheduler running in the background.
+
+Draft moves are confirmed by groups sharing the same procurement group, source and destination locations. The
+procurements of each group are created first and then run all together.
 """,
     'website': 'http://www.ndp-systemes.fr',
     'data': [
@@ -17,10 +17,14 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+
 from openerp import api, models
 from openerp.addons.connector.queue.job import job
 from openerp.addons.connector.session import ConnectorSession
 
+_logger = logging.getLogger(__name__)
+
 PROC_CHUNK = 100
 MOVE_CHUNK = 100
 PRODUCT_CHUNK = 100
@@ -44,27 +48,38 @@ def run_procure_orderpoint_async(session, model_name, company_id, context):
 
 @job(default_channel='root.confprocs')
 def run_or_check_procurements(session, model_name, domain, action, context):
-    """Confirm or check procurements"""
-    proc_obj = session.env[model_name].with_context(context)
+    """Confirm or check procurements
+
+    The procurements matching the domain are processed until a fixpoint is reached. Only the first iteration searches
+    all the procurements of the domain, the following ones only consider the procurements which have been created or
+    modified (or whose moves have been modified) during the previous iteration."""
+    touched_proc_ids = set()
+    ctx = dict(context, touched_procurement_ids=touched_proc_ids)
+    proc_obj = session.env[model_name].with_context(ctx)
+    procs = proc_obj.sudo().search(domain)
     prev_procs = proc_obj
-    while True:
-        procs = proc_obj.sudo().search(domain)
-        if not procs or prev_procs == procs:
-            break
-        else:
-            prev_procs = procs
+    iteration = 0
+    while procs and prev_procs != procs:
+        iteration += 1
+        _logger.info("run_or_check_procurements (%s): iteration %s, worklist of %s procurements",
+                     action, iteration, len(procs))
+        prev_procs = procs
+        touched_proc_ids.clear()
         if action == 'run':
             procs.sudo().run(autocommit=True)
         elif action == 'check':
             procs.sudo().check(autocommit=True)
         session.commit()
+        procs = proc_obj.sudo().search(domain + [('id', 'in', list(touched_proc_ids))]) if touched_proc_ids else \
+            proc_obj
+    _logger.info("run_or_check_procurements (%s): fixpoint reached after %s iterations", action, iteration)
 
 
 @job
 def confirm_moves(session, model_name, ids, context):
     """Confirm draft moves"""
     moves = session.env[model_name].with_context(context).browse(ids)
-    moves.action_confirm()
+    moves.action_confirm_grouped()
 
 
 @job(default_channel='root.asgnmoves')
@@ -117,6 +132,25 @@ class ProcurementOrderPointComputeAsync(models.TransientModel):
 class ProcurementOrderAsync(models.Model):
     _inherit = 'procurement.order'
 
+    @api.model
+    def create(self, vals):
+        res = super(ProcurementOrderAsync, self).create(vals)
+        touched_proc_ids = self.env.context.get('touched_procurement_ids')
+        if touched_proc_ids is not None:
+            touched_proc_ids.add(res.id)
+        created_proc_ids = self.env.context.get('created_procurement_ids')
+        if created_proc_ids is not None:
+            created_proc_ids.add(res.id)
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(ProcurementOrderAsync, self).write(vals)
+        touched_proc_ids = self.env.context.get('touched_procurement_ids')
+        if touched_proc_ids is not None:
+            touched_proc_ids.update(self.ids)
+        return res
+
     @api.model
     def run_confirm_moves(self):
         group_draft_moves = {}
@@ -222,3 +256,31 @@ class ProcurementOrderAsync(models.Model):
 
         # Try to assign moves
         self.run_assign_moves()
+
+
+class StockMoveAsync(models.Model):
+    _inherit = 'stock.move'
+
+    @api.multi
+    def action_confirm_grouped(self):
+        """Confirms the moves like action_confirm, but without running the created procurements one by one.
+
+        The procurements of make_to_order moves are created with procurement_autorun_defer and are then run all
+        together once every move of the group has been confirmed. Only the procurements created by the confirmation
+        are run, as action_confirm would do."""
+        created_proc_ids = set()
+        self.with_context(procurement_autorun_defer=True, created_procurement_ids=created_proc_ids).action_confirm()
+        if created_proc_ids:
+            procs = self.env['procurement.order'].search([('id', 'in', list(created_proc_ids)),
+                                                          ('state', '=', 'confirmed')])
+            procs.run()
+        return self.ids
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockMoveAsync, self).write(vals)
+        touched_proc_ids = self.env.context.get('touched_procurement_ids')
+        if touched_proc_ids is not None:
+            touched_proc_ids.update(self.mapped('procurement_id').ids)
+            touched_proc_ids.update(self.mapped('move_dest_id.procurement_id').ids)
+        return res
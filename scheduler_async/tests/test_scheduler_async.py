@@ -0,0 +1,80 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (C) 2014 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from openerp.tests import common
+
+
+class TestSchedulerAsync(common.TransactionCase):
+
+    def setUp(self):
+        super(TestSchedulerAsync, self).setUp()
+        self.product = self.browse_ref("product.product_product_27")
+        self.location_stock = self.browse_ref("stock.stock_location_stock")
+        self.location_customers = self.browse_ref("stock.stock_location_customers")
+        self.unit = self.browse_ref("product.product_uom_unit")
+        self.picking_type_id = self.ref("stock.picking_type_out")
+
+    def create_moves(self):
+        group = self.env['procurement.group'].create({'name': "Test Scheduler Async"})
+        moves = self.env['stock.move']
+        for qty, procure_method in [(5, 'make_to_stock'), (7, 'make_to_order'), (9, 'make_to_order')]:
+            moves |= self.env['stock.move'].create({
+                'name': "Test Scheduler Async",
+                'product_id': self.product.id,
+                'product_uom': self.unit.id,
+                'product_uom_qty': qty,
+                'location_id': self.location_stock.id,
+                'location_dest_id': self.location_customers.id,
+                'picking_type_id': self.picking_type_id,
+                'procure_method': procure_method,
+                'group_id': group.id,
+            })
+        return moves
+
+    def get_result(self, moves):
+        procs = self.env['procurement.order'].search([('move_dest_id', 'in', moves.ids)])
+        return (
+            [(move.product_uom_qty, move.procure_method, move.state, bool(move.picking_id)) for move in moves],
+            sorted([(proc.move_dest_id.product_uom_qty, proc.product_qty, proc.state) for proc in procs]),
+        )
+
+    def test_10_action_confirm_grouped(self):
+        """Grouped confirmation should give the same result as action_confirm."""
+        moves_ref = self.create_moves()
+        moves_ref.action_confirm()
+        moves_grouped = self.create_moves()
+        moves_grouped.action_confirm_grouped()
+        self.assertEqual(self.get_result(moves_grouped), self.get_result(moves_ref))
+        self.assertEqual(len(self.env['procurement.order'].search([('move_dest_id', 'in', moves_grouped.ids)])), 2)
+
+    def test_20_action_confirm_grouped_existing_procurement(self):
+        """Grouped confirmation should not run the procurements which existed before the confirmation."""
+        proc = self.env['procurement.order'].with_context(procurement_autorun_defer=True).create({
+            'name': "Test Scheduler Async",
+            'product_id': self.product.id,
+            'product_qty': 21,
+            'product_uom': self.unit.id,
+            'location_id': self.location_customers.id,
+        })
+        self.assertEqual(proc.state, 'confirmed')
+        moves = self.create_moves()
+        moves.write({'procurement_id': proc.id})
+        moves.action_confirm_grouped()
+        self.assertEqual(proc.state, 'confirmed')
+        self.assertEqual(len(self.env['procurement.order'].search([('move_dest_id', 'in', moves.ids)])), 2)
@@ -29,6 +29,9 @@ Stock No Recompute Check
 ========================
 This module removes the use of the recompute_pack_op field on stock pickings
 so that parallel processing of stock moves can be performed without locking.
+
+It also provides quants_reserve_batch and quants_unreserve_batch on stock.quant to (un)reserve whole quants for
+many moves at once.
 """,
     'website': 'http://www.ndp-systemes.fr',
     'data': [],
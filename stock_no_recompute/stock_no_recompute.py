@@ -29,7 +29,6 @@ class StockQuant(models.Model):
     def quants_reserve(self, quants, move, link=False):
         """Overridden here to remove recompute_pack_op modification"""
         toreserve = self.env['stock.quant']
-        reserved_availability = move.reserved_availability
         # split quants if needed
         for quant, qty in quants:
             if qty <= 0.0 or (quant and quant.qty <= 0.0):
@@ -38,24 +37,76 @@ class StockQuant(models.Model):
                 continue
             self._quant_split(quant, qty)
             toreserve |= quant
-            reserved_availability += quant.qty
-        # reserve quants
-        toreserve.sudo().write({'reservation_id': move.id})
-        # check if move'state needs to be set as 'assigned'
-        rounding = move.product_id.uom_id.rounding
-        if float_compare(reserved_availability, move.product_qty, precision_rounding=rounding) == 0 and \
-                move.state in ('confirmed', 'waiting'):
-            move.state = 'assigned'
-        elif float_compare(reserved_availability, 0, precision_rounding=rounding) > 0 and not move.partially_available:
-            move.partially_available = True
+        # reserve quants and check if move'state needs to be set as 'assigned'
+        self.quants_reserve_batch([(quant.id, move.id) for quant in toreserve])
 
     @api.model
     def quants_unreserve(self, move):
-        related_quants = move.reserved_quant_ids
-        if related_quants:
-            if move.partially_available:
-                move.partially_available = False
-            related_quants.sudo().write({'reservation_id': False})
+        self.quants_unreserve_batch(move)
+
+    @api.model
+    def quants_reserve_batch(self, reservations):
+        """Reserves whole quants for moves in batch.
+
+        :param reservations: list of (quant_id, move_id) tuples. Quants are reserved entirely, they are not split.
+        Reservations are applied with a single UPDATE statement and the states of the moves are then updated in bulk.
+        quants_reserve calls it for a single move, once the quants are split.
+        """
+        if not reservations:
+            return
+        quant_ids = [quant_id for quant_id, move_id in reservations]
+        self.env.cr.execute("""SELECT id FROM stock_quant WHERE id IN %s AND qty <= 0 LIMIT 1""", (tuple(quant_ids),))
+        if self.env.cr.fetchone():
+            raise osv.except_osv(_('Error!'), _('You can not reserve a negative quantity or a negative quant.'))
+        values = ", ".join([self.env.cr.mogrify("(%s, %s)", (quant_id, move_id)) for quant_id, move_id in reservations])
+        self.env.cr.execute("""UPDATE stock_quant sq
+SET reservation_id = v.move_id, write_uid = %%s, write_date = (NOW() AT TIME ZONE 'UTC')
+FROM (VALUES %s) AS v (quant_id, move_id)
+WHERE sq.id = v.quant_id""" % values, (self.env.uid,))
+        self.invalidate_cache(['reservation_id'], quant_ids)
+        move_ids = list(set([move_id for quant_id, move_id in reservations]))
+        self.env['stock.move'].invalidate_cache(['reserved_quant_ids'], move_ids)
+        self.env.cr.execute("""SELECT sm.id, sm.state, sm.partially_available, sm.product_qty, pu.rounding,
+  COALESCE(sum(sq.qty), 0) AS reserved_availability
+FROM stock_move sm
+  INNER JOIN product_product pp ON pp.id = sm.product_id
+  INNER JOIN product_template pt ON pt.id = pp.product_tmpl_id
+  INNER JOIN product_uom pu ON pu.id = pt.uom_id
+  LEFT JOIN stock_quant sq ON sq.reservation_id = sm.id
+WHERE sm.id IN %s
+GROUP BY sm.id, sm.state, sm.partially_available, sm.product_qty, pu.rounding""", (tuple(move_ids),))
+        assigned_move_ids = []
+        partially_available_move_ids = []
+        for move in self.env.cr.dictfetchall():
+            if float_compare(move['reserved_availability'], move['product_qty'],
+                             precision_rounding=move['rounding']) == 0 and move['state'] in ('confirmed', 'waiting'):
+                assigned_move_ids += [move['id']]
+            elif float_compare(move['reserved_availability'], 0, precision_rounding=move['rounding']) > 0 and \
+                    not move['partially_available']:
+                partially_available_move_ids += [move['id']]
+        if assigned_move_ids:
+            self.env['stock.move'].browse(assigned_move_ids).write({'state': 'assigned'})
+        if partially_available_move_ids:
+            self.env['stock.move'].browse(partially_available_move_ids).write({'partially_available': True})
+
+    @api.model
+    def quants_unreserve_batch(self, moves):
+        """Unreserves all the quants of the given moves with a single UPDATE statement. quants_unreserve calls it for
+        a single move."""
+        if not moves:
+            return
+        self.env.cr.execute("""SELECT DISTINCT reservation_id FROM stock_quant WHERE reservation_id IN %s""",
+                            (tuple(moves.ids),))
+        reserved_moves = moves.browse([row[0] for row in self.env.cr.fetchall()])
+        if not reserved_moves:
+            return
+        self.env.cr.execute("""UPDATE stock_quant
+SET reservation_id = NULL, write_uid = %s, write_date = (NOW() AT TIME ZONE 'UTC')
+WHERE reservation_id IN %s
+RETURNING id""", (self.env.uid, tuple(reserved_moves.ids)))
+        self.invalidate_cache(['reservation_id'], [row[0] for row in self.env.cr.fetchall()])
+        reserved_moves.invalidate_cache(['reserved_quant_ids'], reserved_moves.ids)
+        reserved_moves.filtered(lambda move: move.partially_available).write({'partially_available': False})
 
 
 class StockPicking(models.Model):
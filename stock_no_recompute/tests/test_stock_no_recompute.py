@@ -0,0 +1,91 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (C) 2017 NDP Systèmes (<http://www.ndp-systemes.fr>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from openerp.tests import common
+
+
+class TestStockNoRecompute(common.TransactionCase):
+
+    def setUp(self):
+        super(TestStockNoRecompute, self).setUp()
+        self.location_stock = self.browse_ref('stock.stock_location_stock')
+        self.location_customers = self.browse_ref('stock.stock_location_customers')
+        self.product = self.env['product.product'].create({
+            'name': "Test product (stock no recompute)",
+            'type': 'product',
+        })
+        self.quants = self.env['stock.quant']
+        for qty in [5, 3, 4]:
+            self.quants |= self.env['stock.quant'].create({
+                'product_id': self.product.id,
+                'location_id': self.location_stock.id,
+                'qty': qty,
+            })
+        self.moves = self.env['stock.move']
+        for qty in [8, 10]:
+            self.moves |= self.env['stock.move'].create({
+                'name': "Test move (stock no recompute)",
+                'product_id': self.product.id,
+                'product_uom': self.product.uom_id.id,
+                'product_uom_qty': qty,
+                'location_id': self.location_stock.id,
+                'location_dest_id': self.location_customers.id,
+            })
+        self.moves.action_confirm()
+
+    def get_results(self):
+        self.env.invalidate_all()
+        return ([(quant.id, quant.qty, quant.reservation_id.id) for quant in self.quants],
+                [(move.id, move.state, move.partially_available, move.reserved_availability) for move in self.moves])
+
+    def test_10_reserve_batch(self):
+        """Reserving in batch gives the same result as reserving move by move."""
+        quant_1, quant_2, quant_3 = self.quants
+        move_1, move_2 = self.moves
+
+        self.env.cr.execute("""SAVEPOINT test_10_reserve_batch""")
+        self.env['stock.quant'].quants_reserve([(quant_1, 5), (quant_2, 3)], move_1)
+        self.env['stock.quant'].quants_reserve([(quant_3, 4)], move_2)
+        reserved_results = self.get_results()
+        self.env['stock.quant'].quants_unreserve(move_1)
+        self.env['stock.quant'].quants_unreserve(move_2)
+        unreserved_results = self.get_results()
+        self.env.cr.execute("""ROLLBACK TO SAVEPOINT test_10_reserve_batch""")
+        self.env.invalidate_all()
+
+        self.env['stock.quant'].quants_reserve_batch([(quant_1.id, move_1.id), (quant_2.id, move_1.id),
+                                                      (quant_3.id, move_2.id)])
+        self.assertEqual(self.get_results(), reserved_results)
+        self.assertEqual(move_1.state, 'assigned')
+        self.assertEqual(move_2.state, 'confirmed')
+        self.assertTrue(move_2.partially_available)
+        self.env['stock.quant'].quants_unreserve_batch(self.moves)
+        self.assertEqual(self.get_results(), unreserved_results)
+        self.assertFalse(move_2.partially_available)
+
+    def test_20_reserve_split_quant(self):
+        """Reserving a part of a quant splits it, and only the reserved part is linked to the move."""
+        quant_1 = self.quants[0]
+        move_1 = self.moves[0]
+        self.env['stock.quant'].quants_reserve([(quant_1, 2)], move_1)
+        self.assertEqual(quant_1.qty, 2)
+        self.assertEqual(quant_1.reservation_id, move_1)
+        self.assertEqual(move_1.reserved_quant_ids, quant_1)
+        self.assertTrue(move_1.partially_available)
+        self.assertEqual(move_1.state, 'confirmed')
@@ -269,6 +269,31 @@ FROM (
                AND sm.defer_picking_assign = FALSE
      ) foo"""
 
+SQL_INVENTORY_LINES_DIFFERENCES = """
+SELECT
+    sil.id,
+    sil.theoretical_qty - sil.product_qty AS diff
+FROM stock_inventory_line sil
+WHERE sil.id IN %s
+      AND sil.theoretical_qty != sil.product_qty
+ORDER BY sil.location_id, sil.package_id NULLS FIRST, sil.prod_lot_id NULLS FIRST, sil.id"""
+
+SQL_INVENTORY_LINES_RESERVATIONS = """
+SELECT
+    sil.id,
+    COALESCE(sum(CASE WHEN sq.reservation_id IS NULL
+        THEN sq.qty
+                 ELSE 0 END), 0)              AS not_reserved_qty,
+    array_agg(DISTINCT sq.reservation_id) AS reservation_ids
+FROM stock_inventory_line sil
+    LEFT JOIN stock_quant sq ON sq.product_id = sil.product_id
+                                AND sq.location_id = sil.location_id
+                                AND sq.package_id IS NOT DISTINCT FROM sil.package_id
+                                AND sq.lot_id IS NOT DISTINCT FROM sil.prod_lot_id
+                                AND sq.qty > 0
+WHERE sil.id IN %s
+GROUP BY sil.id"""
+
 
 class StockQuantPackageImproved(models.Model):
     _inherit = "stock.quant.package"
@@ -1215,6 +1240,11 @@ class StockInventoryLine(models.Model):
 
     @api.model
     def _resolve_inventory_line(self, inventory_line):
+        lines_to_resolve = self.env.context.get('inventory_lines_to_resolve')
+        if lines_to_resolve is not None:
+            # The line is resolved in bulk by StockInventory.action_check
+            lines_to_resolve.append(inventory_line)
+            return False
         if float_compare(inventory_line.theoretical_qty, inventory_line.product_qty,
                          precision_rounding=inventory_line.product_id.uom_id.rounding) > 0:
             domain = [('qty', '>', 0.0), ('package_id', '=', inventory_line.package_id.id),
@@ -1232,3 +1262,143 @@ class StockInventoryLine(models.Model):
                 if moves_to_unreserve:
                     moves_to_unreserve.do_unreserve()
         return super(StockInventoryLine, self)._resolve_inventory_line(inventory_line)
+
+    @api.model
+    def _prepare_inventory_move(self, inventory_line, diff):
+        """Returns the values of the adjustment move of the given inventory line, as _resolve_inventory_line does."""
+        inventory = inventory_line.inventory_id
+        inventory_location = inventory_line.product_id.property_stock_inventory
+        vals = {
+            'name': _('INV:') + (inventory.name or ''),
+            'product_id': inventory_line.product_id.id,
+            'product_uom': inventory_line.product_uom_id.id,
+            'date': inventory.date,
+            'company_id': inventory.company_id.id,
+            'inventory_id': inventory.id,
+            'state': 'confirmed',
+            'restrict_lot_id': inventory_line.prod_lot_id.id,
+            'restrict_partner_id': inventory_line.partner_id.id,
+        }
+        if diff < 0:
+            vals.update({
+                'location_id': inventory_location.id,
+                'location_dest_id': inventory_line.location_id.id,
+                'product_uom_qty': -diff,
+            })
+        else:
+            vals.update({
+                'location_id': inventory_line.location_id.id,
+                'location_dest_id': inventory_location.id,
+                'product_uom_qty': diff,
+            })
+        return vals
+
+    @api.model
+    def _unreserve_for_inventory_lines(self, inventory_lines, differences):
+        """Unreserves in one call the moves which prevent the given lines from taking their quants out of stock."""
+        lines_to_check = inventory_lines.filtered(lambda line: differences.get(line.id, 0) > 0)
+        if not lines_to_check:
+            return
+        lines = {line.id: line for line in lines_to_check}
+        self.env.cr.execute(SQL_INVENTORY_LINES_RESERVATIONS, (tuple(lines_to_check.ids),))
+        move_ids = set()
+        for line_id, not_reserved_qty, reservation_ids in self.env.cr.fetchall():
+            if float_compare(not_reserved_qty, differences[line_id],
+                             precision_rounding=lines[line_id].product_id.uom_id.rounding) < 0:
+                move_ids |= set([move_id for move_id in reservation_ids if move_id])
+        if move_ids:
+            self.env['stock.move'].browse(list(move_ids)).do_unreserve()
+
+    @api.model
+    def _done_package_inventory_moves(self, package_moves):
+        """Processes the given moves in one call, then puts their quants in the package of their inventory line.
+
+        :param package_moves: dict {stock.move: stock.quant.package}
+        """
+        moves = self.env['stock.move']
+        for move in package_moves:
+            moves |= move
+        moves.action_done()
+        quants_by_package = {}
+        for move, package in package_moves.iteritems():
+            quants_by_package.setdefault(package, self.env['stock.quant'])
+            quants_by_package[package] |= move.quant_ids
+        for package, quants in quants_by_package.iteritems():
+            # Stock users can not write on quants, _resolve_inventory_line does this write as superuser too
+            quants.sudo().write({'package_id': package.id})
+        negative_quants = self.env['stock.quant'].search([('qty', '<', 0.0),
+                                                          ('product_id', 'in', moves.mapped('product_id').ids),
+                                                          ('location_id', 'in', moves.mapped('location_dest_id').ids),
+                                                          ('package_id', '!=', False)])
+        negative_keys = set([(quant.product_id, quant.location_id) for quant in negative_quants])
+        for move in moves:
+            if (move.product_id, move.location_dest_id) not in negative_keys:
+                continue
+            for quant in move.quant_ids:
+                # To avoid taking a quant that was already reconciled
+                if quant.location_id == move.location_dest_id:
+                    self.env['stock.quant']._quant_reconcile_negative(quant, move)
+
+    @api.model
+    def resolve_inventory_lines(self, inventory_lines):
+        """Bulk version of _resolve_inventory_line.
+
+        The differences of all the lines are computed in one query and the moves are created grouped by location,
+        package and lot. The moves of the lines with a package whose quantity increases are processed in a single
+        action_done call, the other ones are left to the posting of the inventory.
+        Returns the created moves."""
+        moves = self.env['stock.move']
+        if not inventory_lines:
+            return moves
+        self.env.cr.execute(SQL_INVENTORY_LINES_DIFFERENCES, (tuple(inventory_lines.ids),))
+        differences = self.env.cr.fetchall()
+        self._unreserve_for_inventory_lines(inventory_lines, dict(differences))
+        lines = {line.id: line for line in inventory_lines}
+        package_moves = {}
+        for line_id, diff in differences:
+            line = lines[line_id]
+            move = self.env['stock.move'].create(self._prepare_inventory_move(line, diff))
+            moves |= move
+            if diff > 0:
+                domain = [('qty', '>', 0.0), ('package_id', '=', line.package_id.id),
+                          ('lot_id', '=', line.prod_lot_id.id), ('location_id', '=', line.location_id.id)]
+                preferred_domain_list = [[('reservation_id', '=', False)],
+                                         [('reservation_id.inventory_id', '!=', line.inventory_id.id)]]
+                quants = self.env['stock.quant'].quants_get_prefered_domain(
+                    move.location_id, move.product_id, move.product_qty, domain=domain,
+                    prefered_domain_list=preferred_domain_list, restrict_partner_id=move.restrict_partner_id.id)
+                self.env['stock.quant'].quants_reserve(quants, move)
+            elif line.package_id:
+                package_moves[move] = line.package_id
+        if package_moves:
+            self._done_package_inventory_moves(package_moves)
+        return moves
+
+
+class StockInventory(models.Model):
+    _inherit = 'stock.inventory'
+
+    @api.multi
+    def action_check(self):
+        """If the context key 'bulk_inventory_resolution' is set, the lines are resolved with resolve_inventory_lines
+        instead of line by line. The overrides of action_check still apply, but not those of _resolve_inventory_line:
+        the lines are only collected by the call to _resolve_inventory_line of this module. action_done sets this key
+        unless it is explicitly set to False."""
+        if not self.env.context.get('bulk_inventory_resolution'):
+            return super(StockInventory, self).action_check()
+        lines_to_resolve = []
+        result = super(StockInventory, self.with_context(inventory_lines_to_resolve=lines_to_resolve)).action_check()
+        if lines_to_resolve:
+            # The lines are resolved with the environment they were collected in, which may have been elevated
+            lines = lines_to_resolve[0].with_context(inventory_lines_to_resolve=None). \
+                browse([line.id for line in lines_to_resolve])
+            lines.env['stock.inventory.line'].resolve_inventory_lines(lines)
+        return result
+
+    @api.multi
+    def action_done(self):
+        """Validates the inventories resolving their lines in bulk, unless the context key 'bulk_inventory_resolution'
+        is set to False."""
+        bulk_inventory_resolution = self.env.context.get('bulk_inventory_resolution', True)
+        return super(StockInventory, self.with_context(bulk_inventory_resolution=bulk_inventory_resolution)). \
+            action_done()
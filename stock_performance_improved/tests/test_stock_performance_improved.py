@@ -315,6 +315,82 @@ class TestStockPerformanceImproved(common.TransactionCase):
         self.assertEqual(new_quant.qty, 10)
         self.assertEqual(new_quant.lot_id, self.lot1)
 
+    def test_46_bulk_inventory_resolution(self):
+        """
+        Resolving the inventory lines in bulk gives the same result as resolving them line by line.
+        """
+        self.inventory.prepare_inventory()
+
+        move = self.env['stock.move'].create({
+            'name': "Test Move",
+            'product_id': self.product_fix_reserved_moves.id,
+            'product_uom_qty': 10,
+            'product_uom': self.product_uom_unit_id,
+            'location_id': self.stock.id,
+            'location_dest_id': self.customer.id,
+        })
+        move.action_confirm()
+        move.action_assign()
+        self.assertEqual(move.state, 'assigned')
+
+        line_package1 = self.inventory.line_ids.filtered(lambda line: line.package_id == self.package1)
+        line_package2 = self.inventory.line_ids.filtered(lambda line: line.package_id == self.package2)
+        self.assertEqual(len(line_package1), 1)
+        self.assertEqual(len(line_package2), 1)
+        line_package1.product_qty = 0
+        line_package2.product_qty = 30
+
+        def get_results():
+            inventory_moves = sorted([(m.product_id.id, m.location_id.id, m.location_dest_id.id, m.product_uom_qty,
+                                       m.restrict_lot_id.id, m.state) for m in self.inventory.move_ids])
+            quantities = {}
+            for quant in self.env['stock.quant'].search([('product_id', '=', self.product_fix_reserved_moves.id)]):
+                key = (quant.location_id.id, quant.package_id.id, quant.lot_id.id, quant.reservation_id.id)
+                quantities[key] = quantities.get(key, 0) + quant.qty
+            return inventory_moves, quantities, move.state
+
+        self.env.cr.execute("""SAVEPOINT test_46_bulk_inventory_resolution""")
+        for line in self.inventory.line_ids:
+            self.env['stock.inventory.line']._resolve_inventory_line(line)
+        self.env['stock.inventory'].post_inventory(self.inventory)
+        per_line_results = get_results()
+        self.env.cr.execute("""ROLLBACK TO SAVEPOINT test_46_bulk_inventory_resolution""")
+        self.env.invalidate_all()
+
+        self.assertFalse(self.inventory.move_ids)
+        self.inventory.with_context(bulk_inventory_resolution=True).action_check()
+        self.assertEqual(len(self.inventory.move_ids), 2)
+        self.env['stock.inventory'].post_inventory(self.inventory)
+        self.assertEqual(get_results(), per_line_results)
+
+    def test_47_bulk_inventory_resolution_stock_user(self):
+        """
+        Validating an inventory with packages as a stock user, who can not write on quants.
+        """
+        stock_user = self.env['res.users'].create({
+            'name': "Stock user (stock performance improved)",
+            'login': 'stock_performance_improved_user',
+            'groups_id': [(6, 0, [self.ref('stock.group_stock_user')])],
+        })
+        self.assertNotIn(self.browse_ref('stock.group_stock_manager'), stock_user.groups_id)
+        inventory = self.inventory.sudo(stock_user)
+        inventory.prepare_inventory()
+        line_package1 = inventory.line_ids.filtered(lambda line: line.package_id == self.package1)
+        line_package2 = inventory.line_ids.filtered(lambda line: line.package_id == self.package2)
+        line_package1.product_qty = 0
+        line_package2.product_qty = 30
+        # action_done resolves the lines in bulk unless told otherwise
+        inventory.action_done()
+
+        self.assertEqual(self.inventory.state, 'done')
+        self.assertFalse(self.package1.quant_ids)
+        self.assertEqual(self.quant1.location_id, self.location_inv)
+        self.assertEqual(sum([quant.qty for quant in self.package2.quant_ids]), 30)
+        new_quant = self.package2.quant_ids.filtered(lambda quant: quant not in self.existing_quants)
+        self.assertTrue(new_quant)
+        self.assertEqual(new_quant.qty, 10)
+        self.assertEqual(new_quant.lot_id, self.lot1)
+
     def test_50_inventory_reserved_moves_bis(self):
         """
         Transferring a reserved quant from a package to another in the same location using stock inventory.
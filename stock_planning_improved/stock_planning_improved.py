@@ -17,8 +17,17 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+
 from openerp import fields, models, api
 
+_logger = logging.getLogger(__name__)
+
+# Maximum number of procurements rescheduled by a single date propagation
+DATE_PROPAGATION_BUDGET = 10000
+# Maximum depth of the chains of procurements fetched in advance when propagating dates
+DATE_PROPAGATION_MAX_DEPTH = 100
+
 
 class procurement_order_planning_improved(models.Model):
     _inherit = 'procurement.order'
@@ -56,11 +65,89 @@ class stock_move_planning_improved(models.Model):
     def create(self, vals):
         if (not 'date_expected' in vals) and ('date' in vals):
             vals['date_expected'] = vals['date']
-        return super(stock_move_planning_improved, self).create(vals)
+        result = super(stock_move_planning_improved, self).create(vals)
+        if vals.get('picking_id'):
+            self.env['stock.picking'].mark_date_due_dirty([vals['picking_id']])
+        return result
+
+    @api.model
+    def _get_procurements_to_reschedule(self, move_ids):
+        """Returns a dict {move_id: procurement_id} giving the running procurement having each move as destination, for
+        the given moves and all the make_to_order moves upstream of them, fetched with a single recursive query."""
+        if not move_ids:
+            return {}
+        self.env.cr.execute("""WITH RECURSIVE propagation AS (
+    SELECT
+        sm.id AS move_id,
+        0     AS depth
+    FROM stock_move sm
+    WHERE sm.id IN %s
+    UNION
+    SELECT
+        upstream.id,
+        propagation.depth + 1
+    FROM propagation
+        INNER JOIN procurement_order po ON po.move_dest_id = propagation.move_id AND
+                                           po.state NOT IN ('done', 'cancel')
+        INNER JOIN stock_move upstream ON upstream.procurement_id = po.id AND
+                                          upstream.procure_method = 'make_to_order'
+    WHERE propagation.depth < %s)
+
+SELECT DISTINCT ON (po.move_dest_id)
+    po.move_dest_id,
+    po.id
+FROM procurement_order po
+WHERE po.move_dest_id IN (SELECT move_id FROM propagation) AND
+      po.state NOT IN ('done', 'cancel')
+ORDER BY po.move_dest_id, po.priority DESC, po.date_planned ASC, po.id ASC""",
+                            (tuple(move_ids), DATE_PROPAGATION_MAX_DEPTH))
+        return dict(self.env.cr.fetchall())
+
+    @api.multi
+    def propagate_date(self, date):
+        """Propagates the given due date to the procurements of which the moves are the destination, and further
+        upstream.
+
+        Instead of recursing through write and action_reschedule, the procurements are rescheduled level by level: the
+        moves rescheduled by a level are queued in the context and processed by the next one. Procurements sharing the
+        same new date are written together. Each procurement is rescheduled at most once to prevent cycles and the
+        total number of rescheduled procurements is bounded by the date_propagation_budget context key."""
+        budget = self.env.context.get('date_propagation_budget', DATE_PROPAGATION_BUDGET)
+        propagation = {'pending': [(self.ids, date)]}
+        proc_by_move = self._get_procurements_to_reschedule(self.ids)
+        visited_proc_ids = set()
+        proc_env = self.env['procurement.order'].with_context(date_propagation=propagation)
+        level = 0
+        while propagation['pending']:
+            level += 1
+            pending, propagation['pending'] = propagation['pending'], []
+            unknown_move_ids = [move_id for move_ids, move_date in pending for move_id in move_ids
+                                if move_id not in proc_by_move]
+            if unknown_move_ids:
+                proc_by_move.update({move_id: False for move_id in unknown_move_ids})
+                proc_by_move.update(self._get_procurements_to_reschedule(unknown_move_ids))
+            proc_ids_by_date = {}
+            for move_ids, move_date in pending:
+                for move_id in move_ids:
+                    proc_id = proc_by_move[move_id]
+                    if proc_id and proc_id not in visited_proc_ids:
+                        visited_proc_ids.add(proc_id)
+                        proc_ids_by_date.setdefault(move_date, []).append(proc_id)
+            nb_procs = sum([len(proc_ids) for proc_ids in proc_ids_by_date.values()])
+            if nb_procs > budget:
+                _logger.warning("Date propagation budget exceeded at level %s, %s procurements not rescheduled",
+                                level, nb_procs)
+                return
+            budget -= nb_procs
+            for proc_date, proc_ids in proc_ids_by_date.items():
+                procs = proc_env.browse(proc_ids)
+                procs.write({'date_planned': proc_date})
+                procs.action_reschedule()
 
     @api.multi
     def write(self, vals):
         """Write function overridden to propagate date to previous procurement orders."""
+        moves_to_propagate = self.env['stock.move']
         for move in self:
             if vals.get('date') and vals.get('state') == 'done':
                 # If the call is made from action_done, set the date_expected to the done date
@@ -69,12 +156,34 @@ class stock_move_planning_improved(models.Model):
                 # del vals['date']
             elif vals.get('date') and move.procure_method == 'make_to_order':
                 # If the date is changed and moves are chained, propagate to the previous procurement if any
-                proc = self.env['procurement.order'].search([('move_dest_id', '=', move.id),
-                                                             ('state', 'not in', ['done', 'cancel'])], limit=1)
-                if proc and not self.env.context.get('do_not_propagate_rescheduling'):
-                    proc.date_planned = vals.get('date')
-                    proc.action_reschedule()
-        return super(stock_move_planning_improved, self).write(vals)
+                moves_to_propagate |= move
+        if moves_to_propagate and not self.env.context.get('do_not_propagate_rescheduling'):
+            propagation = self.env.context.get('date_propagation')
+            if propagation is not None:
+                # We are inside a propagation, the moves are rescheduled by its next level
+                propagation['pending'].append((moves_to_propagate.ids, vals['date']))
+            else:
+                moves_to_propagate.propagate_date(vals['date'])
+        if 'date' in vals or 'state' in vals or 'picking_id' in vals:
+            self.mark_date_due_dirty()
+        result = super(stock_move_planning_improved, self).write(vals)
+        if vals.get('picking_id'):
+            self.env['stock.picking'].mark_date_due_dirty([vals['picking_id']])
+        return result
+
+    @api.multi
+    def unlink(self):
+        self.mark_date_due_dirty()
+        return super(stock_move_planning_improved, self).unlink()
+
+    @api.multi
+    def mark_date_due_dirty(self):
+        """Marks the pickings of these moves so that their due date is recomputed by the next compute_date_due_auto."""
+        if not self.ids:
+            return
+        self.env.cr.execute("""SELECT DISTINCT picking_id FROM stock_move WHERE id IN %s AND picking_id IS NOT NULL""",
+                            (tuple(self.ids),))
+        self.env['stock.picking'].mark_date_due_dirty([row[0] for row in self.env.cr.fetchall()])
 
 
 class stock_picking_planning_improved(models.Model):
@@ -101,7 +210,58 @@ class stock_picking_planning_improved(models.Model):
         for picking in self:
             picking.date_due = dates.get(picking.id, False)
 
+    def _auto_init(self, cr, context=None):
+        res = super(stock_picking_planning_improved, self)._auto_init(cr, context)
+        cr.execute("""CREATE TABLE IF NOT EXISTS stock_picking_date_due_dirty (picking_id INTEGER NOT NULL)""")
+        cr.execute("""SELECT 1 FROM pg_indexes WHERE indexname = %s""",
+                   ('stock_picking_date_due_dirty_picking_id_index',))
+        if not cr.fetchone():
+            cr.execute("""CREATE INDEX stock_picking_date_due_dirty_picking_id_index
+ON stock_picking_date_due_dirty (picking_id)""")
+        return res
+
     @api.model
-    def compute_date_due_auto(self):
-        pickings = self.search([('state', 'not in', ['cancel', 'done'])])
-        pickings.compute_date_due()
+    def mark_date_due_dirty(self, picking_ids):
+        """Marks the given pickings so that their due date is recomputed by the next compute_date_due_auto. The
+        pickings already marked are skipped."""
+        if picking_ids:
+            self.env.cr.execute("""INSERT INTO stock_picking_date_due_dirty (picking_id)
+    SELECT marked.picking_id
+    FROM unnest(%s::INTEGER[]) AS marked(picking_id)
+    WHERE NOT exists(SELECT 1 FROM stock_picking_date_due_dirty dirty WHERE dirty.picking_id = marked.picking_id)""",
+                                (list(set(picking_ids)),))
+
+    @api.model
+    def compute_date_due_auto(self, full=False):
+        """Recomputes the due date of the open pickings whose moves dates or states changed since the last run.
+
+        :param full: if True, recomputes the due date of all the open pickings instead. This is useful to recover from
+        pickings modified outside of the ORM."""
+        cr = self.env.cr
+        cr.execute("""DELETE FROM stock_picking_date_due_dirty RETURNING picking_id""")
+        dirty_picking_ids = list(set([row[0] for row in cr.fetchall()]))
+        if not full and not dirty_picking_ids:
+            return
+        picking_filter = ""
+        params = ()
+        if not full:
+            picking_filter = "AND sp.id IN %s"
+            params = (tuple(dirty_picking_ids),)
+        cr.execute("""WITH picking_dates AS (
+    SELECT
+        sp.id        AS picking_id,
+        min(sm.date) AS date_due
+    FROM stock_picking sp
+        LEFT JOIN stock_move sm ON sm.picking_id = sp.id
+    WHERE sp.state NOT IN ('cancel', 'done') %s
+    GROUP BY sp.id)
+
+UPDATE stock_picking sp
+SET date_due = picking_dates.date_due
+FROM picking_dates
+WHERE sp.id = picking_dates.picking_id AND
+      sp.date_due IS DISTINCT FROM picking_dates.date_due
+RETURNING sp.id""" % picking_filter, params)
+        updated_picking_ids = [row[0] for row in cr.fetchall()]
+        self.invalidate_cache(['date_due'], updated_picking_ids)
+        _logger.info("Due date recomputed on %s pickings", len(updated_picking_ids))
@@ -86,6 +86,30 @@ class TestStockPlanningImproved(common.TransactionCase):
         self.assertEqual(proc2.move_dest_id.date_expected[0:10], "2015-01-30")
         self.assertEqual(proc2.move_dest_id.date[0:10], "2015-02-05")
 
+    def test_15_planning_improved_propagation_budget(self):
+        """Check that date propagation stops when its budget is exceeded."""
+        proc_env = self.env["procurement.order"]
+        proc = proc_env.create({
+            'name': 'Test Stock Schedule',
+            'date_planned': '2015-02-02 00:00:00',
+            'product_id': self.test_product.id,
+            'product_qty': 10,
+            'product_uom': self.product_uom_unit_id,
+            'warehouse_id': self.ref('stock.warehouse0'),
+            'location_id': self.location_c.id
+        })
+        proc.run()
+        proc.check()
+        proc2 = proc_env.search([('move_dest_id', '=', proc.move_ids[0].id)])
+        self.assertEqual(proc2.date_planned[0:10], '2015-01-28')
+        procs_to_reschedule = proc.move_ids._get_procurements_to_reschedule(proc.move_ids.ids)
+        self.assertEqual(procs_to_reschedule.get(proc.move_ids[0].id), proc2.id)
+
+        proc.move_ids.with_context(date_propagation_budget=0).write({'date': '2015-02-05 10:00:00'})
+        self.assertEqual(proc2.date_planned[0:10], '2015-01-28')
+        proc.move_ids.write({'date': '2015-02-05 10:00:00'})
+        self.assertEqual(proc2.date_planned[0:10], '2015-02-05')
+
     def test_20_check_action_done(self):
         """Check the dates when the moves are done."""
         proc_env = self.env["procurement.order"]
@@ -136,3 +160,64 @@ class TestStockPlanningImproved(common.TransactionCase):
         for move in proc.move_ids:
             self.assertEqual(move.date[0:10], fields.Date.today())
             self.assertEqual(move.date_expected[0:10], fields.Date.today())
+
+    def test_30_compute_date_due_auto(self):
+        """Check the incremental computation of pickings' due dates."""
+        move = self.env["stock.move"].create({
+            'name': "Test Date Due",
+            'product_id': self.test_product.id,
+            'product_uom': self.product_uom_unit_id,
+            'product_uom_qty': 5,
+            'date': '2015-02-02 10:00:00',
+            'location_id': self.location_a.id,
+            'location_dest_id': self.location_b.id,
+            'picking_type_id': self.ref('stock.picking_type_internal'),
+        })
+        move.action_confirm()
+        picking = move.picking_id
+        self.assertTrue(picking)
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-02 10:00:00')
+
+        move.date = '2015-02-05 10:00:00'
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-05 10:00:00')
+
+        # Modifications made outside of the ORM are only taken into account by the full mode
+        self.env.cr.execute("""UPDATE stock_move SET date = '2015-02-07 10:00:00' WHERE id = %s""", (move.id,))
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-05 10:00:00')
+        self.env['stock.picking'].compute_date_due_auto(full=True)
+        self.assertEqual(picking.date_due, '2015-02-07 10:00:00')
+
+    def test_35_compute_date_due_auto_unlink(self):
+        """Check that the due date of a picking is recomputed when one of its moves is deleted."""
+        picking = self.env['stock.picking'].create({
+            'picking_type_id': self.ref('stock.picking_type_internal'),
+            'move_lines': [(0, 0, {
+                'name': "Test Date Due %s" % date,
+                'product_id': self.test_product.id,
+                'product_uom': self.product_uom_unit_id,
+                'product_uom_qty': 5,
+                'date': date,
+                'location_id': self.location_a.id,
+                'location_dest_id': self.location_b.id,
+            }) for date in ['2015-02-02 10:00:00', '2015-02-05 10:00:00']],
+        })
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-02 10:00:00')
+
+        first_move = picking.move_lines.filtered(lambda move: move.date == '2015-02-02 10:00:00')
+        self.assertEqual(first_move.state, 'draft')
+        first_move.unlink()
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-05 10:00:00')
+
+        # The picking is marked only once, whatever the number of modifications
+        picking.move_lines.write({'date': '2015-02-07 10:00:00'})
+        picking.move_lines.write({'date': '2015-02-06 10:00:00'})
+        self.env.cr.execute("""SELECT count(*) FROM stock_picking_date_due_dirty WHERE picking_id = %s""",
+                            (picking.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], 1)
+        self.env['stock.picking'].compute_date_due_auto()
+        self.assertEqual(picking.date_due, '2015-02-06 10:00:00')
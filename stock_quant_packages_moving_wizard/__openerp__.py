@@ -47,6 +47,7 @@ This module gives two possibilities to deplace quants. In one hand, you can do i
         "wizard/quant_packages_move_wizard_view.xml",
         "wizard/product_line_move_wizard.xml",
         "views/stock.xml",
+        "data/cron.xml",
     ],
     'demo': ['tests/test_stock_quant_packages_moving_wizard.xml'],
     "installable": True,
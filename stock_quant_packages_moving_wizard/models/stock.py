@@ -18,13 +18,20 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from openerp import models, fields, api, exceptions, _
-from openerp.tools import float_compare, float_round
+import logging
+
+from psycopg2 import IntegrityError
+from psycopg2.extensions import TransactionRollbackError
+
+from openerp import models, fields, api, exceptions, _, SUPERUSER_ID
+from openerp.tools import float_compare, float_round, mute_logger
 from openerp.tools.sql import drop_view_if_exists
 from datetime import datetime as dt
 from openerp.addons.connector.queue.job import job
 from openerp.addons.connector.session import ConnectorSession
 
+_logger = logging.getLogger(__name__)
+
 
 @job(default_channel='root')
 def job_fill_new_picking_for_product(session, model_name, product_id, product_ids, move_tuples, dest_location_id,
@@ -32,6 +39,22 @@ def job_fill_new_picking_for_product(session, model_name, product_id, product_id
     quants_obj = session.env[model_name].with_context(context)
     quants_obj.fill_new_picking_for_product(product_id, product_ids, move_tuples, dest_location_id, picking_type_id,
                                             new_picking_id, move_recordset=move_recordset)
+    if quants_obj.env.context.get('defer_picking_assignment'):
+        # Once the moves of this product are committed, the job committing last sees the moves of all the products and
+        # enqueues the attachment of the moves to the picking.
+        session.commit()
+        session.env.invalidate_all()
+        picking = session.env['stock.picking'].with_context(context).browse(new_picking_id)
+        if picking.enqueue_attach_filled_moves(product_ids):
+            return "Picking correctly filled, moves attachment enqueued"
+    return "Picking correctly filled"
+
+
+@job(default_channel='root')
+def job_attach_filled_moves(session, model_name, picking_id, product_ids, context=None):
+    picking = session.env[model_name].with_context(context).browse(picking_id)
+    if not picking.attach_filled_moves(product_ids):
+        return "Picking is still being filled"
     return "Picking correctly filled"
 
 
@@ -51,11 +74,15 @@ class StockQuant(models.Model):
     def determine_list_reservations(self, product, move_tuples):
         prec = product.uom_id.rounding
         list_reservations = []
+        # Browse all the quants at once, so that their quantities are prefetched together
+        quants = self.env['stock.quant'].browse([quant_id for move_tuple in move_tuples
+                                                 for quant_id in move_tuple['quant_ids']])
+        quants_by_id = dict([(quant.id, quant) for quant in quants])
         for move_tuple in move_tuples:
             qty_reserved = 0
             qty_to_reserve = move_tuple['qty']
             for quant_id in move_tuple['quant_ids']:
-                quant = self.env['stock.quant'].browse(quant_id)
+                quant = quants_by_id[quant_id]
                 # If the new quant does not exceed the requested qty, we move it (end of loop) and continue
                 # If requested qty is reached, we break the loop
                 if float_compare(qty_reserved, qty_to_reserve, precision_rounding=prec) >= 0:
@@ -68,34 +95,79 @@ class StockQuant(models.Model):
                 qty_reserved += quant.qty
         return list_reservations
 
+    @api.model
+    def get_candidate_moves(self, quant_ids, location_from, dest_location, picking_type_id):
+        """Returns the moves matching each quant of quant_ids, with a single query for all the quants.
+
+        A move matches a quant if it has the same product, goes from location_from to dest_location with
+        picking_type_id, and is either in the quant history, the destination of a move of the quant history, or has
+        no ancestors.
+        :return: a dict {quant_id: list of move IDs}, each list being sorted by the default order of stock.move
+        """
+        result = dict([(quant_id, []) for quant_id in quant_ids])
+        if not quant_ids:
+            return result
+        self.env.cr.execute("""WITH quants AS (
+    SELECT
+        sq.id,
+        sq.product_id
+    FROM stock_quant sq
+    WHERE sq.id IN %s),
+
+    moves AS (
+        SELECT
+            sm.id,
+            sm.product_id
+        FROM stock_move sm
+        WHERE sm.product_id IN (SELECT product_id
+                                FROM quants) AND
+              sm.state NOT IN ('draft', 'done', 'cancel') AND
+              sm.location_id = %s AND
+              sm.location_dest_id = %s AND
+              sm.picking_type_id IS NOT DISTINCT FROM %s)
+
+SELECT
+    q.id,
+    m.id
+FROM quants q
+    INNER JOIN moves m ON m.product_id = q.product_id
+WHERE exists(SELECT 1
+             FROM stock_quant_move_rel rel
+             WHERE rel.quant_id = q.id AND rel.move_id = m.id) OR
+      exists(SELECT 1
+             FROM stock_move orig
+                 INNER JOIN stock_quant_move_rel rel ON rel.move_id = orig.id AND rel.quant_id = q.id
+             WHERE orig.move_dest_id = m.id) OR
+      NOT exists(SELECT 1
+                 FROM stock_move orig
+                 WHERE orig.move_dest_id = m.id)""",
+                            (tuple(quant_ids), location_from.id, dest_location.id, picking_type_id or None))
+        candidates = self.env.cr.fetchall()
+        # The moves are sorted all together, the lists of each quant follow this order
+        move_ids = self.env['stock.move'].search([('id', 'in', list(set([row[1] for row in candidates])))]).ids
+        move_ranks = dict([(move_id, rank) for rank, move_id in enumerate(move_ids)])
+        for quant_id, move_id in candidates:
+            result[quant_id].append(move_id)
+        for quant_id in result:
+            result[quant_id].sort(key=lambda move_id: move_ranks[move_id])
+        return result
+
     @api.model
     def get_corresponding_moves(self, quant, location_from, dest_location, picking_type_id, limit=None,
                                 force_domain=None):
-        domain = [('product_id', '=', quant.product_id.id),
-                  ('state', 'not in', ['draft', 'done', 'cancel']),
-                  ('location_id', '=', location_from.id),
-                  ('location_dest_id', '=', dest_location.id),
-                  ('picking_type_id', '=', picking_type_id)]
+        move_ids = self.get_candidate_moves(quant.ids, location_from, dest_location, picking_type_id)[quant.id]
         if force_domain:
-            domain += force_domain
-        moves = self.env['stock.move'].search(domain)
-        moves_correct_chain = moves.filtered(lambda move: move in quant.history_ids or
-                                                          any([sm in quant.history_ids for sm in move.move_orig_ids]))
-        moves_correct_chain = self.env['stock.move'].search([('id', 'in', moves_correct_chain.ids)],
-                                                            order='priority desc, date asc, id')
-        moves_no_ancestors = moves.filtered(lambda move: move not in quant.history_ids and not move.move_orig_ids)
-        moves_no_ancestors = self.env['stock.move'].search([('id', 'in', moves_no_ancestors.ids)],
-                                                           order='priority desc, date asc, id')
-        return self.env['stock.move'].search([('id', 'in', moves_correct_chain.ids + moves_no_ancestors.ids)],
-                                             limit=limit)
+            return self.env['stock.move'].search([('id', 'in', move_ids)] + force_domain, limit=limit)
+        return self.env['stock.move'].browse(move_ids[:limit] if limit else move_ids)
 
     @api.model
     def unreserve_quants_wrong_moves(self, list_reservations, location_from, dest_location, picking_type_id):
+        candidate_moves = self.get_candidate_moves(list(set([quant_tuple[0].id for quant_tuple in list_reservations])),
+                                                   location_from, dest_location, picking_type_id)
         for quant_tuple in list_reservations:
-            corresponding_moves = self.get_corresponding_moves(quant_tuple[0], location_from, dest_location,
-                                                               picking_type_id)
-            if quant_tuple[0].reservation_id and quant_tuple[0].reservation_id not in corresponding_moves:
-                quant_tuple[0].reservation_id.do_unreserve()
+            reservation = quant_tuple[0].reservation_id
+            if reservation and reservation.id not in candidate_moves[quant_tuple[0].id]:
+                reservation.do_unreserve()
 
     @api.model
     def split_and_reserve_moves_ok(self, list_reservations, move_recordset, new_picking):
@@ -117,7 +189,7 @@ class StockQuant(models.Model):
                 # Reserve quants on move
                 self.quants_reserve(quant_tuples_current_reservation, current_reservation)
                 # Assign the current move to the new picking
-                current_reservation.picking_id = new_picking
+                self.attach_to_new_picking(current_reservation, new_picking)
                 move_recordset |= current_reservation
                 processed_moves |= current_reservation
         return move_recordset
@@ -129,11 +201,17 @@ class StockQuant(models.Model):
         if not_reserved_tuples:
             done_move_ids = move_recordset.ids
             dict_reservations = {}
-            force_domain = [('id', 'not in', done_move_ids)]
-            first_corresponding_move = self.get_corresponding_moves(not_reserved_tuples[0][0],
-                                                                    location_from, dest_location,
-                                                                    picking_type_id, force_domain=force_domain,
-                                                                    limit=1)
+            candidate_moves = self.get_candidate_moves(list(set([item[0].id for item in not_reserved_tuples])),
+                                                       location_from, dest_location, picking_type_id)
+            move_obj = self.env['stock.move']
+
+            def get_first_corresponding_move(quant):
+                for move_id in candidate_moves.get(quant.id, []):
+                    if move_id not in done_move_ids:
+                        return move_obj.browse(move_id)
+                return move_obj
+
+            first_corresponding_move = get_first_corresponding_move(not_reserved_tuples[0][0])
             while not_reserved_tuples and first_corresponding_move:
                 prec = first_corresponding_move.product_id.uom_id.rounding
                 if not dict_reservations.get(first_corresponding_move):
@@ -161,12 +239,12 @@ class StockQuant(models.Model):
                     dict_reservations[first_corresponding_move] += [(quant, quant.qty)]
                     not_reserved_tuples += [(splitted_quant, float_round(qty - reservable_qty_on_move,
                                                                          precision_rounding=prec))]
+                    if splitted_quant:
+                        # Split quants share the history of their original quant, hence the same candidates
+                        candidate_moves[splitted_quant.id] = candidate_moves.get(quant.id, [])
                     done_move_ids += [first_corresponding_move.id]
                 move_recordset |= first_corresponding_move
-                force_domain = [('id', 'not in', done_move_ids)]
-                first_corresponding_move = self.get_corresponding_moves(quant, location_from, dest_location,
-                                                                        picking_type_id, limit=1,
-                                                                        force_domain=force_domain)
+                first_corresponding_move = get_first_corresponding_move(quant)
                 not_reserved_tuples = not_reserved_tuples[1:]
             # Let's split the move which are not entirely_used
             for move in dict_reservations:
@@ -176,7 +254,7 @@ class StockQuant(models.Model):
                     move.split(move, float_round(move.product_qty - qty_reserved, precision_rounding=prec))
             # Let's reserve the quants
             for move in dict_reservations:
-                move.picking_id = new_picking
+                self.attach_to_new_picking(move, new_picking)
                 self.quants_reserve(dict_reservations[move], move)
         return move_recordset, not_reserved_tuples
 
@@ -196,11 +274,28 @@ class StockQuant(models.Model):
         quants_to_move_in_fine += not_reserved_tuples
         return move_recordset, quants_to_move_in_fine
 
+    @api.model
+    def attach_to_new_picking(self, moves, new_picking):
+        """Assigns moves to new_picking (a record or an ID).
+
+        If the context key 'defer_picking_assignment' is set, the moves are only marked as filling new_picking, so
+        that the picking header is not written (and locked) until attach_filled_moves is called."""
+        new_picking_id = isinstance(new_picking, models.BaseModel) and new_picking.id or new_picking
+        if self.env.context.get('defer_picking_assignment'):
+            moves.write({'filling_picking_id': new_picking_id})
+        else:
+            moves.write({'picking_id': new_picking_id})
+
     @api.model
     def move_remaining_quants(self, product, location_from, dest_location, picking_type_id, new_picking_id,
                               move_recordset, quants_to_move_in_fine):
         if quants_to_move_in_fine:
-            new_move = self.env['stock.move'].with_context(mail_notrack=True).create({
+            if self.env.context.get('defer_picking_assignment'):
+                # Without picking type, the confirmation does not look for a picking to put the move in
+                picking_values = {'picking_type_id': False, 'filling_picking_id': new_picking_id}
+            else:
+                picking_values = {'picking_type_id': picking_type_id, 'picking_id': new_picking_id}
+            new_move_values = {
                 'name': 'Move %s to %s' % (product.name, dest_location.name),
                 'product_id': product.id,
                 'location_id': location_from.id,
@@ -210,9 +305,9 @@ class StockQuant(models.Model):
                 'product_uom': product.uom_id.id,
                 'date_expected': fields.Datetime.now(),
                 'date': fields.Datetime.now(),
-                'picking_type_id': picking_type_id,
-                'picking_id': new_picking_id,
-            })
+            }
+            new_move_values.update(picking_values)
+            new_move = self.env['stock.move'].with_context(mail_notrack=True).create(new_move_values)
             new_move.action_confirm()
             move_recordset = move_recordset | new_move
             self.quants_reserve(quants_to_move_in_fine, new_move)
@@ -267,6 +362,9 @@ class StockQuant(models.Model):
                                                     new_picking_id, move_recordset, quants_to_move_in_fine)
         move_recordset.filtered(lambda move: move.state == 'draft').action_confirm()
         move_recordset.delete_packops()
+        if self.env.context.get('defer_picking_assignment'):
+            # The picking is completed by attach_filled_moves once all the products are processed
+            return move_recordset
         done_product_ids = [move.product_id.id for move in new_picking.move_lines]
         if all ([product_id in done_product_ids for product_id in product_ids]):
             new_picking.do_prepare_partial()
@@ -295,11 +393,13 @@ class StockQuant(models.Model):
                     index += 1
                     first_product = index == 1
                     if is_manual_op and filling_method == 'jobify' and not first_product:
+                        # Each product is processed in its own job, which does not write on the picking
                         new_picking.filled_by_jobs = True
                         job_fill_new_picking_for_product.delay(ConnectorSession.from_env(self.env), 'stock.quant',
                                                                product_id, product_ids, move_tuples, dest_location.id,
                                                                picking_type.id, new_picking.id,
-                                                               context=self.env.context,
+                                                               context=dict(self.env.context,
+                                                                            defer_picking_assignment=True),
                                                                description=u"Filling picking %s with product %s (%s/%s)" %
                                                                            (new_picking.name, product.display_name,
                                                                             index, chunks_number))
@@ -335,10 +435,53 @@ class StockPicking(models.Model):
     filled_by_jobs = fields.Boolean(string="Picking filled by jobs", readonly=True)
     picking_correctly_filled = fields.Boolean(string="Picking correctly filled", readonly=True)
 
+    @api.multi
+    def is_filled(self, product_ids):
+        """Returns True if all the products of product_ids have moves filling this picking or attached to it."""
+        self.ensure_one()
+        moves = self.env['stock.move'].search([('filling_picking_id', '=', self.id)])
+        done_product_ids = set(moves.mapped('product_id').ids + self.move_lines.mapped('product_id').ids)
+        return all([product_id in done_product_ids for product_id in product_ids])
+
+    @api.multi
+    def enqueue_attach_filled_moves(self, product_ids):
+        """Enqueues the job attaching the moves filling this picking, if all the products of product_ids have been
+        processed. Returns True if the job was enqueued.
+
+        This is called by each filling job after its commit, so that the last one enqueues the attachment. Several
+        jobs may enqueue it if they commit at the same time, attach_filled_moves does nothing the second time."""
+        self.ensure_one()
+        if not self.is_filled(product_ids):
+            return False
+        job_attach_filled_moves.delay(ConnectorSession.from_env(self.env), 'stock.picking', self.id, product_ids,
+                                      context=self.env.context, priority=20,
+                                      description=u"Attaching moves to picking %s" % self.name)
+        return True
+
+    @api.multi
+    def attach_filled_moves(self, product_ids):
+        """Attaches the moves filling this picking with a single write, if all the products of product_ids have been
+        processed. Returns False if some products are still missing."""
+        self.ensure_one()
+        if not self.is_filled(product_ids):
+            return False
+        moves = self.env['stock.move'].search([('filling_picking_id', '=', self.id)])
+        if not moves and self.picking_correctly_filled:
+            # The moves have already been attached by another job
+            return True
+        if moves:
+            moves.write({'picking_id': self.id, 'picking_type_id': self.picking_type_id.id,
+                         'filling_picking_id': False})
+        self.do_prepare_partial()
+        self.picking_correctly_filled = True
+        return True
+
 
 class StockMove(models.Model):
     _inherit = 'stock.move'
 
+    filling_picking_id = fields.Many2one('stock.picking', string="Picking being filled", readonly=True, index=True)
+
     def delete_packops(self):
         for move in self:
             if move.linked_move_operation_ids:
@@ -351,6 +494,120 @@ class StockWarehouse(models.Model):
     picking_type_id = fields.Many2one('stock.picking.type', string="Default picking type")
 
 
+# The triggers only record the products and packages whose lines changed in stock_product_line_dirty, which has no
+# unique key, so that the quant writes never wait for or conflict on a shared summary line. The lines of the recorded
+# products and packages are computed again later by apply_product_lines_changes.
+PRODUCT_LINE_TRIGGERS = """DROP FUNCTION IF EXISTS stock_product_line_quant_delta(INTEGER, INTEGER, INTEGER, INTEGER,
+                                                     NUMERIC, INTEGER);
+DROP FUNCTION IF EXISTS stock_product_line_refresh_package(INTEGER);
+
+CREATE OR REPLACE FUNCTION stock_product_line_quant_trigger()
+    RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.product_id = OLD.product_id AND NEW.package_id IS NOT DISTINCT FROM OLD.package_id AND
+       NEW.lot_id IS NOT DISTINCT FROM OLD.lot_id AND NEW.location_id = OLD.location_id AND NEW.qty = OLD.qty
+    THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE')
+    THEN
+        INSERT INTO stock_product_line_dirty (product_id, package_id) VALUES (OLD.product_id, OLD.package_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR
+       (TG_OP = 'UPDATE' AND (NEW.product_id != OLD.product_id OR NEW.package_id IS DISTINCT FROM OLD.package_id))
+    THEN
+        INSERT INTO stock_product_line_dirty (product_id, package_id) VALUES (NEW.product_id, NEW.package_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stock_product_line_package_trigger()
+    RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE')
+    THEN
+        INSERT INTO stock_product_line_dirty (product_id, package_id) VALUES (NULL, OLD.id), (NULL, OLD.parent_id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE')
+    THEN
+        INSERT INTO stock_product_line_dirty (product_id, package_id) VALUES (NULL, NEW.id), (NULL, NEW.parent_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stock_product_line_template_trigger()
+    RETURNS TRIGGER AS $$
+BEGIN
+    -- The unit of measure is part of the line IDs, so that the lines of the products are computed again
+    INSERT INTO stock_product_line_dirty (product_id, package_id)
+        SELECT
+            pp.id,
+            NULL
+        FROM product_product pp
+        WHERE pp.product_tmpl_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stock_product_line_quant ON stock_quant;
+CREATE TRIGGER stock_product_line_quant
+AFTER INSERT OR DELETE OR UPDATE OF product_id, package_id, lot_id, location_id, qty ON stock_quant
+FOR EACH ROW EXECUTE PROCEDURE stock_product_line_quant_trigger();
+
+DROP TRIGGER IF EXISTS stock_product_line_package ON stock_quant_package;
+CREATE TRIGGER stock_product_line_package
+AFTER INSERT OR DELETE OR UPDATE OF location_id, parent_id ON stock_quant_package
+FOR EACH ROW EXECUTE PROCEDURE stock_product_line_package_trigger();
+
+DROP TRIGGER IF EXISTS stock_product_line_template ON product_template;
+CREATE TRIGGER stock_product_line_template
+AFTER UPDATE OF uom_id ON product_template
+FOR EACH ROW WHEN (OLD.uom_id IS DISTINCT FROM NEW.uom_id)
+EXECUTE PROCEDURE stock_product_line_template_trigger();"""
+
+# Lines of the quants of the products given as parameter (or of all the quants if the parameter is NULL)
+PRODUCT_LINE_INSERT_QUANT_LINES = """INSERT INTO stock_product_line (id, product_id, package_id, lot_id, qty, uom_id,
+                                location_id, parent_id)
+    SELECT
+        COALESCE(sq.product_id, 0) || '-' || COALESCE(sq.package_id, 0) || '-' || COALESCE(sq.lot_id, 0) || '-' ||
+        COALESCE(pt.uom_id, 0) || '-' || COALESCE(sq.location_id, 0),
+        sq.product_id,
+        sq.package_id,
+        sq.lot_id,
+        round(sum(sq.qty) :: NUMERIC, 3),
+        pt.uom_id,
+        sq.location_id,
+        sqp.parent_id
+    FROM stock_quant sq
+        LEFT JOIN product_product pp ON pp.id = sq.product_id
+        LEFT JOIN product_template pt ON pp.product_tmpl_id = pt.id
+        LEFT JOIN stock_quant_package sqp ON sqp.id = sq.package_id
+    WHERE %(product_ids)s :: INTEGER [] IS NULL OR sq.product_id = ANY (%(product_ids)s :: INTEGER [])
+    GROUP BY sq.product_id, sq.package_id, sq.lot_id, pt.uom_id, sq.location_id, sqp.parent_id"""
+
+# Lines of the packages given as parameter (or of all the packages if the parameter is NULL)
+PRODUCT_LINE_INSERT_PACKAGE_LINES = """INSERT INTO stock_product_line (id, product_id, package_id, lot_id, qty, uom_id,
+                                location_id, parent_id)
+    SELECT
+        '0-' || sqp.id || '-0-0-' || COALESCE(sqp.location_id, 0),
+        NULL,
+        sqp.id,
+        NULL,
+        0,
+        NULL,
+        sqp.location_id,
+        sqp.parent_id
+    FROM stock_quant_package sqp
+    WHERE (%(package_ids)s :: INTEGER [] IS NULL OR sqp.id = ANY (%(package_ids)s :: INTEGER [])) AND
+          ((SELECT count(DISTINCT sq.product_id)
+            FROM stock_quant sq
+            WHERE sq.package_id = sqp.id) > 1 OR exists(SELECT 1
+                                                        FROM stock_quant_package child
+                                                        WHERE child.parent_id = sqp.id))"""
+
+
 class Stock(models.Model):
     _name = 'stock.product.line'
     _auto = False
@@ -365,8 +622,13 @@ class Stock(models.Model):
     parent_id = fields.Many2one("stock.quant.package", "Parent Package", index=True)
 
     def init(self, cr):
-        drop_view_if_exists(cr, 'stock_product_line')
-        cr.execute("""CREATE OR REPLACE VIEW stock_product_line AS (
+        # The original aggregation is kept as the stock_product_line_view view, to check the summary table against it
+        cr.execute("""SELECT relkind FROM pg_class WHERE relname = 'stock_product_line'""")
+        relkind = cr.fetchone()
+        if relkind and relkind[0] == 'v':
+            drop_view_if_exists(cr, 'stock_product_line')
+        drop_view_if_exists(cr, 'stock_product_line_view')
+        cr.execute("""CREATE OR REPLACE VIEW stock_product_line_view AS (
     SELECT
         COALESCE(rqx.product_id, 0)
         || '-' || COALESCE(rqx.package_id, 0) || '-' || COALESCE(rqx.lot_id, 0) || '-' ||
@@ -416,9 +678,111 @@ class Stock(models.Model):
                                                                            WHERE sqp_bis.parent_id = sqp.id)
         ) rqx)
             """)
+        cr.execute("""CREATE TABLE IF NOT EXISTS stock_product_line (
+    id          TEXT PRIMARY KEY,
+    product_id  INTEGER,
+    package_id  INTEGER,
+    lot_id      INTEGER,
+    qty         NUMERIC,
+    uom_id      INTEGER,
+    location_id INTEGER,
+    parent_id   INTEGER)""")
+        cr.execute("""CREATE TABLE IF NOT EXISTS stock_product_line_dirty (
+    product_id INTEGER,
+    package_id INTEGER)""")
+        for column in ['product_id', 'package_id', 'location_id', 'parent_id']:
+            cr.execute("""SELECT 1 FROM pg_indexes WHERE indexname = %s""", ('stock_product_line_%s_index' % column,))
+            if not cr.fetchone():
+                cr.execute("""CREATE INDEX stock_product_line_%s_index ON stock_product_line (%s)""" %
+                           (column, column))
+        cr.execute(PRODUCT_LINE_TRIGGERS)
+        # The table is only filled when it is created, later changes are applied from stock_product_line_dirty
+        if not relkind or relkind[0] == 'v':
+            self.rebuild_product_lines(cr, SUPERUSER_ID)
+
+    @api.model
+    def rebuild_product_lines(self):
+        """Recomputes the whole stock_product_line summary table from the quants."""
+        self.env.cr.execute("""TRUNCATE stock_product_line, stock_product_line_dirty""")
+        self.env.cr.execute(PRODUCT_LINE_INSERT_QUANT_LINES, {'product_ids': None})
+        self.env.cr.execute(PRODUCT_LINE_INSERT_PACKAGE_LINES, {'package_ids': None})
+        self.invalidate_cache()
+
+    @api.model
+    def apply_product_lines_changes(self):
+        """Computes again the lines of the products and packages recorded in stock_product_line_dirty.
+
+        The lines are computed from the quants visible to the current transaction. If another transaction is already
+        applying changes, or if the lines to write were changed by a transaction committed in the meantime, nothing is
+        done and the changes are left to the next call.
+
+        :return: True if the changes were applied
+        """
+        self.env.cr.execute("""SELECT pg_try_advisory_xact_lock(hashtext('stock_product_line_dirty'))""")
+        if not self.env.cr.fetchone()[0]:
+            return False
+        try:
+            with mute_logger('openerp.sql_db'), self.env.cr.savepoint():
+                self.env.cr.execute("""DELETE FROM stock_product_line_dirty RETURNING product_id, package_id""")
+                changes = self.env.cr.fetchall()
+                if not changes:
+                    return True
+                product_ids = list(set([product_id for product_id, package_id in changes if product_id]))
+                package_ids = list(set([package_id for product_id, package_id in changes if package_id]))
+                if package_ids:
+                    # The quant lines hold the parent of their package
+                    self.env.cr.execute("""SELECT DISTINCT product_id FROM stock_quant WHERE package_id IN %s""",
+                                        (tuple(package_ids),))
+                    product_ids = list(set(product_ids + [row[0] for row in self.env.cr.fetchall()]))
+                if product_ids:
+                    self.env.cr.execute("""DELETE FROM stock_product_line WHERE product_id IN %s""",
+                                        (tuple(product_ids),))
+                    self.env.cr.execute(PRODUCT_LINE_INSERT_QUANT_LINES, {'product_ids': product_ids})
+                if package_ids:
+                    self.env.cr.execute("""DELETE FROM stock_product_line
+WHERE product_id IS NULL AND package_id IN %s""", (tuple(package_ids),))
+                    self.env.cr.execute(PRODUCT_LINE_INSERT_PACKAGE_LINES, {'package_ids': package_ids})
+        except (IntegrityError, TransactionRollbackError):
+            _logger.info(u"stock_product_line changes were not applied because of a concurrent update")
+            return False
+        self.invalidate_cache()
+        return True
+
+    def read_group(self, cr, uid, domain, fields, groupby, offset=0, limit=None, context=None, orderby=False,
+                   lazy=True):
+        # The grouped lists are brought up to date when they are displayed, as the moving wizard does
+        self.apply_product_lines_changes(cr, uid, context=context)
+        return super(Stock, self).read_group(cr, uid, domain, fields, groupby, offset=offset, limit=limit,
+                                             context=context, orderby=orderby, lazy=lazy)
+
+    @api.model
+    def check_product_lines_consistency(self):
+        """Compares the stock_product_line summary table with the stock_product_line_view view.
+
+        :return: the list of the IDs of the lines which differ between the table and the view
+        """
+        self.env.cr.execute("""WITH table_lines AS (
+    SELECT id, product_id, package_id, lot_id, qty, uom_id, location_id, parent_id
+    FROM stock_product_line),
+
+    view_lines AS (
+        SELECT id, product_id, package_id, lot_id, qty, uom_id, location_id, parent_id
+        FROM stock_product_line_view)
+
+SELECT id
+FROM ((SELECT * FROM table_lines EXCEPT SELECT * FROM view_lines)
+      UNION ALL
+      (SELECT * FROM view_lines EXCEPT SELECT * FROM table_lines)) differences""")
+        different_ids = sorted(set([row[0] for row in self.env.cr.fetchall()]))
+        if different_ids:
+            _logger.warning(u"stock_product_line is inconsistent with its view on %s lines: %s",
+                            len(different_ids), different_ids[:100])
+        return different_ids
 
     @api.multi
     def move_products(self):
+        # The lines are brought up to date before the moving wizard reads them
+        self.apply_product_lines_changes()
         if self:
             location = self[0].location_id
             if any([line.location_id != location for line in self]):
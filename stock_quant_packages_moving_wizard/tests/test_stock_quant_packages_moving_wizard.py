@@ -76,6 +76,7 @@ class TestStockQuantPackagesMovingWizard(common.TransactionCase):
 
     def prepare_test_move_quant_package(self):
 
+        self.env['stock.product.line'].apply_product_lines_changes()
         lines = self.env['stock.product.line'].search([('location_id', 'in',
                                                         [self.location_source.id, self.location_dest.id])])
         self.assertEqual(len(lines), 11)
@@ -1412,3 +1413,121 @@ class TestStockQuantPackagesMovingWizard(common.TransactionCase):
         self.assertEqual(self.quant_no_pack_a.qty, 50)
         self.assertEqual(existing_move.date[:10], fields.Date.today())
         self.assertEqual(existing_move.date_expected[:10], fields.Date.today())
+
+    def test_60_candidate_moves(self):
+        """Checks the moves matching quants found by the SQL candidate resolver."""
+
+        def create_move(name, location_from, location_dest, move_dest=None):
+            return self.env['stock.move'].create({
+                'name': name,
+                'product_id': self.product_a.id,
+                'product_uom_qty': 10,
+                'picking_type_id': self.picking_type.id,
+                'location_id': location_from.id,
+                'location_dest_id': location_dest.id,
+                'product_uom': self.unit.id,
+                'move_dest_id': move_dest and move_dest.id or False,
+            })
+
+        move_chained = create_move("Chained move", self.location_source, self.location_dest)
+        supply_move = create_move("Supply move", self.supplier, self.location_source, move_chained)
+        move_other_chain = create_move("Move of another chain", self.location_source, self.location_dest)
+        create_move("Other supply move", self.supplier, self.location_source, move_other_chain)
+        move_no_ancestor = create_move("Move without ancestor", self.location_source, self.location_dest)
+        (move_chained | move_other_chain | move_no_ancestor).action_confirm()
+        supply_move.action_confirm()
+        supply_move.action_assign()
+        supply_move.action_done()
+        supply_quant = supply_move.quant_ids
+        self.assertEqual(len(supply_quant), 1)
+
+        candidates = self.env['stock.quant'].get_candidate_moves(
+            [supply_quant.id, self.quant_no_pack_a.id], self.location_source, self.location_dest,
+            self.picking_type.id)
+        self.assertIn(move_chained.id, candidates[supply_quant.id])
+        self.assertIn(move_no_ancestor.id, candidates[supply_quant.id])
+        self.assertNotIn(move_other_chain.id, candidates[supply_quant.id])
+        self.assertIn(move_no_ancestor.id, candidates[self.quant_no_pack_a.id])
+        self.assertNotIn(move_chained.id, candidates[self.quant_no_pack_a.id])
+        self.assertNotIn(move_other_chain.id, candidates[self.quant_no_pack_a.id])
+        self.assertEqual(
+            self.env['stock.quant'].get_corresponding_moves(supply_quant, self.location_source, self.location_dest,
+                                                            self.picking_type.id).ids,
+            candidates[supply_quant.id])
+
+    def test_61_fill_picking_without_writing_header(self):
+        """Checks that filling a picking product by product in deferred mode does not write the picking header."""
+        move_items = self.quant_no_pack_a.partial_move({}, self.product_a, 50)
+        move_items = self.quant_no_pack_b.partial_move(move_items, self.product_b, 2)
+        product_ids = [self.product_a.id, self.product_b.id]
+        new_picking = self.env['stock.picking'].create({'picking_type_id': self.picking_type.id})
+
+        def get_picking_ctid():
+            self.env.cr.execute("""SELECT ctid FROM stock_picking WHERE id = %s""", (new_picking.id,))
+            return self.env.cr.fetchone()[0]
+
+        ctid = get_picking_ctid()
+        quant_obj = self.env['stock.quant'].with_context(defer_picking_assignment=True)
+        for product_id in product_ids:
+            # The attachment of the moves is only enqueued by the job filling the last product
+            self.assertFalse(new_picking.enqueue_attach_filled_moves(product_ids))
+            quant_obj.fill_new_picking_for_product(product_id, product_ids, move_items[product_id],
+                                                   self.location_dest.id, self.picking_type.id, new_picking.id)
+        # Any update of the picking row would have created a new row version
+        self.assertEqual(get_picking_ctid(), ctid)
+        filling_moves = self.env['stock.move'].search([('filling_picking_id', '=', new_picking.id)])
+        self.assertEqual(len(filling_moves), 2)
+        self.assertFalse(new_picking.move_lines)
+        self.assertTrue(new_picking.enqueue_attach_filled_moves(product_ids))
+
+        self.assertFalse(new_picking.attach_filled_moves(product_ids + [self.product1_auto_move.id]))
+        self.assertTrue(new_picking.attach_filled_moves(product_ids))
+        self.assertEqual(new_picking.move_lines, filling_moves)
+        # Attaching the moves again, as a second attachment job would do, changes nothing
+        self.assertTrue(new_picking.attach_filled_moves(product_ids))
+        self.assertEqual(new_picking.move_lines, filling_moves)
+        self.assertTrue(new_picking.picking_correctly_filled)
+        self.assertEqual(self.quant_no_pack_a.reservation_id.picking_id, new_picking)
+        self.assertEqual(self.quant_no_pack_b.reservation_id.picking_id, new_picking)
+
+    def test_62_product_lines_consistency(self):
+        """Checks that the stock.product.line summary table follows the quants and packages changes."""
+        product_line_obj = self.env['stock.product.line']
+        product_line_obj.apply_product_lines_changes()
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
+
+        do_move_w = self.env['stock.quant.package.move'].with_context(active_ids=[self.header.id]).create({
+            'global_dest_loc': self.location_dest.id,
+            'picking_type_id': self.picking_type.id,
+            'is_manual_op': False
+        })
+        do_move_w.do_detailed_transfer()
+        # The changes are only recorded by the quant writes, and applied later
+        self.env.cr.execute("""SELECT count(*) FROM stock_product_line_dirty""")
+        self.assertTrue(self.env.cr.fetchone()[0])
+        self.assertTrue(product_line_obj.apply_product_lines_changes())
+        self.env.cr.execute("""SELECT count(*) FROM stock_product_line_dirty""")
+        self.assertFalse(self.env.cr.fetchone()[0])
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
+
+        self.env['stock.quant']._quant_split(self.quant_no_pack_a, 20)
+        self.quant_no_pack_b.package_id = self.child
+        self.child.parent_id = self.header_2
+        # Searching the lines does not apply the pending changes, grouping them or opening the moving wizard does
+        product_line_obj.search([])
+        self.env.cr.execute("""SELECT count(*) FROM stock_product_line_dirty""")
+        self.assertTrue(self.env.cr.fetchone()[0])
+        product_line_obj.read_group([], ['qty'], ['location_id'])
+        self.env.cr.execute("""SELECT count(*) FROM stock_product_line_dirty""")
+        self.assertFalse(self.env.cr.fetchone()[0])
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
+
+        self.quant_no_pack_a.package_id = self.child
+        product_line_obj.move_products()
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
+
+        self.quant_no_pack_b.with_context(force_unlink=True).unlink()
+        product_line_obj.apply_product_lines_changes()
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
+        product_line_obj.rebuild_product_lines()
+        self.assertEqual(product_line_obj.check_product_lines_consistency(), [])
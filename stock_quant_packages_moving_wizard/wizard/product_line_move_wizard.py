@@ -40,6 +40,7 @@ class ProductLineMoveWizard(models.TransientModel):
     @api.model
     def default_get(self, fields):
         result = super(ProductLineMoveWizard, self).default_get(fields)
+        self.env['stock.product.line'].apply_product_lines_changes()
         line_ids = self.env.context.get('active_ids', [])
         lines = self.env['stock.product.line'].browse(line_ids)
         quant_lines = []
@@ -26,53 +26,88 @@ class StockReservationPriorityStockMove(models.Model):
 
     priority = fields.Selection(copy=False)
 
+    @api.model
+    def _get_priority_quants_data(self, moves_data):
+        """Loads in one pass the quants competing for the given moves.
+
+        Returns a tuple (quants, reserved_qties, locations) where quants is a list of dicts (id, product_id, qty,
+        reservation_id, parent_left) of the quants of the products of the moves lying in their source locations,
+        reserved_qties is a dict giving the quantity reserved for each move reserving those quants (or being assigned)
+        and locations a dict giving for each source location its (parent_left, parent_right) interval."""
+        location_ids = list(set([move['location_id'] for move in moves_data]))
+        product_ids = list(set([move['product_id'] for move in moves_data]))
+        self.env.cr.execute("""SELECT id, parent_left, parent_right FROM stock_location WHERE id IN %s""",
+                            (tuple(location_ids),))
+        locations = {row[0]: (row[1], row[2]) for row in self.env.cr.fetchall()}
+        self.env.cr.execute("""SELECT DISTINCT sq.id, sq.product_id, sq.qty, sq.reservation_id, sl.parent_left
+FROM stock_quant sq
+  INNER JOIN stock_location sl ON sl.id = sq.location_id
+  INNER JOIN stock_location root ON root.id IN %s AND sl.parent_left >= root.parent_left AND
+                                    sl.parent_left < root.parent_right
+WHERE sq.product_id IN %s""", (tuple(location_ids), tuple(product_ids)))
+        quants = self.env.cr.dictfetchall()
+        reservation_ids = set([quant['reservation_id'] for quant in quants if quant['reservation_id']])
+        reservation_ids |= set([move['id'] for move in moves_data])
+        self.env.cr.execute("""SELECT reservation_id, sum(qty) FROM stock_quant WHERE reservation_id IN %s
+GROUP BY reservation_id""", (tuple(reservation_ids),))
+        reserved_qties = dict(self.env.cr.fetchall())
+        return quants, reserved_qties, locations
+
+    @api.model
+    def _plan_priority_unreservations(self, moves_data):
+        """Computes in memory the moves to unreserve so that the given moves can take their quants.
+
+        moves_data is the list of the moves to assign, ordered by priority, as read by action_assign. The reallocation
+        is simulated in the same order, freeing the quants of the lower priority moves as needed. Returns the list of
+        the ids of the moves to unreserve."""
+        if not moves_data:
+            return []
+        quants, reserved_qties, locations = self._get_priority_quants_data(moves_data)
+        competing_moves = {}
+        competing_move_ids = list(set([quant['reservation_id'] for quant in quants if quant['reservation_id']]))
+        if competing_move_ids:
+            competing_moves = {move['id']: move for move in self.browse(competing_move_ids).
+                               read(['id', 'priority', 'date'], load=False)}
+        products = self.env['product.product'].browse(list(set([move['product_id'] for move in moves_data])))
+        precisions = {product.id: product.uom_id.rounding for product in products}
+        moves_to_unreserve = []
+        for move_to_assign in moves_data:
+            prec = precisions[move_to_assign['product_id']]
+            needed_qty = move_to_assign['product_qty'] - reserved_qties.get(move_to_assign['id'], 0)
+            if float_compare(needed_qty, 0, precision_rounding=prec) <= 0:
+                continue
+            parent_left, parent_right = locations[move_to_assign['location_id']]
+            location_quants = [quant for quant in quants if quant['product_id'] == move_to_assign['product_id'] and
+                               parent_left <= quant['parent_left'] < parent_right]
+            available_qty = sum([quant['qty'] for quant in location_quants if not quant['reservation_id']])
+            if float_compare(needed_qty, available_qty, precision_rounding=prec) <= 0:
+                continue
+            running_moves = [competing_moves[move_id] for move_id in
+                             set([quant['reservation_id'] for quant in location_quants if quant['reservation_id']])]
+            running_moves = [move for move in running_moves if move['priority'] < move_to_assign['priority'] or
+                             move['priority'] == move_to_assign['priority'] and move['date'] > move_to_assign['date']]
+            running_moves.sort(key=lambda move: (move['priority'], move['date'], move['id']), reverse=True)
+            running_moves.sort(key=lambda move: move['priority'])
+            for move_to_unreserve in running_moves:
+                if float_compare(available_qty, needed_qty, precision_rounding=prec) >= 0:
+                    break
+                if move_to_unreserve['id'] == move_to_assign['id']:
+                    continue
+                available_qty += reserved_qties.get(move_to_unreserve['id'], 0)
+                reserved_qties[move_to_unreserve['id']] = 0
+                for quant in quants:
+                    if quant['reservation_id'] == move_to_unreserve['id']:
+                        quant['reservation_id'] = False
+                moves_to_unreserve += [move_to_unreserve['id']]
+        return moves_to_unreserve
+
     @api.multi
     def action_assign(self):
         to_assign_ids = self and self.ids or []
         moves_to_assign = self.search([('id', 'in', to_assign_ids)], order='priority desc, date asc, id asc')
         read_moves_to_assign = moves_to_assign.read(
             ['id', 'location_id', 'product_id', 'priority', 'date', 'product_qty'], load=False)
-        for move_to_assign in read_moves_to_assign:
-            prec = self.env['product.product'].browse(move_to_assign['product_id']).uom_id.rounding
-            quants_on_move = self.env['stock.quant'].search([('reservation_id', '=', move_to_assign['id'])])
-            quants_on_move = quants_on_move.read(['qty'], load=False)
-            reserved_qty = sum([quant['qty'] for quant in quants_on_move])
-            needed_qty = move_to_assign['product_qty'] - reserved_qty
-            if float_compare(needed_qty, 0, precision_rounding=prec) > 0:
-                available_quants = self.env['stock.quant']. \
-                    search([('location_id', 'child_of', move_to_assign['location_id']),
-                            ('product_id', '=', move_to_assign['product_id']),
-                            ('reservation_id', '=', False)])
-                available_quants = available_quants.read(['qty'], load=False)
-                available_qty = sum([quant['qty'] for quant in available_quants])
-                if float_compare(needed_qty, available_qty, precision_rounding=prec) > 0:
-                    reserved_quants = self.env['stock.quant']. \
-                        search([('location_id', 'child_of', move_to_assign['location_id']),
-                                ('product_id', '=', move_to_assign['product_id']),
-                                ('reservation_id', '!=', False)])
-                    reserved_quants = reserved_quants.read(['reservation_id'], load=False)
-                    reservation_ids = [quant['reservation_id'] for quant in reserved_quants]
-                    running_moves_ordered_reverse = self.env['stock.move']. \
-                        search([('id', 'in', reservation_ids),
-                                '|', ('priority', '<', move_to_assign['priority']),
-                                '&', ('priority', '=', move_to_assign['priority']),
-                                ('date', '>', move_to_assign['date'])],
-                               order='priority asc, date desc, id desc')
-                    running_moves_ordered_reverse = running_moves_ordered_reverse.read(['id', 'product_qty'], load=False)
-                    moves_to_unreserve = []
-                    for move_to_unreserve in running_moves_ordered_reverse:
-                        if float_compare(available_qty, needed_qty, precision_rounding=prec) >= 0:
-                            break
-                        if move_to_unreserve['id'] == move_to_assign['id']:
-                            continue
-                        move_quants = self.env['stock.quant'].search([('reservation_id', '=', move_to_unreserve['id'])])
-                        move_quants = move_quants.read(['qty'], load=False)
-                        move_reserved_qty = sum([quant['qty'] for quant in move_quants])
-                        available_qty += move_reserved_qty
-                        moves_to_unreserve += [move_to_unreserve['id']]
-                        if float_compare(available_qty, needed_qty, precision_rounding=prec) > 0:
-                            to_assign_ids += [move_to_unreserve['id']]
-                    if moves_to_unreserve:
-                        moves_to_unreserve = self.env['stock.move'].browse(moves_to_unreserve)
-                        moves_to_unreserve.do_unreserve()
+        moves_to_unreserve = self._plan_priority_unreservations(read_moves_to_assign)
+        if moves_to_unreserve:
+            self.browse(moves_to_unreserve).do_unreserve()
         return super(StockReservationPriorityStockMove, moves_to_assign).action_assign()
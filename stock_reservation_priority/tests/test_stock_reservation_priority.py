@@ -390,3 +390,33 @@ class TestStockPushPropagation(common.TransactionCase):
                                       {'state': 'confirmed', 'reserved_qty': 0},
                                       {'state': 'confirmed', 'reserved_qty': 3},
                                       {'state': 'assigned', 'reserved_qty': 4}, skip_moves_assignation=True)
+
+    # Testing assignation of several moves at once
+    def test_41_stock_reservation_priority(self):
+        self.move1.action_confirm()
+        self.move2.action_confirm()
+        self.move3.action_confirm()
+        (self.move1 | self.move2 | self.move3).action_assign()
+        new_moves = self.env['stock.move']
+        for qty, date in [(3, '2016-02-18 12:00:00'), (2, '2016-02-18 13:00:00')]:
+            new_moves |= self.env['stock.move'].create({
+                'name': "New move to assign",
+                'priority': '2',
+                'product_uom': self.unit.id,
+                'product_uom_qty': qty,
+                'date': date,
+                'product_id': self.product.id,
+                'location_id': self.stock.id,
+                'location_dest_id': self.customers.id,
+            })
+        new_moves.action_confirm()
+        new_moves.action_assign()
+        self.assertEqual(self.move1.state, 'assigned')
+        self.assertEqual(sum([quant.qty for quant in self.move1.reserved_quant_ids]), 10)
+        self.assertEqual(self.move2.state, 'confirmed')
+        self.assertFalse(self.move2.reserved_quant_ids)
+        self.assertEqual(self.move3.state, 'assigned')
+        self.assertEqual(sum([quant.qty for quant in self.move3.reserved_quant_ids]), 15)
+        for new_move in new_moves:
+            self.assertEqual(new_move.state, 'assigned')
+            self.assertEqual(sum([quant.qty for quant in new_move.reserved_quant_ids]), new_move.product_uom_qty)
@@ -17,9 +17,15 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+
 from openerp import fields, models, api, _
 from openerp.tools.sql import drop_view_if_exists
 
+_logger = logging.getLogger(__name__)
+
+INVENTORY_LINES_BATCH_SIZE = 5000
+
 
 class StockInventorySpecific(models.Model):
     _inherit = 'stock.inventory'
@@ -84,6 +90,94 @@ class StockInventorySpecific(models.Model):
             vals = super(StockInventorySpecific, self)._get_inventory_lines(inventory)
         return vals
 
+    @api.multi
+    def prepare_inventory(self):
+        for inventory in self:
+            if inventory.filter == 'inventory_specific' and not inventory.line_ids:
+                inventory.stream_inventory_lines()
+        return super(StockInventorySpecific, self).prepare_inventory()
+
+    @api.multi
+    def stream_inventory_lines(self, batch_size=INVENTORY_LINES_BATCH_SIZE):
+        """Creates the lines of this 'inventory_specific' inventory without loading them all in memory.
+
+        The quants are grouped in a server-side cursor, which is fetched by batches of batch_size rows. Each batch is
+        inserted with a single multi-row INSERT.
+        :return: the number of created lines
+        """
+        self.ensure_one()
+        domain = """sl.parent_left >= root.parent_left AND sl.parent_left < root.parent_right AND sl.active"""
+        args = (self.location_id.id,)
+        if self.partner_id:
+            domain += ' AND sq.owner_id = %s'
+            args += (self.partner_id.id,)
+        if self.lot_id:
+            domain += ' AND sq.lot_id = %s'
+            args += (self.lot_id.id,)
+        if self.specify_product_ids:
+            domain += ' AND sq.product_id IN %s'
+            args += (tuple(self.specify_product_ids.ids),)
+        if self.package_id:
+            domain += ' AND sq.package_id = %s'
+            args += (self.package_id.id,)
+        self.env.cr.execute("""DECLARE stock_specific_inventory_lines NO SCROLL CURSOR FOR
+SELECT
+    sq.product_id,
+    sum(sq.qty) AS product_qty,
+    sq.location_id,
+    sq.lot_id,
+    sq.package_id,
+    sq.owner_id
+FROM stock_quant sq
+    INNER JOIN stock_location sl ON sl.id = sq.location_id
+    INNER JOIN stock_location root ON root.id = %s
+WHERE """ + domain + """
+GROUP BY sq.product_id, sq.location_id, sq.lot_id, sq.package_id, sq.owner_id""", args)
+        now = fields.Datetime.now()
+        nb_lines = 0
+        while True:
+            self.env.cr.execute("""FETCH %s FROM stock_specific_inventory_lines""", (batch_size,))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            values = ", ".join([self.env.cr.mogrify("(%s, %s :: NUMERIC, %s, %s :: INTEGER, %s :: INTEGER, "
+                                                    "%s :: INTEGER)", row) for row in rows])
+            self.env.cr.execute("""INSERT INTO stock_inventory_line (create_uid, create_date, write_uid, write_date,
+                                 inventory_id, company_id, product_id, product_uom_id, product_qty,
+                                 theoretical_qty, location_id, prod_lot_id, package_id, partner_id,
+                                 product_name, product_code, location_name, prodlot_name)
+    SELECT
+        %%(uid)s,
+        %%(now)s,
+        %%(uid)s,
+        %%(now)s,
+        %%(inventory_id)s,
+        %%(company_id)s,
+        v.product_id,
+        pt.uom_id,
+        v.product_qty,
+        v.product_qty,
+        v.location_id,
+        v.lot_id,
+        v.package_id,
+        v.owner_id,
+        pt.name,
+        pp.default_code,
+        sl.complete_name,
+        spl.name
+    FROM (VALUES %s) v (product_id, product_qty, location_id, lot_id, package_id, owner_id)
+        INNER JOIN product_product pp ON pp.id = v.product_id
+        INNER JOIN product_template pt ON pt.id = pp.product_tmpl_id
+        INNER JOIN stock_location sl ON sl.id = v.location_id
+        LEFT JOIN stock_production_lot spl ON spl.id = v.lot_id""" % values,
+                                {'uid': self.env.uid, 'now': now, 'inventory_id': self.id,
+                                 'company_id': self.company_id.id})
+            nb_lines += len(rows)
+            _logger.info(u"Inventory %s: %s lines created", self.name, nb_lines)
+        self.env.cr.execute("""CLOSE stock_specific_inventory_lines""")
+        self.invalidate_cache(['line_ids'], [self.id])
+        return nb_lines
+
 
 class StockSpecificProductInventory(models.Model):
     _name = 'stock.specific.product.inventory'
@@ -72,4 +72,37 @@ class TestInventorySpecific(common.TransactionCase):
         self.assertTrue(inventory.line_ids)
         self.assertTrue(len(inventory.line_ids)==1)
         self.assertEqual(inventory.line_ids[0].product_id.name,'Test Product 1')
-        
\ No newline at end of file
+        
+    def test_streamed_inventory_lines(self):
+        company = self.browse_ref('base.main_company')
+        location = self.browse_ref('stock.stock_location_stock')
+        shelf = self.browse_ref('stock.stock_location_components')
+        product_1 = self.browse_ref('stock_specific_inventory.inv_product_test_product_1')
+        product_2 = self.browse_ref('stock_specific_inventory.inv_product_test_product_2')
+        for product, quant_location, qty in [(product_1, location, 10), (product_1, location, 5),
+                                             (product_1, shelf, 3), (product_2, shelf, 7)]:
+            self.env['stock.quant'].create({
+                'product_id': product.id,
+                'location_id': quant_location.id,
+                'qty': qty,
+            })
+
+        inventory = self.env['stock.inventory'].create({
+            'specify_product_ids': [(6, 0, [product_1.id, product_2.id])],
+            'location_id': location.id,
+            'filter': 'inventory_specific',
+            'company_id': company.id,
+            'name': 'inventaire_stream',
+        })
+        expected = sorted([(vals['product_id'], vals['location_id'], vals['product_qty'], vals['product_uom_id'])
+                           for vals in self.env['stock.inventory']._get_inventory_lines(inventory)])
+        self.assertEqual(len(expected), 3)
+
+        # Batches of one line, to go through several fetches of the cursor
+        self.assertEqual(inventory.stream_inventory_lines(batch_size=1), 3)
+        self.assertEqual(sorted([(line.product_id.id, line.location_id.id, line.product_qty, line.product_uom_id.id)
+                                 for line in inventory.line_ids]), expected)
+        for line in inventory.line_ids:
+            self.assertEqual(line.theoretical_qty, line.product_qty)
+            self.assertEqual(line.company_id, company)
+            self.assertEqual(line.product_code, line.product_id.default_code)